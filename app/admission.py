@@ -0,0 +1,121 @@
+import math
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Tuple, Iterable
+
+
+class Overloaded(Exception):
+    """Action is saturated, client should retry after retry_after seconds"""
+
+    def __init__(self, action: str, retry_after: int):
+        super().__init__(f'Too many "{action}" requests, retry after {retry_after} sec')
+        self.action = action
+        self.retry_after = retry_after
+
+
+class ActionGate:
+    """Concurrency limit of single action with bounded waiting queue"""
+
+    def __init__(self, concurrency: int, queue_size: int):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.duration_avg = None
+
+    def retry_after(self, default: float) -> int:
+        """Estimated time until queued requests are done"""
+        duration = self.duration_avg or default
+        return max(1, math.ceil(duration * (self.waiting + 1) / self.concurrency))
+
+    def to_json(self) -> dict:
+        return {
+            'concurrency': self.concurrency,
+            'queue_size': self.queue_size,
+            'running': self.running,
+            'waiting': self.waiting,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'duration_avg': self.duration_avg
+        }
+
+
+class AdmissionControl:
+    """Admits POST / actions under per-action concurrency limits
+
+    Action runs at once if it has free slot, else waits in queue of queue_size,
+    if queue is full or wait takes longer than queue_timeout request is rejected
+    with Overloaded (HTTP 429), so burst of expensive calls is shed fast instead of
+    piling up on agent cloud. Actions without own limits share default gate,
+    exempt actions (cheap reads) are never limited. Gates live in uvicorn event loop
+    of every worker, so limits apply per worker process.
+    """
+
+    DEFAULT_GATE = 'default'
+
+    def __init__(
+            self, limits: Dict[str, Tuple[int, int]] = None, concurrency: int = 10, queue_size: int = 20,
+            queue_timeout: float = 0.5, exempt: Iterable[str] = None
+    ):
+        """
+        :param limits: action -> (concurrency, queue size)
+        :param concurrency: concurrency of default gate
+        :param queue_size: queue size of default gate
+        :param queue_timeout: max wait in queue, seconds
+        :param exempt: actions out of admission control
+        """
+        self.__limits = dict(limits or {})
+        self.__default = (concurrency, queue_size)
+        self.__queue_timeout = queue_timeout
+        self.__exempt = set(exempt or [])
+        self.__gates: Dict[str, ActionGate] = {}
+
+    @asynccontextmanager
+    async def admit(self, action: str):
+        """
+        :raises Overloaded: if action is saturated
+        """
+        if action in self.__exempt:
+            yield
+            return
+        gate = self.__gate(action)
+        if gate.running >= gate.concurrency and gate.waiting >= gate.queue_size:
+            gate.rejected += 1
+            raise Overloaded(action, gate.retry_after(self.__queue_timeout))
+        gate.waiting += 1
+        try:
+            await asyncio.wait_for(gate.semaphore.acquire(), timeout=self.__queue_timeout)
+        except asyncio.TimeoutError:
+            gate.rejected += 1
+            raise Overloaded(action, gate.retry_after(self.__queue_timeout))
+        finally:
+            gate.waiting -= 1
+        gate.running += 1
+        gate.admitted += 1
+        stamp = time.monotonic()
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - stamp
+            if gate.duration_avg is None:
+                gate.duration_avg = duration
+            else:
+                gate.duration_avg = 0.8 * gate.duration_avg + 0.2 * duration
+            gate.running -= 1
+            gate.semaphore.release()
+
+    def stats(self) -> dict:
+        return {action: gate.to_json() for action, gate in self.__gates.items()}
+
+    def __gate(self, action: str) -> ActionGate:
+        name = action if action in self.__limits else self.DEFAULT_GATE
+        gate = self.__gates.get(name)
+        if gate is None:
+            concurrency, queue_size = self.__limits.get(name, self.__default)
+            gate = ActionGate(concurrency, queue_size)
+            self.__gates[name] = gate
+        return gate
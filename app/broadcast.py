@@ -0,0 +1,196 @@
+import asyncio
+import logging
+from typing import Optional, Callable, Awaitable, List, Tuple, Iterable
+
+import sirius_sdk
+
+from bus import EventsBus, parse_seq
+
+
+class EventsClient:
+    """WebSocket client attached to EventsHub"""
+
+    def __init__(self, topics: Optional[Iterable[str]] = None, queue_size: int = 100):
+        self.topics = set(topics) if topics else None
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.kicked = False
+        # seq of last delivered frame, frames arriving during replay are held in backlog
+        self.last_seq = (0, 0)
+        self.backlog = None
+
+    def accepts(self, topic: str) -> bool:
+        return self.topics is None or topic in self.topics
+
+
+class EventsHub:
+    """Process-wide fan-out of agent events to WebSocket clients
+
+    Hub holds single sirius_sdk.subscribe() listener while at least one client is attached,
+    decodes every event once to list of (topic, payload) frames and broadcasts them
+    through bounded per-client queues: frames for slow client are dropped and client
+    that dropped too many frames in a row is disconnected, so others are not stalled.
+
+    If bus is set, hub listens frames from bus instead of agent: single producer
+    process decodes events and publishes them for all workers (see produce()),
+    frames get sequence numbers and reconnected client may resume from last seen one.
+    """
+
+    def __init__(
+            self, decoder: Callable[[sirius_sdk.messaging.Message], Awaitable[List[Tuple[str, dict]]]],
+            queue_size: int = 100, max_dropped: int = 100, bus: Optional[EventsBus] = None
+    ):
+        """
+        :param decoder: coroutine function that turns event to list of (topic, payload)
+        :param queue_size: max frames queued for client
+        :param max_dropped: client is disconnected after dropping so many frames in a row
+        :param bus: cross-worker events bus
+        """
+        self.__decoder = decoder
+        self.__bus = bus
+        self.__queue_size = queue_size
+        self.__max_dropped = max_dropped
+        self.__clients = set()
+        self.__task = None
+        self.__loop = None
+
+    @property
+    def clients(self) -> int:
+        return len(self.__clients)
+
+    def attach(self, topics: Optional[Iterable[str]] = None, since: Optional[str] = None) -> EventsClient:
+        """Attach client, call resume() next if since is set"""
+        client = EventsClient(topics, self.__queue_size)
+        if since and self.__bus is not None:
+            client.backlog = []
+        self.__clients.add(client)
+        self.__loop = asyncio.get_event_loop()
+        if self.__task is None or self.__task.done():
+            self.__task = asyncio.ensure_future(self.__run())
+        return client
+
+    def detach(self, client: EventsClient):
+        self.__clients.discard(client)
+        self.__stop_if_idle()
+
+    async def resume(self, client: EventsClient, since: str):
+        """Replay frames published after since, then switch client to live frames"""
+        if client.backlog is None:
+            return
+        try:
+            complete, frames = await self.__bus.replay(since)
+            if not complete:
+                self.__deliver(client, {'topic': 'events.lost', 'payload': {'since': since}})
+            for seq, topic, payload in frames:
+                self.__deliver(client, {'topic': topic, 'payload': payload, 'seq': seq})
+        finally:
+            backlog, client.backlog = client.backlog, None
+            for frame in backlog:
+                self.__deliver(client, frame)
+
+    def publish(self, topic: str, payload: dict, seq: Optional[str] = None):
+        frame = {'topic': topic, 'payload': payload}
+        if seq:
+            frame['seq'] = seq
+        for client in list(self.__clients):
+            if client.backlog is not None:
+                client.backlog.append(frame)
+            else:
+                self.__deliver(client, frame)
+
+    def publish_threadsafe(self, topic: str, payload: dict):
+        """publish() from other thread, foreground for example"""
+        if self.__loop is not None:
+            self.__loop.call_soon_threadsafe(self.publish, topic, payload)
+
+    def spawn_sender(self, client: EventsClient, websocket) -> asyncio.Task:
+        """Run serve() in background task, its failure is logged instead of being lost"""
+        task = asyncio.ensure_future(self.serve(client, websocket))
+        task.add_done_callback(log_sender_error)
+        return task
+
+    async def serve(self, client: EventsClient, websocket):
+        """Deliver client frames to websocket until client is detached or kicked"""
+        while True:
+            frame = await client.queue.get()
+            if frame is None:
+                break
+            await websocket.send_json(frame)
+        if client.kicked:
+            await websocket.close(code=1013)
+
+    def __deliver(self, client: EventsClient, frame: dict):
+        if client.kicked or not client.accepts(frame['topic']):
+            return
+        seq = parse_seq(frame.get('seq'))
+        if frame.get('seq'):
+            if seq <= client.last_seq:
+                # already delivered with replay
+                return
+            client.last_seq = seq
+        try:
+            client.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            client.dropped += 1
+            if client.dropped >= self.__max_dropped:
+                logging.warning(f'WS client dropped {client.dropped} frames, disconnect it')
+                self.__kick(client)
+        else:
+            client.dropped = 0
+
+    def __kick(self, client: EventsClient):
+        client.kicked = True
+        self.__clients.discard(client)
+        # free slot for stop-marker
+        while not client.queue.empty():
+            client.queue.get_nowait()
+        client.queue.put_nowait(None)
+        self.__stop_if_idle()
+
+    def __stop_if_idle(self):
+        if not self.__clients and self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+
+    async def produce(self, bus: Optional[EventsBus] = None):
+        """Decode agent events and publish frames to bus, run it in single process
+
+        :param bus: bus bound to current event loop, hub bus by default
+        """
+        bus = bus or self.__bus
+        listener = await sirius_sdk.subscribe()
+        async for event in listener:
+            try:
+                frames = await self.__decoder(event)
+            except Exception:
+                logging.exception('Error while decoding event')
+                continue
+            for topic, payload in frames:
+                await bus.publish(topic, payload)
+
+    async def __run(self):
+        while True:
+            try:
+                if self.__bus is not None:
+                    async for seq, topic, payload in self.__bus.listen():
+                        self.publish(topic, payload, seq)
+                    continue
+                listener = await sirius_sdk.subscribe()
+                async for event in listener:
+                    try:
+                        frames = await self.__decoder(event)
+                    except Exception:
+                        logging.exception('Error while decoding event')
+                        continue
+                    for topic, payload in frames:
+                        self.publish(topic, payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception('Events hub listener error, re-subscribe')
+            await asyncio.sleep(3)
+
+
+def log_sender_error(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logging.warning(f'WS sender error: {task.exception()!r}')
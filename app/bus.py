@@ -0,0 +1,94 @@
+import json
+import asyncio
+import logging
+from typing import Optional, List, Tuple
+
+import aioredis
+
+
+def parse_seq(seq: Optional[str]) -> Tuple[int, int]:
+    """Redis stream ID "<ms>-<n>" as comparable tuple"""
+    if not seq:
+        return 0, 0
+    if isinstance(seq, bytes):
+        seq = seq.decode()
+    ms, _, n = seq.partition('-')
+    try:
+        return int(ms), int(n or 0)
+    except ValueError:
+        return 0, 0
+
+
+class EventsBus:
+    """Cross-worker events bus over Redis stream
+
+    Every published frame gets stream ID as sequence number, stream is trimmed
+    to replay_size frames so reconnecting browser can resume where it left off.
+    Redis connections are bound to event loop: create bus instance per loop.
+    """
+
+    def __init__(self, address: str, stream: str, replay_size: int = 1000):
+        if '://' not in address:
+            address = 'redis://' + address
+        self.__address = address
+        self.__stream = stream
+        self.__replay_size = replay_size
+        self.__redis = None
+
+    async def connect(self) -> aioredis.Redis:
+        if self.__redis is None or self.__redis.closed:
+            self.__redis = await aioredis.create_redis_pool(self.__address, encoding='utf-8')
+        return self.__redis
+
+    async def close(self):
+        if self.__redis is not None:
+            self.__redis.close()
+            await self.__redis.wait_closed()
+            self.__redis = None
+
+    async def publish(self, topic: str, payload: dict) -> str:
+        redis = await self.connect()
+        seq = await redis.xadd(
+            self.__stream, {'topic': topic, 'payload': json.dumps(payload)},
+            max_len=self.__replay_size, exact_len=False
+        )
+        return seq
+
+    async def replay(self, since: str) -> (bool, List[Tuple[str, str, dict]]):
+        """Frames published after since
+
+        :return: complete flag (False if some frames after since were trimmed), frames (seq, topic, payload)
+        """
+        redis = await self.connect()
+        messages = await redis.xrange(self.__stream, start=since, count=self.__replay_size)
+        frames = [self.__decode(seq, fields) for seq, fields in messages if seq != since]
+        complete = True
+        if not messages or messages[0][0] != since:
+            # since is not in buffer anymore, check nothing was trimmed
+            oldest = await redis.xrange(self.__stream, count=1)
+            if oldest and parse_seq(oldest[0][0]) > parse_seq(since):
+                complete = False
+        return complete, frames
+
+    async def listen(self, since: str = '$'):
+        """Async iterator of frames (seq, topic, payload) published after since"""
+        latest = since
+        while True:
+            redis = await self.connect()
+            if latest == '$':
+                # pin position, otherwise frames published between reads are lost
+                last = await redis.xrevrange(self.__stream, count=1)
+                latest = last[0][0] if last else '0-0'
+            try:
+                messages = await redis.xread([self.__stream], timeout=1000, latest_ids=[latest])
+            except (ConnectionError, aioredis.RedisError):
+                logging.exception('Events bus read error')
+                await asyncio.sleep(1)
+                continue
+            for _, seq, fields in messages:
+                latest = seq
+                yield self.__decode(seq, fields)
+
+    @staticmethod
+    def __decode(seq: str, fields: dict) -> (str, str, dict):
+        return seq, fields.get('topic'), json.loads(fields.get('payload', 'null'))
@@ -0,0 +1,2 @@
+# app modules import each other by bare names (import settings, from operations import *),
+# pytest puts directory of this file to sys.path so tests import them the same way
@@ -0,0 +1,68 @@
+"""Standalone foreground consumer
+
+Protocol handling may be scaled apart from HTTP: run consumers as N processes
+or replicas and start web app with --foreground=off. Work is partitioned by pairwise:
+every partition handles events of its pairwise only, so per-thread order is kept,
+replicas of the same partition share consumer group. Event is claimed in Redis
+before it is processed, so delivery is at-most-once: event of replica that
+crashed after claim is not processed by others.
+
+    python consumer.py --partitions 4               # 4 local processes, one per partition
+    python consumer.py --partitions 4 --partition 2  # single partition, for replicas
+"""
+import os
+import asyncio
+import logging
+import argparse
+import multiprocessing
+from time import sleep
+
+import settings
+from bus import EventsBus
+from partitions import PartitionFilter
+from operations import foreground
+from machine_readable_govs.utils import role_cache
+
+
+def run_partition(partitions: int, partition: int):
+    logging.warning(f'Run consumer for partition {partition + 1} of {partitions}')
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    if settings.REDIS:
+        # cabinet is served by web app, roles changes go through events bus
+        bus = EventsBus(settings.REDIS[0], stream=settings.EVENTS_STREAM, replay_size=settings.EVENTS_REPLAY_SIZE)
+        role_cache.on_change(lambda change: bus.publish('roles.changed', change))
+    accept = PartitionFilter(
+        partitions, partition,
+        redis_address=settings.REDIS[0] if settings.REDIS else None,
+        prefix=settings.REDIS_KEYS_PREFIX,
+        ttl=settings.CONSUMER_DEDUP_TTL
+    )
+    while True:
+        try:
+            loop.run_until_complete(
+                foreground(group_id=f'IPG_DEMO_FOREGROUND:{partitions}:{partition}', accept=accept)
+            )
+        except Exception as e:
+            logging.exception('Exception')
+        logging.warning('Sleep before re-run loop')
+        sleep(3)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--partitions', type=int, default=int(os.getenv('CONSUMER_PARTITIONS', 1)))
+    parser.add_argument('--partition', type=int, default=os.getenv('CONSUMER_PARTITION', None))
+    args = parser.parse_args()
+    if args.partition is not None:
+        if not 0 <= int(args.partition) < args.partitions:
+            raise RuntimeError(f'Partition must be in range 0..{args.partitions - 1}')
+        run_partition(args.partitions, int(args.partition))
+    else:
+        processes = []
+        for i in range(args.partitions):
+            process = multiprocessing.Process(target=run_partition, args=(args.partitions, i), daemon=True)
+            process.start()
+            processes.append(process)
+        for process in processes:
+            process.join()
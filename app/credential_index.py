@@ -0,0 +1,121 @@
+import logging
+import threading
+from typing import List, Optional, Callable, Awaitable
+
+import sirius_sdk
+
+
+def get_issuer_did(cred_def_id: str) -> str:
+    """Cred-Def ID is "<issuer DID>:3:CL:<schema seq_no>:<tag>" """
+    return cred_def_id.split(':')[0]
+
+
+class CredentialIndex:
+    """In-memory index of my AnonCreds credentials by schema ID, cred-def ID and issuer DID
+
+    Index is built from wallet once, then kept in sync by register_cred.
+    Found credentials are trusted, misses must be checked with wallet search
+    cause credentials may be stored by another process.
+    """
+
+    KEYS = ['schema_id', 'cred_def_id', 'issuer_did']
+
+    def __init__(self, loader: Callable[[], Awaitable[List[dict]]] = None):
+        """
+        :param loader: coroutine function that returns all wallet credentials
+        """
+        self.__loader = loader or (lambda: sirius_sdk.AnonCreds.prover_get_credentials(filters={}))
+        # index is shared by uvicorn loop and foreground thread
+        self.__lock = threading.Lock()
+        self.__loaded = False
+        self.__credentials = {}
+        self.__indexes = {key: {} for key in self.KEYS}
+        self.hits = 0
+        self.misses = 0
+
+    async def load(self, force: bool = False):
+        if self.__loaded and not force:
+            return
+        credentials = await self.__loader()
+        with self.__lock:
+            self.__clear()
+            for cred in credentials or []:
+                self.__add(cred['referent'], cred.get('schema_id'), cred.get('cred_def_id'))
+            self.__loaded = True
+        logging.info(f'Credential index is loaded: {len(self.__credentials)} credentials')
+
+    def add(self, cred_id: str, schema_id: Optional[str], cred_def_id: Optional[str]):
+        with self.__lock:
+            self.__add(cred_id, schema_id, cred_def_id)
+
+    def remove(self, cred_id: str):
+        with self.__lock:
+            self.__remove(cred_id)
+
+    def clear(self):
+        with self.__lock:
+            self.__clear()
+            self.__loaded = False
+
+    async def credentials(self, **keys) -> List[str]:
+        """IDs of credentials matched all of schema_id, cred_def_id, issuer_did"""
+        await self.load()
+        with self.__lock:
+            ids = None
+            for key, value in keys.items():
+                if key not in self.KEYS:
+                    raise RuntimeError(f'Unexpected search key: {key}')
+                matched = self.__indexes[key].get(value, set())
+                ids = set(matched) if ids is None else ids & matched
+            if ids is None:
+                ids = set(self.__credentials.keys())
+            if ids:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return list(ids)
+
+    async def count(self, **keys) -> int:
+        return len(await self.credentials(**keys))
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                'credentials': len(self.__credentials),
+                'schemas': {id_: len(ids) for id_, ids in self.__indexes['schema_id'].items()},
+                'cred_defs': {id_: len(ids) for id_, ids in self.__indexes['cred_def_id'].items()},
+                'issuers': {did: len(ids) for did, ids in self.__indexes['issuer_did'].items()},
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    def __add(self, cred_id: str, schema_id: Optional[str], cred_def_id: Optional[str]):
+        self.__remove(cred_id)
+        values = {
+            'schema_id': schema_id,
+            'cred_def_id': cred_def_id,
+            'issuer_did': get_issuer_did(cred_def_id) if cred_def_id else None
+        }
+        self.__credentials[cred_id] = values
+        for key, value in values.items():
+            if value:
+                self.__indexes[key].setdefault(value, set()).add(cred_id)
+
+    def __remove(self, cred_id: str):
+        values = self.__credentials.pop(cred_id, None)
+        if values is None:
+            return
+        for key, value in values.items():
+            ids = self.__indexes[key].get(value)
+            if ids is not None:
+                ids.discard(cred_id)
+                if not ids:
+                    del self.__indexes[key][value]
+
+    def __clear(self):
+        self.__credentials.clear()
+        for index in self.__indexes.values():
+            index.clear()
+
+
+credential_index = CredentialIndex()
@@ -0,0 +1,161 @@
+import time
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional
+
+import aioredis
+
+
+class DedupStore(ABC):
+    """Bounded store of processed message IDs (with optional value, graph hash for example)"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @abstractmethod
+    async def seen(self, key: str) -> bool:
+        """Mark key as seen, return True if it was seen before"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set(self, key: str, value: str):
+        raise NotImplementedError
+
+    async def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def _count(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+
+class MemoryDedupStore(DedupStore):
+    """In-process store, keys expire after ttl, least recently used are evicted above max_size"""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 3600):
+        super().__init__()
+        self.__max_size = max_size
+        self.__ttl = ttl
+        self.__items = OrderedDict()
+        self.__lock = threading.Lock()
+
+    async def seen(self, key: str) -> bool:
+        with self.__lock:
+            hit = self.__lookup(key) is not None
+            if not hit:
+                self.__put(key, '')
+        self._count(hit)
+        return hit
+
+    async def get(self, key: str) -> Optional[str]:
+        with self.__lock:
+            value = self.__lookup(key)
+        self._count(value is not None)
+        return value
+
+    async def set(self, key: str, value: str):
+        with self.__lock:
+            self.__put(key, value)
+
+    def __lookup(self, key: str) -> Optional[str]:
+        item = self.__items.get(key)
+        if item is None:
+            return None
+        stamp, value = item
+        if time.monotonic() - stamp > self.__ttl:
+            del self.__items[key]
+            self.evictions += 1
+            return None
+        self.__items.move_to_end(key)
+        return value
+
+    def __put(self, key: str, value: str):
+        self.__items[key] = (time.monotonic(), value)
+        self.__items.move_to_end(key)
+        while len(self.__items) > self.__max_size:
+            self.__items.popitem(last=False)
+            self.evictions += 1
+
+
+class RedisDedupStore(DedupStore):
+    """Store shared by workers and consumers, survives restarts, keys expire after ttl
+
+    Redis expires and evicts keys itself and doesn't count them per key prefix, so
+    evictions are expired and evicted keys of the whole Redis server (INFO stats)
+    """
+
+    def __init__(self, address: str, prefix: str, ttl: int = 3600):
+        super().__init__()
+        if '://' not in address:
+            address = 'redis://' + address
+        self.__address = address
+        self.__prefix = prefix
+        self.__ttl = ttl
+        # Redis connections are bound to event loop
+        self.__pools = {}
+
+    async def seen(self, key: str) -> bool:
+        redis = await self.__redis()
+        added = await redis.set(self.__key(key), '', expire=self.__ttl, exist=aioredis.Redis.SET_IF_NOT_EXIST)
+        hit = not added
+        self._count(hit)
+        return hit
+
+    async def get(self, key: str) -> Optional[str]:
+        redis = await self.__redis()
+        value = await redis.get(self.__key(key), encoding='utf-8')
+        self._count(value is not None)
+        return value
+
+    async def set(self, key: str, value: str):
+        redis = await self.__redis()
+        await redis.set(self.__key(key), value, expire=self.__ttl)
+
+    async def stats(self) -> dict:
+        redis = await self.__redis()
+        info = (await redis.info('stats')).get('stats', {})
+        expired, evicted = int(info.get('expired_keys', 0)), int(info.get('evicted_keys', 0))
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': expired + evicted,
+            'expired_keys': expired,
+            'evicted_keys': evicted,
+            'evictions_scope': 'server'
+        }
+
+    def __key(self, key: str) -> str:
+        return f'{self.__prefix}:{key}'
+
+    async def __redis(self) -> aioredis.Redis:
+        loop = asyncio.get_event_loop()
+        pool = self.__pools.get(id(loop))
+        if pool is None or pool.closed:
+            pool = await aioredis.create_redis_pool(self.__address)
+            self.__pools[id(loop)] = pool
+        return pool
+
+
+def build_dedup_store(name: str, shared: bool = False) -> DedupStore:
+    """Store configured by settings.DEDUP_BACKEND: memory or redis
+
+    :param shared: store is written and read by different processes, Redis is used regardless of backend
+    """
+    # settings require agent environment, store classes don't
+    import settings
+    if (shared or settings.DEDUP_BACKEND == 'redis') and settings.REDIS:
+        return RedisDedupStore(
+            settings.REDIS[0], prefix=f'{settings.REDIS_KEYS_PREFIX}:dedup:{name}', ttl=settings.DEDUP_TTL
+        )
+    else:
+        return MemoryDedupStore(max_size=settings.DEDUP_MAX_SIZE, ttl=settings.DEDUP_TTL)
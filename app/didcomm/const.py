@@ -1,5 +1,9 @@
 MSG_TYP_GOSSYP = 'https://didcomm.org/gossyp/1.0/message'
+MSG_TYP_GOSSYP_DIGEST = 'https://didcomm.org/gossyp/1.0/digest'
+MSG_TYP_GOSSYP_PULL = 'https://didcomm.org/gossyp/1.0/pull'
 MSG_TYP_TRACE_REQ = 'https://didcomm.org/trace/1.0/request'
 MSG_TYP_TRACE_RESP = 'https://didcomm.org/trace/1.0/response'
 MSG_TYP_MRG_REQUEST = 'https://didcomm.org/mrg/1.0/request'
 MSG_TYP_MRG_RESP = 'https://didcomm.org/mrg/1.0/response'
+MSG_TYP_MRG_DOC_REQUEST = 'https://didcomm.org/mrg/1.0/doc-request'
+MSG_TYP_MRG_DOC_RESP = 'https://didcomm.org/mrg/1.0/doc-response'
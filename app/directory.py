@@ -0,0 +1,180 @@
+import time
+import asyncio
+import threading
+from typing import Optional, List, Callable, Awaitable
+
+import sirius_sdk
+
+
+class Directory:
+    """In-memory directory of my identities and pairwise records
+
+    Directory is loaded from wallet, then kept in sync by register_connection,
+    create_identity and reset and answers lookups by DIDs and verkeys in O(1).
+    Records changed by another process can't reach it, so directory is reloaded
+    when older than load_ttl seconds. Misses fall back to wallet, negative answers
+    are cached for ttl seconds.
+    """
+
+    CONNECTION_KEYS = ['their_did', 'my_did', 'their_verkey', 'my_verkey']
+    IDENTITY_KEYS = ['did', 'verkey']
+
+    def __init__(
+            self,
+            identities: Callable[..., Awaitable[list]],
+            connections: Callable[..., Awaitable[List[sirius_sdk.Pairwise]]],
+            pairwise: Callable[[str], Awaitable[Optional[sirius_sdk.Pairwise]]],
+            ttl: float = 60,
+            load_ttl: Optional[float] = 300
+    ):
+        """
+        :param identities: wallet search of identity records by tags
+        :param connections: wallet search of connections by tags
+        :param pairwise: load pairwise for their DID
+        :param ttl: how long miss is trusted, seconds
+        :param load_ttl: max age of loaded directory, seconds, None - never reload
+        """
+        self.__load_identities = identities
+        self.__load_connections = connections
+        self.__load_pairwise = pairwise
+        self.__ttl = ttl
+        self.__load_ttl = load_ttl
+        # directory is shared by uvicorn loop and foreground thread
+        self.__lock = threading.RLock()
+        self.__loaded = None
+        self.__connections = {}
+        self.__identities = {}
+        self.__indexes = {key: {} for key in self.CONNECTION_KEYS + self.IDENTITY_KEYS}
+        self.__misses = {}
+
+    async def load(self, force: bool = False):
+        loaded = self.__loaded
+        if loaded is not None and not force:
+            if self.__load_ttl is None or time.monotonic() - loaded < self.__load_ttl:
+                return
+        stamp = time.monotonic()
+        identities, connections = await asyncio.gather(self.__load_identities(), self.__load_connections())
+        with self.__lock:
+            self.__clear()
+            for item in identities:
+                self.__add_identity(item)
+            for p2p in connections:
+                self.__add_connection(p2p)
+            self.__loaded = stamp
+
+    def add_connection(self, p2p: sirius_sdk.Pairwise):
+        with self.__lock:
+            self.__add_connection(p2p)
+            self.__misses.clear()
+
+    def add_identity(self, item: dict):
+        """
+        :param item: identity wallet record with tags: did, verkey, label, inv
+        """
+        with self.__lock:
+            self.__add_identity(item)
+            self.__misses.clear()
+
+    def clear(self):
+        with self.__lock:
+            self.__clear()
+            self.__loaded = None
+
+    async def connections(self, **keys) -> List[sirius_sdk.Pairwise]:
+        """Pairwise list filtered by their_did, my_did, their_verkey, my_verkey"""
+        await self.load()
+        with self.__lock:
+            found = self.__search(self.__connections, self.CONNECTION_KEYS, keys)
+        if found is None:
+            found = await self.__on_miss(('connections', tuple(sorted(keys.items()))), self.__load_connections, keys)
+            for p2p in found:
+                self.add_connection(p2p)
+        return found
+
+    async def connection(self, **keys) -> Optional[sirius_sdk.Pairwise]:
+        found = await self.connections(**keys)
+        return found[0] if found else None
+
+    async def load_for_did(self, their_did: str) -> Optional[sirius_sdk.Pairwise]:
+        """Same as sirius_sdk.PairwiseList.load_for_did"""
+        await self.load()
+        with self.__lock:
+            found = self.__search(self.__connections, self.CONNECTION_KEYS, {'their_did': their_did})
+        if found is not None:
+            return found[-1]
+
+        async def load_pairwise():
+            p2p = await self.__load_pairwise(their_did)
+            return [p2p] if p2p else []
+
+        found = await self.__on_miss(('pairwise', their_did), load_pairwise)
+        for p2p in found:
+            self.add_connection(p2p)
+        return found[-1] if found else None
+
+    async def identities(self, **keys) -> List[dict]:
+        """Identity records filtered by did, verkey"""
+        await self.load()
+        with self.__lock:
+            found = self.__search(self.__identities, self.IDENTITY_KEYS, keys)
+        if found is None:
+            found = await self.__on_miss(('identities', tuple(sorted(keys.items()))), self.__load_identities, keys)
+            for item in found:
+                self.add_identity(item)
+        return found
+
+    async def identity(self, **keys) -> Optional[dict]:
+        found = await self.identities(**keys)
+        return found[0] if found else None
+
+    def __search(self, items: dict, allowed: list, keys: dict) -> Optional[list]:
+        """Intersect indexes for keys, None means nothing found"""
+        ids = None
+        for key, value in keys.items():
+            if key not in allowed:
+                raise RuntimeError(f'Unexpected search key: {key}')
+            matched = self.__indexes[key].get(value, {})
+            if ids is None:
+                ids = list(matched.keys())
+            else:
+                ids = [id_ for id_ in ids if id_ in matched]
+            if not ids:
+                return None
+        if ids is None:
+            ids = list(items.keys())
+        return [items[id_] for id_ in ids] or None
+
+    async def __on_miss(self, miss_key: tuple, loader, keys: dict = None) -> list:
+        with self.__lock:
+            stamp = self.__misses.get(miss_key)
+        if stamp is not None and time.monotonic() - stamp < self.__ttl:
+            return []
+        found = await loader(**keys) if keys is not None else await loader()
+        if not found:
+            with self.__lock:
+                self.__misses[miss_key] = time.monotonic()
+        return found
+
+    def __add_connection(self, p2p: sirius_sdk.Pairwise):
+        id_ = (p2p.their.did, p2p.me.did)
+        # updated record keeps its position: lookups return records in wallet order
+        self.__connections[id_] = p2p
+        for key, value in [
+            ('their_did', p2p.their.did), ('my_did', p2p.me.did),
+            ('their_verkey', p2p.their.verkey), ('my_verkey', p2p.me.verkey)
+        ]:
+            self.__indexes[key].setdefault(value, {})[id_] = True
+
+    def __add_identity(self, item: dict):
+        tags = item['tags']
+        id_ = tags['did']
+        self.__identities[id_] = item
+        for key in self.IDENTITY_KEYS:
+            self.__indexes[key].setdefault(tags.get(key), {})[id_] = True
+
+    def __clear(self):
+        self.__connections.clear()
+        self.__identities.clear()
+        for index in self.__indexes.values():
+            index.clear()
+        self.__misses.clear()
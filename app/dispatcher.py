@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import itertools
+from collections import deque
+from typing import Callable, Awaitable, Hashable, Dict, Iterable
+
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_FLOOD = 1
+
+
+class EventDispatcher:
+    """Runs every event as its own job with bounded global concurrency
+
+    Jobs are picked by priority lane (lower value first), every lane has its
+    own pending limit, so flood traffic can't lock out interactive protocols.
+    Full shed lane drops new jobs at once instead of making caller wait, so
+    flood never blocks listener that feeds other lanes.
+    Jobs with the same key (pairwise thread) run one after another in submit order.
+    """
+
+    def __init__(self, concurrency: int = 20, lane_size: int = 1000, shed: Iterable[int] = (PRIORITY_FLOOD,)):
+        """
+        :param concurrency: max jobs running at the same time
+        :param lane_size: max pending jobs per priority lane, submit() waits when lane is full
+        :param shed: lanes where submit() drops job when lane is full
+        """
+        self.__concurrency = concurrency
+        self.__lane_size = lane_size
+        self.__shed = set(shed)
+        self.__lanes: Dict[int, asyncio.Semaphore] = {}
+        # priority -> jobs dropped cause lane was full
+        self.dropped: Dict[int, int] = {}
+        self.__ready = None
+        self.__busy_keys: Dict[Hashable, deque] = {}
+        self.__counter = itertools.count()
+        self.__workers = []
+
+    @property
+    def pending(self) -> int:
+        return self.__ready.qsize() if self.__ready else 0
+
+    def start(self):
+        """Spawn workers in current event loop"""
+        self.__ready = asyncio.PriorityQueue()
+        self.__workers = [asyncio.ensure_future(self.__worker()) for _ in range(self.__concurrency)]
+
+    async def stop(self):
+        for worker in self.__workers:
+            worker.cancel()
+        await asyncio.gather(*self.__workers, return_exceptions=True)
+        self.__workers = []
+
+    async def submit(self, priority: int, key: Hashable, job: Callable[[], Awaitable]) -> bool:
+        """Schedule job, False if it was dropped cause its shed lane is full"""
+        lane = self.__lanes.get(priority)
+        if lane is None:
+            lane = asyncio.Semaphore(self.__lane_size)
+            self.__lanes[priority] = lane
+        if priority in self.__shed and lane.locked():
+            self.dropped[priority] = self.dropped.get(priority, 0) + 1
+            return False
+        await lane.acquire()
+        item = (priority, next(self.__counter), key, job)
+        if key in self.__busy_keys:
+            # keep order: job will be scheduled when previous one with same key is done
+            self.__busy_keys[key].append(item)
+        else:
+            self.__busy_keys[key] = deque()
+            self.__ready.put_nowait(item)
+        return True
+
+    async def __worker(self):
+        while True:
+            priority, _, key, job = await self.__ready.get()
+            try:
+                await job()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception('Error while processing event')
+            finally:
+                self.__lanes[priority].release()
+                waiting = self.__busy_keys.get(key)
+                if waiting:
+                    self.__ready.put_nowait(waiting.popleft())
+                else:
+                    self.__busy_keys.pop(key, None)
+
+
+def get_event_thread_key(event) -> tuple:
+    """Events of the same pairwise thread are processed in order, unthreaded events of sender too"""
+    thread = event.message.get('~thread', None) or {}
+    sender = event.pairwise.their.did if event.pairwise else event.sender_verkey
+    return sender, thread.get('thid', None)
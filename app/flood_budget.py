@@ -0,0 +1,32 @@
+import time
+from typing import Optional, TYPE_CHECKING
+
+from didcomm.const import MSG_TYP_TRACE_REQ, MSG_TYP_TRACE_RESP, MSG_TYP_MRG_REQUEST, MSG_TYP_MRG_RESP
+
+if TYPE_CHECKING:
+    from dedup import DedupStore
+
+
+def check_flood_budget(message) -> Optional[str]:
+    """Reason to drop flood request or response: "expired" or "hops", None if it is in budget
+
+    Messages of old peers carry no deadline and hops limit and are always in budget
+    """
+    if message.type not in [MSG_TYP_TRACE_REQ, MSG_TYP_TRACE_RESP, MSG_TYP_MRG_REQUEST, MSG_TYP_MRG_RESP]:
+        return None
+    deadline = message.get('deadline')
+    if deadline and time.time() > float(deadline):
+        return 'expired'
+    hops = message.get('hops')
+    if hops and len(message.get('route') or []) > int(hops):
+        return 'hops'
+    return None
+
+
+async def is_late_response(message, deadlines: 'DedupStore') -> bool:
+    """Response arrived after deadline of my request
+
+    :param deadlines: deadlines of requests fired by me, responses of old peers don't echo them
+    """
+    deadline = message.get('deadline') or await deadlines.get(message.id)
+    return bool(deadline) and time.time() > float(deadline)
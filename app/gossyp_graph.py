@@ -0,0 +1,173 @@
+import copy
+import json
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, List, Tuple
+
+
+GOSSYP_MODE_FLOOD = 'flood'
+GOSSYP_MODE_EPIDEMIC = 'epidemic'
+
+
+class GraphState:
+    """Graph of single gossyp message merged from all received deltas
+
+    Every contributor bumps own counter in version vector when it adds entries,
+    so peer may skip message that brings nothing new without looking into graph.
+    Graph hash is XOR of entry hashes: it is updated per changed entry
+    instead of serializing whole graph.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.links = {}
+        self.version = {}
+        # message fields (members, content, mode) kept for anti-entropy
+        self.message = None
+        # anti-entropy rounds left
+        self.rounds = 0
+        self.__hashes = {}
+        self.__hash = 0
+
+    @property
+    def hash(self) -> str:
+        return format(self.__hash, '064x')
+
+    def dominates(self, version: dict) -> bool:
+        """True if all contributions counted by version are merged already"""
+        return all(self.version.get(contributor, 0) >= counter for contributor, counter in version.items())
+
+    def dominated_by(self, version: dict) -> bool:
+        """True if version counts all contributions merged here"""
+        return all(version.get(contributor, 0) >= counter for contributor, counter in self.version.items())
+
+    def merge(self, nodes: list, links: list, version: dict = None) -> dict:
+        """Merge entries, node auras are united
+
+        :return: delta: added or changed nodes and links
+        """
+        delta = {'nodes': [], 'links': []}
+        for node in nodes:
+            id_ = node.get('id')
+            if not id_:
+                continue
+            merged = copy.deepcopy(self.nodes.get(id_, node))
+            auras = merged.get('auras', [])
+            for aura in node.get('auras', []):
+                if aura not in auras:
+                    auras.append(aura)
+            merged['auras'] = auras
+            if self.__put('node', id_, merged):
+                self.nodes[id_] = merged
+                delta['nodes'].append(merged)
+        for link in links:
+            id_ = link.get('id')
+            if not id_ or id_ in self.links:
+                continue
+            link = copy.deepcopy(link)
+            self.__put('link', id_, link)
+            self.links[id_] = link
+            delta['links'].append(link)
+        for contributor, counter in (version or {}).items():
+            self.version[contributor] = max(self.version.get(contributor, 0), counter)
+        return delta
+
+    def bump(self, contributor: str):
+        self.version[contributor] = self.version.get(contributor, 0) + 1
+
+    def to_graph(self) -> dict:
+        return copy.deepcopy({'nodes': list(self.nodes.values()), 'links': list(self.links.values())})
+
+    def __put(self, kind: str, id_: str, entry: dict) -> bool:
+        """Update graph hash with entry, returns False if entry is not changed"""
+        js = json.dumps(entry, sort_keys=True)
+        hashed = int(hashlib.sha256(js.encode()).hexdigest(), 16)
+        old = self.__hashes.get((kind, id_))
+        if old == hashed:
+            return False
+        if old is not None:
+            self.__hash ^= old
+        self.__hash ^= hashed
+        self.__hashes[(kind, id_)] = hashed
+        return True
+
+
+def join_deltas(*deltas: dict) -> dict:
+    """Latest entry wins if the same entry was changed by several deltas"""
+    nodes, links = OrderedDict(), OrderedDict()
+    for delta in deltas:
+        for node in delta.get('nodes', []):
+            nodes[node['id']] = node
+        for link in delta.get('links', []):
+            links[link['id']] = link
+    return {'nodes': list(nodes.values()), 'links': list(links.values())}
+
+
+def is_empty_delta(delta: dict) -> bool:
+    return not delta.get('nodes') and not delta.get('links')
+
+
+def pick_targets(peers: list, mode: str, fanout: int) -> list:
+    """Flood: every peer, epidemic: fan-out random peers"""
+    if mode == GOSSYP_MODE_EPIDEMIC and len(peers) > fanout:
+        return random.sample(peers, fanout)
+    return peers
+
+
+class GraphStore:
+    """Graph states by gossyp message ID, least recently used are evicted above size"""
+
+    def __init__(self, size: int = 1000):
+        self.__size = size
+        self.__states = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def find(self, msg_id: str) -> Optional[GraphState]:
+        with self.__lock:
+            return self.__states.get(msg_id)
+
+    def items(self) -> List[Tuple[str, GraphState]]:
+        with self.__lock:
+            return list(self.__states.items())
+
+    def get(self, msg_id: str) -> GraphState:
+        with self.__lock:
+            state = self.__states.get(msg_id)
+            if state is None:
+                state = GraphState()
+                self.__states[msg_id] = state
+                while len(self.__states) > self.__size:
+                    self.__states.popitem(last=False)
+            else:
+                self.__states.move_to_end(msg_id)
+            return state
+
+    def take_rounds(self) -> List[Tuple[str, GraphState]]:
+        """States of epidemic messages with anti-entropy rounds left, every one spends a round"""
+        taken = []
+        for msg_id, state in self.items():
+            if state.rounds <= 0 or not state.message:
+                continue
+            state.rounds -= 1
+            taken.append((msg_id, state))
+        return taken
+
+    def reconcile(self, digest: dict) -> Tuple[List[str], List[Tuple[str, GraphState]]]:
+        """Compare digest of peer (message ID -> version) with states stored here
+
+        :return: IDs to pull: unknown messages or ones with contributions not merged here,
+                 states to push: ones with contributions peer misses
+        """
+        pull, push = [], []
+        for msg_id, version in digest.items():
+            state = self.find(msg_id)
+            if state is None or state.message is None:
+                pull.append(msg_id)
+                continue
+            if not state.dominates(version):
+                pull.append(msg_id)
+            if not state.dominated_by(version):
+                push.append((msg_id, state))
+        return pull, push
@@ -0,0 +1,267 @@
+import json
+import uuid
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Awaitable, Dict, Optional
+
+import sqlalchemy
+from databases import Database
+
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+
+metadata = sqlalchemy.MetaData()
+
+protocol_jobs = sqlalchemy.Table(
+    'protocol_jobs',
+    metadata,
+    sqlalchemy.Column('id', sqlalchemy.String(32), primary_key=True),
+    # several agents may share database
+    sqlalchemy.Column('agent', sqlalchemy.String(128), nullable=False, index=True),
+    sqlalchemy.Column('kind', sqlalchemy.String(32), nullable=False),
+    sqlalchemy.Column('payload', sqlalchemy.Text, nullable=False),
+    sqlalchemy.Column('status', sqlalchemy.String(16), nullable=False, index=True),
+    sqlalchemy.Column('attempts', sqlalchemy.Integer, nullable=False, default=0),
+    sqlalchemy.Column('max_attempts', sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column('result', sqlalchemy.Text, nullable=True),
+    sqlalchemy.Column('error', sqlalchemy.Text, nullable=True),
+    sqlalchemy.Column('run_after', sqlalchemy.DateTime, nullable=False),
+    # running job is claimed again if worker didn't finish it in time (crashed)
+    sqlalchemy.Column('locked_until', sqlalchemy.DateTime, nullable=True),
+    sqlalchemy.Column('created_at', sqlalchemy.DateTime, nullable=False),
+    sqlalchemy.Column('updated_at', sqlalchemy.DateTime, nullable=False),
+)
+
+
+class JobQueue:
+    """Durable queue of long protocol runs (credential issuance, proof verification) in Postgres
+
+    HTTP request submits job and returns its ID at once, worker claims queued jobs
+    with SELECT FOR UPDATE SKIP LOCKED, so several workers never run the same job.
+    Job failed with unexpected error is queued again with exponential backoff until
+    max_attempts, RuntimeError (wrong input, unknown P2P) fails it at once.
+    Handler calls checkpoint() before steps that must not be repeated (credential
+    offer is sent): job is never run again after it, any error fails it.
+    Job of crashed worker is claimed again when its lease expires, or failed if that
+    was its last attempt or it passed checkpoint.
+    """
+
+    def __init__(
+            self, url: str, agent: str, handlers: Dict[str, Callable[[dict, Callable[[], Awaitable]], Awaitable[dict]]],
+            max_attempts: int = 3, backoff: float = 5, lease: float = 120, concurrency: int = 5,
+            poll_interval: float = 1
+    ):
+        """
+        :param url: database URL
+        :param agent: owner of jobs, workers run jobs of own agent only
+        :param handlers: job kind -> coroutine function (payload, checkpoint) -> JSON-able result
+        :param backoff: delay before first retry, doubled on every next one, seconds
+        :param lease: max job run time before other worker may claim it, seconds
+        :param concurrency: max jobs run by worker at the same time
+        :param poll_interval: delay between polls of empty queue, seconds
+        """
+        self.__url = url
+        self.__agent = agent
+        self.__handlers = handlers
+        self.__max_attempts = max_attempts
+        self.__backoff = backoff
+        self.__lease = lease
+        self.__concurrency = concurrency
+        self.__poll_interval = poll_interval
+        self.__listeners = []
+        self.__schema_ready = False
+        self.__schema_lock = threading.Lock()
+        # connection pools are bound to event loop
+        self.__databases = {}
+
+    def on_change(self, listener: Callable[[dict], Awaitable]):
+        """
+        :param listener: coroutine function called with job status (see to_json) on every change
+        """
+        self.__listeners.append(listener)
+
+    async def submit(self, kind: str, payload: dict) -> str:
+        if kind not in self.__handlers:
+            raise RuntimeError(f'Unknown job kind: {kind}')
+        db = await self.__database()
+        now = datetime.utcnow()
+        job_id = uuid.uuid4().hex
+        await db.execute(protocol_jobs.insert().values(
+            id=job_id, agent=self.__agent, kind=kind, payload=json.dumps(payload), status=JOB_QUEUED,
+            attempts=0, max_attempts=self.__max_attempts, run_after=now, created_at=now, updated_at=now
+        ))
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        db = await self.__database()
+        row = await db.fetch_one(
+            protocol_jobs.select().where(protocol_jobs.c.id == job_id).where(protocol_jobs.c.agent == self.__agent)
+        )
+        return to_json(row) if row else None
+
+    async def stats(self) -> dict:
+        db = await self.__database()
+        rows = await db.fetch_all(
+            sqlalchemy.select([protocol_jobs.c.status, sqlalchemy.func.count()])
+            .where(protocol_jobs.c.agent == self.__agent).group_by(protocol_jobs.c.status)
+        )
+        return {row[0]: row[1] for row in rows}
+
+    async def run(self):
+        """Worker: claim and run jobs until cancelled"""
+        semaphore = asyncio.Semaphore(self.__concurrency)
+        running = set()
+        try:
+            while True:
+                await semaphore.acquire()
+                try:
+                    row = await self.__claim()
+                except Exception:
+                    # database is down: jobs in flight keep running, their leases would expire otherwise
+                    logging.exception('Error while claiming job')
+                    row = None
+                if row is None:
+                    semaphore.release()
+                    await asyncio.sleep(self.__poll_interval)
+                    continue
+                task = asyncio.ensure_future(self.__process(row))
+                running.add(task)
+                task.add_done_callback(running.discard)
+                task.add_done_callback(lambda _: semaphore.release())
+        finally:
+            for task in running:
+                task.cancel()
+
+    async def __claim(self):
+        db = await self.__database()
+        now = datetime.utcnow()
+        # worker crashed on last attempt or after checkpoint
+        await db.execute(
+            protocol_jobs.update()
+            .where(protocol_jobs.c.agent == self.__agent)
+            .where(protocol_jobs.c.status == JOB_RUNNING)
+            .where(protocol_jobs.c.locked_until < now)
+            .where(protocol_jobs.c.attempts >= protocol_jobs.c.max_attempts)
+            .values(status=JOB_FAILED, error='Lease expired, job may not run again', locked_until=None, updated_at=now)
+        )
+        return await db.fetch_one(
+            """
+            UPDATE protocol_jobs
+            SET status = :running, attempts = attempts + 1, locked_until = :locked_until, updated_at = :now
+            WHERE id = (
+                SELECT id FROM protocol_jobs
+                WHERE agent = :agent AND (
+                    (status = :queued AND run_after <= :now) OR (status = :running AND locked_until < :now AND attempts < max_attempts)
+                )
+                ORDER BY run_after
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING *
+            """,
+            values={
+                'running': JOB_RUNNING, 'queued': JOB_QUEUED, 'agent': self.__agent,
+                'now': now, 'locked_until': now + timedelta(seconds=self.__lease)
+            }
+        )
+
+    async def __process(self, row):
+        job_id, kind, attempts = row['id'], row['kind'], row['attempts']
+        await self.__notify(to_json(row))
+        values = {'locked_until': None}
+        passed = []
+
+        async def checkpoint():
+            # job with exhausted attempts is failed instead of claimed again when its lease expires
+            db_ = await self.__database()
+            await db_.execute(
+                protocol_jobs.update().where(protocol_jobs.c.id == job_id)
+                .values(attempts=row['max_attempts'], updated_at=datetime.utcnow())
+            )
+            passed.append(True)
+
+        try:
+            result = await self.__handlers[kind](json.loads(row['payload']), checkpoint)
+        except asyncio.CancelledError:
+            raise
+        except RuntimeError as e:
+            logging.warning(f'Job {job_id} ({kind}) failed: {e}')
+            values.update(status=JOB_FAILED, error=str(e))
+        except Exception as e:
+            logging.exception(f'Job {job_id} ({kind}) attempt {attempts} failed')
+            delay = None if passed else retry_delay(attempts, row['max_attempts'], self.__backoff)
+            if delay is not None:
+                values.update(status=JOB_QUEUED, error=repr(e), run_after=datetime.utcnow() + timedelta(seconds=delay))
+            else:
+                values.update(status=JOB_FAILED, error=repr(e))
+        else:
+            values.update(status=JOB_DONE, result=json.dumps(result), error=None)
+        values['updated_at'] = datetime.utcnow()
+        db = await self.__database()
+        await db.execute(protocol_jobs.update().where(protocol_jobs.c.id == job_id).values(**values))
+        job = await self.get(job_id)
+        if job:
+            await self.__notify(job)
+
+    async def __notify(self, job: dict):
+        for listener in self.__listeners:
+            try:
+                await listener(job)
+            except Exception:
+                logging.exception('Error while notify job status')
+
+    async def __database(self) -> Database:
+        loop = asyncio.get_event_loop()
+        if not self.__schema_ready:
+            await loop.run_in_executor(None, self.__create_schema)
+        state = self.__databases.get(id(loop))
+        if state is None:
+            state = (Database(self.__url), asyncio.Lock())
+            self.__databases[id(loop)] = state
+        db, lock = state
+        async with lock:
+            if not db.is_connected:
+                await db.connect()
+        return db
+
+    def __create_schema(self):
+        # alembic migrations are not set up for the app, table is created by sync engine once
+        with self.__schema_lock:
+            if self.__schema_ready:
+                return
+            engine = sqlalchemy.create_engine(self.__url)
+            try:
+                metadata.create_all(engine)
+            finally:
+                engine.dispose()
+            self.__schema_ready = True
+
+
+def retry_delay(attempts: int, max_attempts: int, backoff: float) -> Optional[float]:
+    """Delay before next attempt of failed job, None if attempts are exhausted
+
+    :param attempts: attempts made, including failed one
+    """
+    if attempts >= max_attempts:
+        return None
+    return backoff * 2 ** (attempts - 1)
+
+
+def to_json(row) -> dict:
+    return {
+        'id': row['id'],
+        'kind': row['kind'],
+        'status': row['status'],
+        'attempts': row['attempts'],
+        'max_attempts': row['max_attempts'],
+        'result': json.loads(row['result']) if row['result'] else None,
+        'error': row['error'],
+        'created_at': row['created_at'].isoformat(),
+        'updated_at': row['updated_at'].isoformat()
+    }
@@ -0,0 +1,127 @@
+import json
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Callable, Awaitable, Iterable
+
+import aiomemcached
+from sirius_sdk.agent.ledger import Schema, CredentialDefinition
+
+
+class LedgerCache:
+    """Two-tier cache of ledger objects: in-process LRU in front of memcached
+
+    Schemas and Cred-Defs are immutable once written to ledger, so entries never expire.
+    Memcached tier is shared by all workers and agent containers, its errors
+    are logged and ignored: cache falls back to the ledger.
+    """
+
+    def __init__(self, host: str, port: int, prefix: str, size: int = 1000):
+        """
+        :param prefix: memcached keys prefix, ledger name for example
+        :param size: max objects in LRU
+        """
+        self.__host = host
+        self.__port = port
+        self.__prefix = prefix
+        self.__size = size
+        self.__lru = OrderedDict()
+        self.__lock = threading.Lock()
+        # memcached connections are bound to event loop
+        self.__clients = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def schema(self, id_: str, loader: Callable[[], Awaitable[Schema]]) -> Schema:
+        """Return cached schema or load it with loader"""
+        body = await self.__get('schema', id_)
+        if body is None:
+            schema = await loader()
+            await self.__set('schema', id_, schema.serialize())
+            return schema
+        else:
+            return Schema.deserialize(body)
+
+    async def cred_def(self, id_: str, loader: Callable[[], Awaitable[CredentialDefinition]]) -> CredentialDefinition:
+        """Return cached cred-def or load it with loader"""
+        body = await self.__get('cred_def', id_)
+        if body is None:
+            cred_def = await loader()
+            await self.__set('cred_def', id_, cred_def.serialize())
+            return cred_def
+        else:
+            return CredentialDefinition.deserialize(body)
+
+    async def load_schema(self, dkms, id_: str, submitter_did: str) -> Schema:
+        return await self.schema(id_, lambda: dkms.load_schema(id_, submitter_did))
+
+    async def load_cred_def(self, dkms, id_: str, submitter_did: str) -> CredentialDefinition:
+        return await self.cred_def(id_, lambda: dkms.load_cred_def(id_, submitter_did))
+
+    async def prefetch(self, dkms, submitter_did: str, schema_ids: Iterable[str], cred_def_ids: Iterable[str]):
+        """Warm cache concurrently, objects missing in ledger are skipped"""
+        coros = [self.load_schema(dkms, id_, submitter_did) for id_ in set(schema_ids)]
+        coros.extend([self.load_cred_def(dkms, id_, submitter_did) for id_ in set(cred_def_ids)])
+        results = await asyncio.gather(*coros, return_exceptions=True)
+        failed = [res for res in results if isinstance(res, Exception)]
+        logging.info(f'Ledger cache prefetched {len(results) - len(failed)} objects, failed: {len(failed)}')
+
+    def __key(self, kind: str, id_: str) -> str:
+        # memcached keys are limited by 250 bytes without spaces
+        return f'{self.__prefix}:{kind}:' + hashlib.sha256(id_.encode()).hexdigest()
+
+    def __memcached(self) -> aiomemcached.Client:
+        loop = asyncio.get_event_loop()
+        client = self.__clients.get(id(loop))
+        if client is None:
+            client = aiomemcached.Client(host=self.__host, port=self.__port)
+            self.__clients[id(loop)] = client
+        return client
+
+    async def __get(self, kind: str, id_: str) -> Optional[dict]:
+        key = self.__key(kind, id_)
+        with self.__lock:
+            body = self.__lru.get(key)
+            if body is not None:
+                self.__lru.move_to_end(key)
+                self.hits += 1
+                return body
+        try:
+            value, _ = await self.__memcached().get(key.encode())
+        except Exception:
+            logging.exception('Memcached error')
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        body = json.loads(value.decode())
+        self.__remember(key, body)
+        self.hits += 1
+        return body
+
+    async def __set(self, kind: str, id_: str, body: dict):
+        key = self.__key(kind, id_)
+        self.__remember(key, body)
+        try:
+            await self.__memcached().set(key.encode(), json.dumps(body).encode())
+        except Exception:
+            logging.exception('Memcached error')
+
+    def __remember(self, key: str, body: dict):
+        with self.__lock:
+            self.__lru[key] = body
+            self.__lru.move_to_end(key)
+            while len(self.__lru) > self.__size:
+                self.__lru.popitem(last=False)
+
+
+def build_ledger_cache() -> LedgerCache:
+    """Cache configured by settings: memcached address, ledger name, LRU size"""
+    # settings require agent environment, cache class doesn't
+    import settings
+    return LedgerCache(
+        host=settings.MEMCACHED, port=settings.MEMCACHED_PORT,
+        prefix=f'ipg_demo:ledger:{settings.DKMS_NETWORK}', size=settings.LEDGER_CACHE_SIZE
+    )
@@ -0,0 +1,238 @@
+import sys
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional
+
+
+CONDITION_SCHEMA = 'schema'
+CONDITION_CRED_DEF = 'cred_def'
+CONDITION_ID = 'id'
+# condition that can't be checked (schema without issuer for example), never satisfied
+CONDITION_INVALID = 'invalid'
+
+OPERATORS = ['any', 'and']
+
+
+class GovernanceError(Exception):
+    """Governance framework document has invalid structure"""
+    pass
+
+
+class Condition:
+    """Leaf of permissions DAG with names resolved to ledger IDs and DIDs
+
+    Identical conditions of different permissions are the same object
+    """
+
+    def __init__(self, kind: str, schema_id: str = None, issuer_did: str = None, cred_def_id: str = None, did: str = None):
+        self.kind = kind
+        self.schema_id = schema_id
+        self.issuer_did = issuer_did
+        self.cred_def_id = cred_def_id
+        self.did = did
+        self.key = json.dumps(
+            [kind, schema_id, issuer_did, cred_def_id, did], separators=(',', ':')
+        )
+
+    @property
+    def is_credential(self) -> bool:
+        """Condition answered by wallet credentials search"""
+        return self.kind in [CONDITION_SCHEMA, CONDITION_CRED_DEF]
+
+
+class Group:
+    """Set of conditions joined by operator that grants roles"""
+
+    def __init__(self, operator: str, conditions: List[Condition], grant: List[str]):
+        self.operator = operator
+        self.conditions = conditions
+        self.grant = grant
+
+
+class CompiledFramework:
+
+    def __init__(
+            self, hash_: str, name: Optional[str], version: Optional[str], roles: List[str],
+            schemas: Dict[str, str], cred_defs: Dict[str, str], participants: Dict[str, str],
+            conditions: Dict[str, Condition], groups: List[Group], doc: dict = None
+    ):
+        """
+        :param hash_: content hash of source document
+        :param doc: source document
+        :param schemas: schema name -> schema id
+        :param cred_defs: cred-def name -> cred-def id
+        :param participants: participant name or id -> DID
+        :param conditions: unique conditions by key
+        """
+        self.hash = hash_
+        self.name = name
+        self.version = version
+        self.roles = roles
+        self.schemas = schemas
+        self.cred_defs = cred_defs
+        self.participants = participants
+        self.conditions = conditions
+        self.groups = groups
+        self.doc = doc
+
+
+def calc_doc_hash(doc: dict) -> str:
+    js = json.dumps(doc, sort_keys=True)
+    return hashlib.sha256(js.encode()).hexdigest()
+
+
+def to_did(id_: str) -> str:
+    """did:sov:XXX -> XXX"""
+    if ':' in id_:
+        id_ = id_.split(':')[-1]
+    return sys.intern(id_)
+
+
+def compile_framework(doc: dict, hash_: str = None) -> CompiledFramework:
+    """Validate machine-readable governance framework and build its compiled form
+
+    :raises GovernanceError: if document structure is invalid
+    """
+    if not isinstance(doc, dict):
+        raise GovernanceError('Document must be an object')
+    hash_ = hash_ or calc_doc_hash(doc)
+    schemas = {}
+    for item in _list_of_objects(doc, 'schemas'):
+        id_, name = item.get('id'), item.get('name')
+        if id_ and name:
+            schemas[name] = sys.intern(id_)
+    cred_defs = {}
+    for item in _list_of_objects(doc, 'cred_defs'):
+        id_, name = item.get('id'), item.get('name')
+        if id_ and name:
+            cred_defs[name] = sys.intern(id_)
+    participants = {}
+    for item in _list_of_objects(doc, 'participants'):
+        id_, name = item.get('id'), item.get('name')
+        if id_:
+            participants[id_] = to_did(id_)
+            if name:
+                participants[name] = participants[id_]
+    roles = doc.get('roles', [])
+    if not isinstance(roles, list):
+        raise GovernanceError('"roles" must be a list')
+
+    conditions = {}
+    groups = []
+    for n, perm in enumerate(_list_of_objects(doc, 'permissions')):
+        grant = perm.get('grant')
+        when = perm.get('when')
+        if not isinstance(grant, list) or not all(isinstance(role, str) for role in grant):
+            raise GovernanceError(f'permissions[{n}].grant must be a list of roles')
+        if not isinstance(when, dict):
+            raise GovernanceError(f'permissions[{n}].when must be an object')
+        for operator, items in when.items():
+            if operator not in OPERATORS:
+                raise GovernanceError(f'permissions[{n}].when: unknown operator "{operator}"')
+            if not isinstance(items, list):
+                raise GovernanceError(f'permissions[{n}].when.{operator} must be a list')
+            group_conditions = []
+            for item in items:
+                condition = _compile_condition(item, schemas, cred_defs, participants, f'permissions[{n}].when.{operator}')
+                condition = conditions.setdefault(condition.key, condition)
+                if condition not in group_conditions:
+                    group_conditions.append(condition)
+            groups.append(Group(operator, group_conditions, grant))
+
+    return CompiledFramework(
+        hash_=hash_, name=doc.get('name'), version=doc.get('version'), roles=roles,
+        schemas=schemas, cred_defs=cred_defs, participants=participants,
+        conditions=conditions, groups=groups, doc=doc
+    )
+
+
+def _list_of_objects(doc: dict, field: str) -> List[dict]:
+    value = doc.get(field, [])
+    if not isinstance(value, list) or not all(isinstance(item, dict) for item in value):
+        raise GovernanceError(f'"{field}" must be a list of objects')
+    return value
+
+
+def _compile_condition(item, schemas: dict, cred_defs: dict, participants: dict, path: str) -> Condition:
+    """Invalid condition fails alone as CONDITION_INVALID, other permissions of document are still granted"""
+    if not isinstance(item, dict):
+        return _invalid_condition(f'{path}: condition must be an object')
+    if item.get(CONDITION_SCHEMA):
+        issuer = item.get('issuer')
+        if not issuer:
+            return _invalid_condition(f'{path}: schema condition without issuer')
+        return Condition(
+            CONDITION_SCHEMA,
+            schema_id=schemas.get(item[CONDITION_SCHEMA], item[CONDITION_SCHEMA]),
+            issuer_did=participants.get(issuer) or to_did(issuer)
+        )
+    elif item.get(CONDITION_ID):
+        id_ = item[CONDITION_ID]
+        return Condition(CONDITION_ID, did=participants.get(id_) or to_did(id_))
+    elif item.get(CONDITION_CRED_DEF):
+        return Condition(CONDITION_CRED_DEF, cred_def_id=cred_defs.get(item[CONDITION_CRED_DEF], item[CONDITION_CRED_DEF]))
+    else:
+        return _invalid_condition(f'{path}: condition must have one of schema, cred_def, id')
+
+
+def _invalid_condition(reason: str) -> Condition:
+    logging.warning(f'Governance condition is never satisfied: {reason}')
+    return Condition(CONDITION_INVALID)
+
+
+class FrameworksCache:
+    """Compiled frameworks by content hash, least recently used are evicted above size"""
+
+    def __init__(self, size: int = 100):
+        self.__size = size
+        self.__items = OrderedDict()
+        # id of source document -> framework: repeated get() of the same document skips hashing
+        self.__by_doc = {}
+        self.__lock = threading.Lock()
+
+    def get(self, doc: dict) -> CompiledFramework:
+        with self.__lock:
+            framework = self.__by_doc.get(id(doc))
+            if framework is not None and framework.doc is doc:
+                self.__items.move_to_end(framework.hash)
+                return framework
+        hash_ = calc_doc_hash(doc)
+        with self.__lock:
+            framework = self.__items.get(hash_)
+            if framework is not None:
+                self.__items.move_to_end(hash_)
+                return framework
+        framework = compile_framework(doc, hash_)
+        with self.__lock:
+            self.__items[hash_] = framework
+            self.__by_doc[id(doc)] = framework
+            while len(self.__items) > self.__size:
+                _, evicted = self.__items.popitem(last=False)
+                if self.__by_doc.get(id(evicted.doc)) is evicted:
+                    del self.__by_doc[id(evicted.doc)]
+        return framework
+
+    def intern(self, doc: dict, hash_: Optional[str]) -> dict:
+        """Cached document equal to doc with hash claimed by sender, doc itself if there is none
+
+        get() of returned document doesn't serialize and hash it again
+        """
+        framework = self.find(hash_) if hash_ else None
+        if framework is not None and framework.doc == doc:
+            return framework.doc
+        return doc
+
+    def find(self, hash_: str) -> Optional[CompiledFramework]:
+        """Content-addressed lookup, None if framework was not compiled or is evicted"""
+        with self.__lock:
+            return self.__items.get(hash_)
+
+    def frameworks(self) -> List[CompiledFramework]:
+        with self.__lock:
+            return list(self.__items.values())
+
+
+compiled_frameworks = FrameworksCache()
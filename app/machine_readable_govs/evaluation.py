@@ -0,0 +1,237 @@
+import time
+import asyncio
+import logging
+from typing import List, TYPE_CHECKING
+
+import sirius_sdk
+
+from credential_index import credential_index
+from machine_readable_govs.compiler import CompiledFramework, Condition, CONDITION_SCHEMA, CONDITION_INVALID
+
+
+if TYPE_CHECKING:
+    from ledger_cache import LedgerCache
+
+
+async def build_schema_referent(dkms, condition: Condition, my_did: str, ledger_cache: 'LedgerCache') -> dict:
+    schema_in_dkms = await ledger_cache.load_schema(dkms, condition.schema_id, my_did)
+    attr = schema_in_dkms.attributes[0]
+    return {
+        "name": attr,
+        "restrictions": {
+            "issuer_did": condition.issuer_did
+        }
+    }
+
+
+async def build_cred_def_referent(dkms, condition: Condition, my_did: str, ledger_cache: 'LedgerCache') -> dict:
+    cred_def_in_dkms = await ledger_cache.load_cred_def(dkms, condition.cred_def_id, my_did)
+    attr = cred_def_in_dkms.schema.attributes[0]
+    return {
+        "name": attr,
+        "restrictions": {
+            "cred_def_id": condition.cred_def_id
+        }
+    }
+
+
+async def search_referents(referents: dict) -> dict:
+    """Single wallet search for all referents
+
+    :param referents: referent name -> requested attribute
+    :return: referent name -> True if wallet has credentials for it
+    """
+    if not referents:
+        return {}
+    proof_request = {
+        "name": "Proof request",
+        "nonce": '7513514252',
+        "requested_attributes": referents,
+        "requested_predicates": {},
+        "version": "0.1"
+    }
+    found = await sirius_sdk.AnonCreds.prover_search_credentials_for_proof_req(
+        proof_request=proof_request, limit_referents=100
+    )
+    requested_attributes = found.get('requested_attributes', {}) if found else {}
+    return {name: bool(requested_attributes.get(name, [])) for name in referents.keys()}
+
+
+async def check_credentials(dkms, my_did: str, conditions: List[Condition], ledger_cache: 'LedgerCache') -> dict:
+    """Check all schema and cred-def conditions of framework
+
+    Conditions are answered by credential index, misses are checked
+    with one multi-referent proof request search.
+
+    :return: condition key -> result, conditions failed to be built are False
+    """
+    results = {}
+    try:
+        for condition in conditions:
+            if condition.kind == CONDITION_SCHEMA:
+                found = await credential_index.count(schema_id=condition.schema_id, issuer_did=condition.issuer_did)
+            else:
+                found = await credential_index.count(cred_def_id=condition.cred_def_id)
+            if found:
+                results[condition.key] = True
+    except Exception as e:
+        logging.exception('Error while search credential index')
+    conditions = [condition for condition in conditions if condition.key not in results]
+    if not conditions:
+        return results
+
+    async def build_referent(condition: Condition) -> dict:
+        if condition.kind == CONDITION_SCHEMA:
+            return await build_schema_referent(dkms, condition, my_did, ledger_cache)
+        else:
+            return await build_cred_def_referent(dkms, condition, my_did, ledger_cache)
+
+    built = await asyncio.gather(*[build_referent(condition) for condition in conditions], return_exceptions=True)
+    referents = {}
+    referent_names = {}
+    for n, (condition, referent) in enumerate(zip(conditions, built)):
+        if isinstance(referent, Exception):
+            logging.error(f'Error while building referent for condition {condition.key}: {repr(referent)}')
+            continue
+        name = f'attr{n + 1}_referent'
+        referents[name] = referent
+        referent_names[condition.key] = name
+    try:
+        found = await search_referents(referents)
+    except Exception as e:
+        logging.exception('Error')
+        found = {}
+    for condition in conditions:
+        results[condition.key] = found.get(referent_names.get(condition.key), False)
+    return results
+
+
+async def check_id(condition: Condition, my_dids) -> bool:
+    """
+    :param my_dids: future of DID.list_my_dids_with_meta()
+    """
+    my_dids = await asyncio.shield(my_dids)
+    return any([item['did'] == condition.did for item in my_dids])
+
+
+async def check_condition(condition: Condition, credentials, my_dids) -> bool:
+    """
+    :param credentials: future of check_credentials() results
+    :param my_dids: future of DID.list_my_dids_with_meta()
+    """
+    if condition.is_credential:
+        # shield: shared search must survive cancellation of single condition
+        results = await asyncio.shield(credentials)
+        return results[condition.key]
+    elif condition.kind == CONDITION_INVALID:
+        return False
+    else:
+        return await check_id(condition, my_dids)
+
+
+async def evaluate_frameworks(
+        frameworks: List[CompiledFramework], ledger_cache: 'LedgerCache', network: str, known: dict = None
+) -> (dict, dict):
+    """Evaluate permissions of compiled governance frameworks in one pass
+
+    Every unique condition of all frameworks is checked once, all checks run concurrently,
+    schema and cred-def conditions are answered by single wallet search.
+    Group is decided as soon as any of "any" succeeded or any of "and" failed,
+    checks nobody waits for anymore are cancelled.
+
+    :param ledger_cache: cache of schemas and cred-defs referents are built from
+    :param network: DKMS network name
+    :param known: condition key -> result of conditions that are not checked again
+    :return: granted roles by framework hash, report: condition key -> {"result", "status", "time"}
+    """
+    known = known or {}
+    conditions = {}
+    groups = []
+    for framework in frameworks:
+        conditions.update(framework.conditions)
+        groups.extend([(framework, group) for group in framework.groups])
+    my_dids = asyncio.ensure_future(sirius_sdk.DID.list_my_dids_with_meta())
+    try:
+        my_did = (await asyncio.shield(my_dids))[0]['did']
+        dkms = await sirius_sdk.ledger(network)
+    except Exception:
+        my_dids.cancel()
+        raise
+    credentials = asyncio.ensure_future(
+        check_credentials(
+            dkms, my_did, [cond for cond in conditions.values() if cond.is_credential and cond.key not in known],
+            ledger_cache
+        )
+    )
+    report = {}
+    checks = {}
+    waiters = {}
+    for key, condition in conditions.items():
+        if key in known:
+            report[key] = {'result': known[key], 'status': 'cached', 'time': None}
+            checks[key] = asyncio.get_event_loop().create_future()
+            checks[key].set_result(known[key])
+        else:
+            report[key] = {'result': None, 'status': 'pending', 'time': None}
+            checks[key] = asyncio.ensure_future(timed_check(report[key], check_condition(condition, credentials, my_dids)))
+        waiters[key] = 0
+    for framework, group in groups:
+        for condition in group.conditions:
+            waiters[condition.key] += 1
+
+    async def decide(operator: str, conditions: List[Condition]) -> bool:
+        keys = [condition.key for condition in conditions]
+        try:
+            pending = {checks[key] for key in keys}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for fut in done:
+                    if operator == 'any' and fut.result():
+                        return True
+                    if operator == 'and' and not fut.result():
+                        return False
+            return operator == 'and'
+        finally:
+            for key in keys:
+                waiters[key] -= 1
+                if waiters[key] == 0 and not checks[key].done():
+                    checks[key].cancel()
+                    report[key]['status'] = 'cancelled'
+
+    try:
+        decisions = await asyncio.gather(*[decide(group.operator, group.conditions) for framework, group in groups])
+    finally:
+        for fut in list(checks.values()) + [credentials, my_dids]:
+            fut.cancel()
+        await asyncio.gather(*checks.values(), credentials, my_dids, return_exceptions=True)
+    granted = {framework.hash: [] for framework in frameworks}
+    for (framework, group), success in zip(groups, decisions):
+        if success:
+            granted[framework.hash].extend(group.grant)
+    return granted, report
+
+
+async def evaluate_framework(
+        framework: CompiledFramework, ledger_cache: 'LedgerCache', network: str, known: dict = None
+) -> (list, dict):
+    """Same as evaluate_frameworks() for single framework
+
+    :return: granted roles, report: condition key -> {"result", "status", "time"}
+    """
+    granted, report = await evaluate_frameworks([framework], ledger_cache, network, known)
+    return granted[framework.hash], report
+
+
+async def timed_check(report: dict, check) -> bool:
+    stamp = time.monotonic()
+    try:
+        success = await check
+    except Exception:
+        logging.exception('Error')
+        success = False
+    finally:
+        # cancelled checks report time spent before cancellation
+        report['time'] = time.monotonic() - stamp
+    report['result'] = success
+    report['status'] = 'done'
+    return success
@@ -0,0 +1,187 @@
+import logging
+import threading
+from typing import Callable, Awaitable, Optional, List, Dict
+
+from machine_readable_govs.compiler import CompiledFramework, Condition, CONDITION_SCHEMA, CONDITION_CRED_DEF
+
+
+class RolesEntry:
+
+    def __init__(self, framework: CompiledFramework, version: int, roles: list, results: dict):
+        """
+        :param version: wallet credential version roles were evaluated for
+        :param results: condition key -> result, conditions missing here are checked on next evaluation
+        """
+        self.framework = framework
+        self.version = version
+        self.roles = roles
+        self.results = results
+
+
+class RoleCache:
+    """Roles granted by governance frameworks, cached by (framework hash, wallet credential version)
+
+    Roles depend on my credentials and DIDs only. Storing credential bumps version
+    and forgets results of conditions referring its schema, cred-def or issuer,
+    so next evaluation re-checks those conditions only. refresh() re-evaluates
+    cached frameworks and reports role changes to listeners.
+    Credentials may be stored by other process (uvicorn worker, consumer): with shared
+    versions every process bumps shared version on change and checks it on lookup,
+    all results are forgotten when other process changed it.
+    """
+
+    def __init__(self, evaluator: Callable[..., Awaitable[tuple]], versions=None):
+        """
+        :param evaluator: coroutine function (frameworks, known results) -> (roles by framework hash, report)
+        :param versions: shared version with coroutines load() -> int and bump() -> int (see shared.SharedCounter),
+                         changes of own process only are seen if None
+        """
+        self.__evaluator = evaluator
+        self.__versions = versions
+        self.__lock = threading.Lock()
+        self.__entries = {}
+        self.__listeners = []
+        self.version = 0
+        # last seen shared version
+        self.__shared_version = None
+
+    def on_change(self, listener: Callable[[dict], Awaitable]):
+        """
+        :param listener: coroutine function called with {"framework", "hash", "roles", "prev_roles"}
+        """
+        self.__listeners.append(listener)
+
+    async def roles(self, framework: CompiledFramework) -> list:
+        granted = await self.roles_matrix([framework])
+        return granted[framework.hash]
+
+    async def roles_matrix(self, frameworks: List[CompiledFramework]) -> Dict[str, list]:
+        """Roles by framework hash, outdated frameworks are evaluated together in one pass"""
+        await self.__sync()
+        granted = {}
+        outdated = []
+        known = {}
+        with self.__lock:
+            for framework in frameworks:
+                entry = self.__entries.get(framework.hash)
+                if entry is not None and entry.version == self.version:
+                    granted[framework.hash] = list(entry.roles)
+                else:
+                    outdated.append(framework)
+                    if entry is not None:
+                        # results of current version are valid for any framework
+                        known.update(entry.results)
+            version = self.version
+        if outdated:
+            granted.update(await self.__evaluate(outdated, known, version))
+        return granted
+
+    async def invalidate(self, schema_id: str = None, cred_def_id: str = None, issuer_did: str = None):
+        """Credential was stored or removed, all credential conditions are affected if nothing is known about it"""
+        with self.__lock:
+            self.version += 1
+            for entry in self.__entries.values():
+                entry.results = {
+                    key: result for key, result in entry.results.items()
+                    if not is_affected(entry.framework.conditions[key], schema_id, cred_def_id, issuer_did)
+                }
+        await self.__publish()
+
+    async def clear(self):
+        """Wallet was wiped, every condition is checked again"""
+        with self.__lock:
+            self.__forget()
+        await self.__publish()
+
+    async def refresh(self):
+        """Re-evaluate outdated frameworks"""
+        with self.__lock:
+            frameworks = [entry.framework for entry in self.__entries.values() if entry.version != self.version]
+        if frameworks:
+            try:
+                await self.roles_matrix(frameworks)
+            except Exception:
+                logging.exception('Error while refresh roles')
+
+    def __forget(self):
+        self.version += 1
+        for entry in self.__entries.values():
+            entry.results = {}
+
+    async def __sync(self):
+        """Forget results if other process changed credentials"""
+        if self.__versions is None:
+            return
+        try:
+            shared_version = await self.__versions.load()
+        except Exception:
+            logging.exception('Error while loading shared credential version')
+            return
+        with self.__lock:
+            if shared_version != self.__shared_version:
+                self.__forget()
+                self.__shared_version = shared_version
+
+    async def __publish(self):
+        """Let other processes know credentials changed"""
+        if self.__versions is None:
+            return
+        try:
+            shared_version = await self.__versions.bump()
+        except Exception:
+            logging.exception('Error while bumping shared credential version')
+            return
+        with self.__lock:
+            if self.__shared_version is None or shared_version != self.__shared_version + 1:
+                # other process changed credentials meanwhile, nothing is known about its change
+                self.__forget()
+            self.__shared_version = shared_version
+
+    async def __evaluate(self, frameworks: List[CompiledFramework], known: dict, version: int) -> Dict[str, list]:
+        granted, report = await self.__evaluator(frameworks, known)
+        for key, item in report.items():
+            logging.info(f'Condition {key}: {item["status"]}, result: {item["result"]}, time: {item["time"]}')
+        changes = []
+        with self.__lock:
+            for framework in frameworks:
+                if version == self.version:
+                    results = {
+                        key: report[key]['result'] for key in framework.conditions.keys()
+                        if report[key]['status'] in ['done', 'cached']
+                    }
+                else:
+                    # credentials changed while evaluating: results may be stale
+                    results = {}
+                roles = granted[framework.hash]
+                prev = self.__entries.get(framework.hash)
+                self.__entries[framework.hash] = RolesEntry(framework, version, roles, results)
+                if prev is not None and sorted(prev.roles) != sorted(roles):
+                    changes.append({
+                        'framework': framework.name,
+                        'hash': framework.hash,
+                        'roles': roles,
+                        'prev_roles': prev.roles
+                    })
+        for change in changes:
+            await self.__notify(change)
+        return {hash_: list(roles) for hash_, roles in granted.items()}
+
+    async def __notify(self, change: dict):
+        for listener in self.__listeners:
+            try:
+                await listener(change)
+            except Exception:
+                logging.exception('Error while notify roles change')
+
+
+def is_affected(condition: Condition, schema_id: Optional[str], cred_def_id: Optional[str], issuer_did: Optional[str]) -> bool:
+    if not condition.is_credential:
+        return False
+    if schema_id is None and cred_def_id is None and issuer_did is None:
+        return True
+    if condition.kind == CONDITION_SCHEMA:
+        # schema conditions restrict issuer only
+        return condition.schema_id == schema_id or condition.issuer_did == issuer_did
+    elif condition.kind == CONDITION_CRED_DEF:
+        return condition.cred_def_id == cred_def_id
+    return False
@@ -1,4 +1,5 @@
 import os
+import copy
 import asyncio
 import random
 import logging
@@ -9,11 +10,12 @@ from time import sleep
 from urllib.parse import urljoin
 from datetime import datetime
 from collections import OrderedDict
+from typing import Optional, Union
 
 import uvicorn
 import sirius_sdk
 from sirius_sdk.agent.aries_rfc.feature_0095_basic_message import Message as BasicMessage
-from fastapi import FastAPI, Request, HTTPException, WebSocket
+from fastapi import FastAPI, Request, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.responses import RedirectResponse
@@ -22,6 +24,12 @@ import settings
 from app.settings import URL_STATIC
 from didcomm.const import MSG_TYP_GOSSYP, MSG_TYP_TRACE_RESP
 from operations import *
+from broadcast import EventsHub
+from bus import EventsBus
+from dedup import build_dedup_store
+from gossyp_graph import GraphStore, is_empty_delta
+from admission import AdmissionControl, Overloaded
+from mrg_aggregator import MrgAggregator, STATUS_COLLECTING, STATUS_TIMEOUT
 from machine_readable_govs.uzbekistan import doc as mrg_uzbekistan
 from machine_readable_govs.turkey import doc as mrg_turkey
 
@@ -106,45 +114,80 @@ def build_connection_graph(connections: list) -> dict:
     }
 
 
-@app.get("/")
-async def index(request: Request):
-    my_identities = await get_my_identities()
-    my_connections = await get_my_connections()
-    my_schemas = await get_my_schemas()
-    my_creds = await get_my_credentials()
-    identities = []
+def serialize_identity(item: dict, base_url: str) -> dict:
+    tags = item['tags']
+    return {
+        'did': f'did:sov:{tags["did"]}',
+        'label': tags['label'],
+        'inv': base_url + tags['inv']
+    }
+
+
+def serialize_connection(item: sirius_sdk.Pairwise) -> dict:
+    # snapshot items are shared, don't modify them
+    body = dict(**item.metadata)
+    body['messaging'] = {'queue': [], 'counter': 0}
+    return body
+
+
+def serialize_schema(item, identities_labels: dict) -> dict:
+    body = dict(**item.body)
+    body['cred_defs'] = []
+    for cred_def in item.cred_defs:
+        issuer_did = cred_def.split(':')[0]
+        issuer_label = identities_labels.get(issuer_did, issuer_did)
+        body['cred_defs'].append({'id': cred_def, 'label': issuer_label, 'did': issuer_did})
+    return body
+
+
+def serialize_credential(item: dict, identities_labels: dict) -> dict:
+    cred = dict(**item)
+    cred['issuer'] = identities_labels.get(cred['issuer_did'], None)
+    return cred
+
+
+def build_identities_labels(my_identities: list, my_connections: list) -> dict:
     identities_labels = {}
     for item in my_identities:
         tags = item['tags']
-        did = tags["did"]
-        identities.append({
-            'did': f'did:sov:{did}',
-            'label': tags['label'],
-            'inv': str(request.base_url) + tags['inv']
-        })
-        identities_labels[did] = tags['label']
-    connections = []
+        identities_labels[tags['did']] = tags['label']
     for item in my_connections:
-        body = item.metadata
-        body['messaging'] = {'queue': [], 'counter': 0}
-        connections.append(body)
-        their_did = item.their.did
-        their_label = item.their.label
-        identities_labels[their_did] = their_label
-    schemas = []
-    for item in my_schemas:
-        body = item.body
-        body['cred_defs'] = []
-        for cred_def in item.cred_defs:
-            issuer_did = cred_def.split(':')[0]
-            issuer_label = identities_labels.get(issuer_did, issuer_did)
-            body['cred_defs'].append({'id': cred_def, 'label': issuer_label, 'did': issuer_did})
-        schemas.append(body)
-    credentials = []
-    for item in my_creds:
-        cred = dict(**item)
-        cred['issuer'] = identities_labels.get(cred['issuer_did'], None)
-        credentials.append(cred)
+        identities_labels[item.their.did] = item.their.label
+    return identities_labels
+
+
+async def load_identities_labels(my_identities: list, my_connections: list, dids: list) -> dict:
+    """Labels of my identities and connections, issuers out of them are looked up by their DID"""
+    identities_labels = build_identities_labels(my_identities, my_connections)
+    missing = [did for did in dids if did and did not in identities_labels]
+    if missing:
+        identities_labels.update(await get_connection_labels(missing))
+    return identities_labels
+
+
+def get_issuer_dids(my_schemas: list, my_creds: list) -> list:
+    dids = [cred_def.split(':')[0] for item in my_schemas for cred_def in item.cred_defs]
+    dids.extend(cred['issuer_did'] for cred in my_creds)
+    return dids
+
+
+@app.get("/")
+async def index(request: Request):
+    snapshot = await cabinet_snapshot.load('identities', 'schemas')
+    my_identities = snapshot['identities']
+    my_schemas = snapshot['schemas']
+    # Large collections are rendered partially, browser loads the rest via /records
+    (my_connections, connections_cursor), (my_creds, credentials_cursor) = await asyncio.gather(
+        load_page('connections', settings.CABINET_PAGE_SIZE),
+        load_page('credentials', settings.CABINET_PAGE_SIZE)
+    )
+    identities_labels = await load_identities_labels(
+        my_identities, my_connections, get_issuer_dids(my_schemas, my_creds)
+    )
+    identities = [serialize_identity(item, str(request.base_url)) for item in my_identities]
+    connections = [serialize_connection(item) for item in my_connections]
+    schemas = [serialize_schema(item, identities_labels) for item in my_schemas]
+    credentials = [serialize_credential(item, identities_labels) for item in my_creds]
     # WS
     ws = str(request.base_url)
     if settings.IS_PRODUCTION:
@@ -159,6 +202,11 @@ async def index(request: Request):
         'connections': connections,
         'schemas': schemas,
         'credentials': credentials,
+        'cursors': {
+            'connections': connections_cursor,
+            'credentials': credentials_cursor
+        },
+        'page_size': settings.CABINET_PAGE_SIZE,
         'reset_link': urljoin(str(request.base_url), '/reset'),
         'ws': ws,
         'default_proof_request': OrderedDict({
@@ -181,7 +229,8 @@ async def index(request: Request):
         'auras_my_connections': AURAS_MY_CONNECTIONS,
         'mrg_choices': {
             mrg_turkey['name']: mrg_turkey,
-            mrg_uzbekistan['name']: mrg_uzbekistan
+            mrg_uzbekistan['name']: mrg_uzbekistan,
+            'All frameworks': [mrg_turkey, mrg_uzbekistan]
         }
     }
     response = templates.TemplateResponse(
@@ -194,6 +243,45 @@ async def index(request: Request):
     return response
 
 
+@app.get("/records/{collection}")
+async def records(request: Request, collection: str, cursor: str = None, limit: int = None):
+    """Cursor-paginated wallet records, cursor is opaque token of the next page"""
+    limit = min(limit or settings.CABINET_PAGE_SIZE, settings.WALLET_SEARCH_BATCH)
+    if limit <= 0:
+        raise HTTPException(status_code=400, detail="Limit must be positive")
+    if collection not in wallet_collections:
+        raise HTTPException(status_code=404, detail=f"Unknown collection: {collection}")
+    try:
+        page, next_cursor = await load_page(collection, limit, cursor or None)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if collection == 'identities':
+        items = [serialize_identity(item, str(request.base_url)) for item in page]
+    elif collection == 'connections':
+        items = [serialize_connection(item) for item in page]
+    else:
+        my_identities = (await cabinet_snapshot.load('identities'))['identities']
+        if collection == 'schemas':
+            identities_labels = await load_identities_labels(my_identities, [], get_issuer_dids(page, []))
+            items = [serialize_schema(item, identities_labels) for item in page]
+        else:
+            identities_labels = await load_identities_labels(my_identities, [], get_issuer_dids([], page))
+            items = [serialize_credential(item, identities_labels) for item in page]
+    return {
+        'items': items,
+        'next_cursor': next_cursor
+    }
+
+
+@app.get("/roles")
+async def roles():
+    """My role matrix over all known governance frameworks"""
+    try:
+        return {'frameworks': await get_roles_matrix()}
+    except GovernanceError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @app.get("/reset")
 async def reset_cabinet(request: Request):
     await reset()
@@ -201,11 +289,35 @@ async def reset_cabinet(request: Request):
     return response
 
 
+# expensive actions are limited to shed bursts fast
+admission = AdmissionControl(
+    limits=settings.ADMISSION_LIMITS, concurrency=settings.ADMISSION_CONCURRENCY,
+    queue_size=settings.ADMISSION_QUEUE_SIZE, queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+    exempt=settings.ADMISSION_EXEMPT
+)
+
+
 @app.post("/")
 async def action(request: Request):
     body = await request.json()
     action_ = body.get('action')
     payload_ = body.get('payload')
+    if action_ == 'route':
+        their_did = payload_.get('their_did') if isinstance(payload_, dict) else None
+        if not their_did:
+            raise HTTPException(status_code=400, detail="their_did is Empty!")
+        # route known locally is cheap read, only trace flood goes through admission
+        graph = await find_route(their_did)
+        if graph:
+            return {'graph': await refresh_graph(graph), 'pending': False}
+    try:
+        async with admission.admit(action_):
+            return await run_action(action_, payload_)
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={'Retry-After': str(e.retry_after)})
+
+
+async def run_action(action_: str, payload_: dict):
     try:
         if action_ == 'add-identity':
             label = payload_.get('label')
@@ -217,9 +329,9 @@ async def action(request: Request):
             my_did = payload_.get('me')
             if ':' in my_did:
                 my_did = my_did.split(':')[-1]
-            my_identities = await get_my_identities(did=my_did)
-            if my_identities:
-                identity = my_identities[0]['tags']
+            my_identity = await directory.identity(did=my_did)
+            if my_identity:
+                identity = my_identity['tags']
                 me = sirius_sdk.Pairwise.Me(did=identity['did'], verkey=identity['verkey'])
             else:
                 raise HTTPException(status_code=400, detail=f"Unknown self identity with did: {my_did}")
@@ -234,9 +346,8 @@ async def action(request: Request):
             their_did = payload_.get('their_did', None)
             msg = payload_.get('msg', None)
             if msg:
-                collection = await get_my_connections(their_did=their_did)
-                if collection:
-                    p2p = collection[0]
+                p2p = await directory.connection(their_did=their_did)
+                if p2p:
                     await sirius_sdk.send_to(
                         message=sirius_sdk.aries_rfc.Message(content=msg),
                         to=p2p
@@ -296,17 +407,18 @@ async def action(request: Request):
             for name, value in values.items():
                 if not value:
                     raise HTTPException(status_code=400, detail=f"{name} attrib is Empty!")
-            await issue_cred(their_did, values, cred_def_id, comment)
+            # issuer state machine runs in job worker, status is pushed as jobs.status frame
+            job_id = await job_queue.submit('issue-cred', {
+                'their_did': their_did, 'values': values, 'cred_def_id': cred_def_id, 'comment': comment
+            })
+            return {'success': True, 'job_id': job_id}
         elif action_ == 'verify':
             their_did = payload_.pop('their_did')
             if ':' in their_did:
                 their_did = their_did.split(':')[-1]
             proof_request = payload_.pop('proof_request')
-            success, msg = await verify(their_did, proof_request=proof_request)
-            return {
-                'success': success,
-                'msg': msg
-            }
+            job_id = await job_queue.submit('verify', {'their_did': their_did, 'proof_request': proof_request})
+            return {'success': True, 'job_id': job_id}
         elif action_ == 'gossyp':
             members = []
             for did in payload_['members']:
@@ -315,21 +427,21 @@ async def action(request: Request):
                 members.append(did)
             message = payload_['message']
             try:
-                await gossyp(members, message)
+                await gossyp(members, message, mode=payload_.get('mode'))
             except Exception as e:
                 raise
         elif action_ == 'route':
-            their_did = payload_['their_did']
-            graph = await fire_route(their_did)
-            if graph:
-                graph = await refresh_graph(graph)
-                return {'graph': graph, 'pending': False}
-            else:
-                return {'graph': None, 'pending': True}
+            # route is not known locally (see action), flood trace request
+            await flood_route(payload_['their_did'])
+            return {'graph': None, 'pending': True}
         elif action_ == 'mrg':
-            doc = payload_['doc']
+            # docs: frameworks evaluated together in one pass
+            doc = payload_.get('docs') or payload_['doc']
             req_id = payload_['req_id']
-            await fire_compliance(doc, req_id)
+            try:
+                await fire_compliance(doc, req_id)
+            except GovernanceError as e:
+                raise HTTPException(status_code=400, detail=str(e))
     except RuntimeError as e:
         msg = ''
         for arg in e.args:
@@ -343,7 +455,8 @@ async def action(request: Request):
 
 async def refresh_graph(graph: dict) -> dict:
     my_dids = []
-    my_identities = await get_my_identities()
+    snapshot = await cabinet_snapshot.load('identities')
+    my_identities = snapshot['identities']
     for item in my_identities:
         tags = item['tags']
         did = tags["did"]
@@ -369,106 +482,186 @@ async def refresh_graph(graph: dict) -> dict:
     return graph
 
 
+# Gossyp messages are decoded once for all WebSocket clients
+events_dedup = build_dedup_store('events')
+# gossyp graphs raised to browsers by message ID
+events_graphs = GraphStore(size=settings.GOSSYP_GRAPHS_SIZE)
+
+
+async def decode_event(event) -> list:
+    """Turn agent event to list of (topic, payload) frames for WebSocket clients"""
+    frames = []
+    if isinstance(event.message, sirius_sdk.aries_rfc.Message):
+        content = event.message.content
+        print(f'Received text message: {content}')
+        print(event.message.type)
+        their_vk = event.sender_verkey
+        my_vk = event.recipient_verkey
+        p2p = await directory.connection(their_verkey=their_vk, my_verkey=my_vk)
+        if p2p:
+            frames.append(('messaging.rcv', {
+                'msg': content,
+                'their_did': p2p.their.did
+            }))
+        else:
+            print(f'Not found P2P for verkey: {their_vk}')
+    elif event.message.type in [MSG_TYP_TRACE_RESP, MSG_TYP_MRG_RESP] and await is_late_response(event.message):
+        print(f'Ignore late response with ID: {event.message.id}')
+    elif event.message.type == MSG_TYP_TRACE_RESP:
+        print('Received Trace response')
+        route = event.message.get('route', [])
+        graph = event.message.get('graph', {})
+        if route and graph:
+            topology.add_graph(graph)
+            did = route[0]
+            my_conn = await directory.connections()
+            my_dids = [p2p.me.did for p2p in my_conn]
+            participants = {p2p.their.did: p2p for p2p in my_conn}
+            graph = await update_graph(graph, participants)
+            graph = await refresh_graph(graph)
+            if did in my_dids:
+                frames.append(('gossyp.graph', {
+                    'graph': graph,
+                }))
+    elif event.message.type == MSG_TYP_MRG_RESP:
+        print('Received MRG')
+        print(json.dumps(event.message, indent=2, sort_keys=True))
+        graph = event.message.get('graph')
+        topology.add_graph(graph)
+        # partial graphs are merged and pushed to browser by aggregator
+        deadline = event.message.get('deadline') or await request_deadlines.get(event.message.id)
+        await mrg_aggregator.add(
+            event.message.id, graph, event.message.get('matrix'), float(deadline) if deadline else None
+        )
+    elif event.message.type == MSG_TYP_GOSSYP:
+        print('Received Gossyp')
+        seen = await events_dedup.seen('gossyp:' + event.message.id)
+        state = events_graphs.get(event.message.id)
+        graph = event.message.get('graph_delta') or event.message.get('graph') or {}
+        delta = state.merge(graph.get('nodes', []), graph.get('links', []), event.message.get('version'))
+        topology.add_graph(delta)
+        if seen:
+            if not is_empty_delta(delta):
+                # browser merges graph data, delta is enough
+                graph = await refresh_graph(copy.deepcopy(delta))
+                frames.append(('gossyp.graph', {
+                    'graph': graph,
+                }))
+                print(f'Raised graph update, graph hash: {state.hash}')
+            else:
+                print('Ignore cause of message with same ID already processed...')
+        else:
+            print(json.dumps(event.message, indent=2, sort_keys=True))
+            members = event.message.get('members', [])
+            content = event.message.get('content', None)
+            graph = state.to_graph() if state.nodes or state.links else None
+
+            from_p2p = event.pairwise
+
+            if graph:
+                graph = await refresh_graph(graph)
+            frames.append(('messaging.gossyp', {
+                'msg': content,
+                'members': members,
+                'graph': graph,
+                'from': from_p2p.their.did if from_p2p else None
+            }))
+    return frames
+
+
+def build_events_bus() -> Optional[EventsBus]:
+    """Bus is bound to event loop, build it for every loop"""
+    if settings.REDIS:
+        return EventsBus(settings.REDIS[0], stream=settings.EVENTS_STREAM, replay_size=settings.EVENTS_REPLAY_SIZE)
+    else:
+        return None
+
+
+events_hub = EventsHub(
+    decode_event, queue_size=settings.WS_QUEUE_SIZE, max_dropped=settings.WS_MAX_DROPPED_FRAMES,
+    bus=build_events_bus()
+)
+
+
+# buses of push_frame by event loop: frames are pushed from uvicorn loop and foreground thread
+frame_buses = {}
+
+
+async def push_frame(topic: str, payload: dict):
+    """Frame may be pushed from any thread, outside of decode_event"""
+    if settings.REDIS:
+        loop = asyncio.get_event_loop()
+        bus = frame_buses.get(id(loop))
+        if bus is None:
+            bus = build_events_bus()
+            frame_buses[id(loop)] = bus
+        await bus.publish(topic, payload)
+    else:
+        events_hub.publish_threadsafe(topic, payload)
+
+
+async def push_roles_change(change: dict):
+    """Roles change may be detected in any thread, push it to cabinet"""
+    await push_frame('roles.changed', change)
+
+
+role_cache.on_change(push_roles_change)
+
+
+async def push_mrg_snapshot(snapshot: dict):
+    snapshot['graph'] = await refresh_graph(snapshot['graph'])
+    await push_frame('mrg.graph', snapshot)
+
+
+async def push_job_status(job: dict):
+    await push_frame('jobs.status', job)
+
+
+job_queue.on_change(push_job_status)
+
+
+# responses are aggregated by events producer of __main__ process, /mrg/{req_id} is served by any worker
+mrg_aggregator = MrgAggregator(
+    push_mrg_snapshot, build_dedup_store('mrg_graphs', shared=True), window=settings.MRG_AGGREGATE_WINDOW,
+    settle_time=settings.MRG_SETTLE_TIME, timeout=settings.MRG_TIMEOUT, size=settings.MRG_AGGREGATES_SIZE
+)
+
+
+def parse_topics(value: Optional[Union[str, list]]) -> Optional[list]:
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    topics = [topic.strip() for topic in value if topic.strip()]
+    return topics or None
+
+
 @app.websocket("/")
 async def events(websocket: WebSocket):
-    cached_gossyp_ids = []
-    cached_gossyp_graph_hashes = {}
+    """Push events to browser, client may pick topics with ?topics=messaging.rcv,mrg.graph
+    or later by sending {"topics": [...]}, reconnected client passes ?since=<seq of last frame>
+    """
+    client = None
+    sender = None
     try:
         await websocket.accept()
-        listener = await sirius_sdk.subscribe()
-        async for event in listener:
-            if isinstance(event.message, sirius_sdk.aries_rfc.Message):
-                content = event.message.content
-                print(f'Received text message: {content}')
-                print(event.message.type)
-                their_vk = event.sender_verkey
-                my_vk = event.recipient_verkey
-                conn_ = await get_my_connections(their_verkey=their_vk, my_verkey=my_vk)
-                if conn_:
-                    p2p = conn_[0]
-                    await websocket.send_json({
-                        'topic': 'messaging.rcv',
-                        'payload': {
-                            'msg': content,
-                            'their_did': p2p.their.did
-                        }
-                    })
-                else:
-                    print(f'Not found P2P for verkey: {their_vk}')
-            elif event.message.type == MSG_TYP_TRACE_RESP:
-                print('Received Trace response')
-                route = event.message.get('route', [])
-                graph = event.message.get('graph', {})
-                if route and graph:
-                    did = route[0]
-                    my_conn = await get_my_connections()
-                    my_dids = [p2p.me.did for p2p in my_conn]
-                    participants = {p2p.their.did: p2p for p2p in my_conn}
-                    graph = await update_graph(graph, participants)
-                    graph = await refresh_graph(graph)
-                    if did in my_dids:
-                        await websocket.send_json({
-                            'topic': 'gossyp.graph',
-                            'payload': {
-                                'graph': graph,
-                            }
-                        })
-            elif event.message.type == MSG_TYP_MRG_RESP:
-                print('Received MRG')
-                print(json.dumps(event.message, indent=2, sort_keys=True))
-                graph = event.message.get('graph')
-                graph = await refresh_graph(graph)
-                await websocket.send_json({
-                    'topic': 'mrg.graph',
-                    'payload': {
-                        'graph': graph,
-                        'req_id': event.message.id
-                    }
-                })
-            elif event.message.type == MSG_TYP_GOSSYP:
-                print('Received Gossyp')
-                if event.message.id in cached_gossyp_ids:
-                    graph = event.message.get('graph', {})
-                    graph_hash = calc_json_hash(graph)
-                    if cached_gossyp_graph_hashes[event.message.id] != graph_hash:
-                        cached_gossyp_graph_hashes[event.message.id] = graph_hash
-                        graph = event.message.get('graph', None)
-                        if graph:
-                            graph = await refresh_graph(graph)
-                            await websocket.send_json({
-                                'topic': 'gossyp.graph',
-                                'payload': {
-                                    'graph': graph,
-                                }
-                            })
-                            print('Raised graph update')
-                    else:
-                        print('Ignore cause of message with same ID already processed...')
-                else:
-                    print(json.dumps(event.message, indent=2, sort_keys=True))
-                    members = event.message.get('members', [])
-                    content = event.message.get('content', None)
-                    graph = event.message.get('graph', None)
-
-                    graph_hash = calc_json_hash(graph)
-                    cached_gossyp_graph_hashes[event.message.id] = graph_hash
-
-                    from_p2p = event.pairwise
-
-                    if graph:
-                        graph = await refresh_graph(graph)
-                    await websocket.send_json({
-                        'topic': 'messaging.gossyp',
-                        'payload': {
-                            'msg': content,
-                            'members': members,
-                            'graph': graph,
-                            'from': from_p2p.their.did if from_p2p else None
-                        }
-                    })
-                    cached_gossyp_ids.append(event.message.id)
+        since = websocket.query_params.get('since')
+        client = events_hub.attach(topics=parse_topics(websocket.query_params.get('topics')), since=since)
+        sender = events_hub.spawn_sender(client, websocket)
+        await events_hub.resume(client, since)
+        while True:
+            request = await websocket.receive_json()
+            if isinstance(request, dict) and 'topics' in request:
+                client.topics = set(parse_topics(request['topics']) or []) or None
+    except WebSocketDisconnect:
+        pass
     except Exception as e:
         print('WS Error: ' + repr(e))
+    finally:
+        if client:
+            events_hub.detach(client)
+        if sender:
+            sender.cancel()
 
 
 @app.get("/health_check")
@@ -476,12 +669,97 @@ async def health_check(request: Request):
     return {"utc": datetime.utcnow().isoformat(), "headers": request.headers}
 
 
-def thread_routine():
+@app.get("/stats")
+async def stats():
+    try:
+        jobs = await job_queue.stats()
+    except Exception as e:
+        # Postgres is down, other stats don't depend on it
+        logging.exception('Error while loading jobs stats')
+        jobs = {'error': repr(e)}
+    return {
+        # process name -> stats of foreground: dedup, flood_drops, outbound, dispatcher, inbound
+        'foreground': await foreground_reports.load() if foreground_reports else {},
+        'dedup': {
+            'events': await events_dedup.stats()
+        },
+        'outbound': outbound.stats(),
+        'credential_index': credential_index.stats(),
+        'topology': topology.stats(),
+        'mrg_aggregator': mrg_aggregator.stats(),
+        'admission': admission.stats(),
+        'jobs': jobs
+    }
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail='Unknown job')
+    return job
+
+
+@app.get("/limits")
+async def get_limits():
+    if shared_limits is not None:
+        inbound_limiter.apply(await shared_limits.load())
+    return inbound_limiter.limits()
+
+
+@app.post("/limits")
+async def set_limits(request: Request):
+    """Tune inbound flood limits: {"type": <message type, default limits if missing>, "rate": .., "burst": ..}
+
+    Limits are saved to Redis, foreground processes apply them within INBOUND_LIMITS_POLL seconds
+    """
+    body = await request.json()
+    try:
+        msg_type, rate, burst = body.get('type'), float(body['rate']), float(body['burst'])
+        inbound_limiter.configure(msg_type, rate, burst)
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f'Invalid limits: {e}')
+    if shared_limits is not None:
+        await shared_limits.set(msg_type, rate, burst)
+    return await get_limits()
+
+
+@app.get("/mrg/{req_id}")
+async def mrg_graph(req_id: str):
+    """Merged graph of MRG request with status: collecting, complete or timeout"""
+    snapshot = await mrg_aggregator.find(req_id)
+    if snapshot is None:
+        # no responses yet
+        deadline = await request_deadlines.get(req_id)
+        if not deadline:
+            raise HTTPException(status_code=404, detail='Unknown MRG request')
+        deadline = float(deadline)
+        snapshot = {
+            'req_id': req_id,
+            'status': STATUS_COLLECTING if time.time() < deadline else STATUS_TIMEOUT,
+            'responses': 0,
+            'deadline': deadline,
+            'graph': {'nodes': [], 'links': []},
+            'matrices': {}
+        }
+    snapshot['graph'] = await refresh_graph(snapshot['graph'])
+    return snapshot
+
+
+async def produce_events():
+    await events_hub.produce(build_events_bus())
+
+
+async def job_worker():
+    await job_queue.run()
+
+
+def thread_routine(target=foreground):
     loop = asyncio.new_event_loop()
     while True:
         logging.warning('Run loop')
         try:
-            loop.run_until_complete(foreground())
+            loop.run_until_complete(target())
         except Exception as e:
             logging.exception('Exception')
         logging.warning('Sleep before re-run loop')
@@ -491,14 +769,30 @@ def thread_routine():
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--production', choices=['on', 'yes'], required=False)
+    # set off if protocol events are processed by standalone consumers, see consumer.py
+    parser.add_argument('--foreground', choices=['on', 'off'], default=os.getenv('FOREGROUND', 'on'))
+    # set off if issue-cred/verify jobs are run by other instance
+    parser.add_argument('--jobs', choices=['on', 'off'], default=os.getenv('JOBS', 'on'))
     args = parser.parse_args()
     is_production = args.production is not None
+    with_foreground = args.foreground == 'on'
+    with_jobs = args.jobs == 'on'
     args = ()
     kwargs = {}
-    f = asyncio.ensure_future(foreground())
-    th = threading.Thread(target=thread_routine)
-    th.daemon = True
-    th.start()
+    if with_foreground:
+        f = asyncio.ensure_future(foreground())
+        th = threading.Thread(target=thread_routine)
+        th.daemon = True
+        th.start()
+    if with_jobs:
+        th_jobs = threading.Thread(target=thread_routine, args=(job_worker,))
+        th_jobs.daemon = True
+        th_jobs.start()
+    if settings.REDIS:
+        # decode events once for all uvicorn workers
+        th_events = threading.Thread(target=thread_routine, args=(produce_events,))
+        th_events.daemon = True
+        th_events.start()
     if is_production:
         logging.warning('\n')
         logging.warning('\t*************************************')
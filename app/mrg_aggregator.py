@@ -0,0 +1,132 @@
+import copy
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Callable, Awaitable, Optional, TYPE_CHECKING
+
+from gossyp_graph import GraphState, join_deltas, is_empty_delta
+
+
+if TYPE_CHECKING:
+    from dedup import DedupStore
+
+
+STATUS_COLLECTING = 'collecting'
+STATUS_COMPLETE = 'complete'
+STATUS_TIMEOUT = 'timeout'
+
+
+class MrgAggregation:
+    """Partial graphs of MRG responses to single request merged together"""
+
+    def __init__(self, req_id: str, deadline: Optional[float]):
+        self.req_id = req_id
+        self.deadline = deadline
+        self.state = GraphState()
+        # responder DID -> roles matrix
+        self.matrices = {}
+        self.responses = 0
+        self.status = STATUS_COLLECTING
+        self.started = time.time()
+        self.updated = self.started
+        # entries merged since last snapshot was emitted
+        self.delta = {'nodes': [], 'links': []}
+        self.task = None
+
+    def snapshot(self) -> dict:
+        return {
+            'req_id': self.req_id,
+            'status': self.status,
+            'responses': self.responses,
+            'started': self.started,
+            'updated': self.updated,
+            'deadline': self.deadline,
+            'graph': self.state.to_graph(),
+            'matrices': copy.deepcopy(self.matrices)
+        }
+
+
+class MrgAggregator:
+    """Merges MRG responses by request ID and emits coalesced snapshots every window
+
+    Nodes are merged by DID with auras united, links are de-duplicated. Every
+    window seconds entries merged since last emit are pushed as delta with
+    request status: request is complete when no response arrived for settle_time
+    seconds, timed out when its deadline passed first. Full snapshots are saved
+    to store, so merged graph stays queryable from any process after flood settles.
+    """
+
+    def __init__(
+            self, emit: Callable[[dict], Awaitable], store: 'DedupStore',
+            window: float = 1, settle_time: float = 5, timeout: float = 60, size: int = 100
+    ):
+        """
+        :param emit: coroutine function called with snapshot where graph is delta since previous emit
+        :param store: snapshots by request ID as JSON, must be shared (Redis) if snapshots are read by other processes
+        :param timeout: used for requests with unknown deadline, seconds
+        :param size: aggregations kept in memory, least recently updated are evicted above
+        """
+        self.__emit = emit
+        self.__store = store
+        self.__window = window
+        self.__settle_time = settle_time
+        self.__timeout = timeout
+        self.__size = size
+        self.__items = OrderedDict()
+
+    async def add(self, req_id: str, graph: Optional[dict], matrix: list = None, deadline: float = None):
+        aggregation = self.__items.get(req_id)
+        if aggregation is None:
+            aggregation = MrgAggregation(req_id, deadline or time.time() + self.__timeout)
+            self.__items[req_id] = aggregation
+            while len(self.__items) > self.__size:
+                self.__items.popitem(last=False)
+        else:
+            self.__items.move_to_end(req_id)
+        graph = graph or {}
+        delta = aggregation.state.merge(graph.get('nodes', []), graph.get('links', []))
+        aggregation.delta = join_deltas(aggregation.delta, delta)
+        if matrix is not None and graph.get('nodes'):
+            # responder node goes first, see build_mrg_graph
+            aggregation.matrices[graph['nodes'][0]['id']] = matrix
+        aggregation.responses += 1
+        aggregation.updated = time.time()
+        aggregation.status = STATUS_COLLECTING
+        if aggregation.task is None or aggregation.task.done():
+            aggregation.task = asyncio.ensure_future(self.__run(aggregation))
+
+    async def find(self, req_id: str) -> Optional[dict]:
+        aggregation = self.__items.get(req_id)
+        if aggregation is not None:
+            return aggregation.snapshot()
+        value = await self.__store.get(req_id)
+        return json.loads(value) if value else None
+
+    def stats(self) -> dict:
+        statuses = {}
+        for aggregation in self.__items.values():
+            statuses[aggregation.status] = statuses.get(aggregation.status, 0) + 1
+        return {'requests': len(self.__items), 'statuses': statuses}
+
+    async def __run(self, aggregation: MrgAggregation):
+        try:
+            while aggregation.status == STATUS_COLLECTING:
+                await asyncio.sleep(self.__window)
+                now = time.time()
+                if now - aggregation.updated >= self.__settle_time:
+                    aggregation.status = STATUS_COMPLETE
+                elif now >= aggregation.deadline:
+                    aggregation.status = STATUS_TIMEOUT
+                elif is_empty_delta(aggregation.delta):
+                    continue
+                delta, aggregation.delta = aggregation.delta, {'nodes': [], 'links': []}
+                snapshot = aggregation.snapshot()
+                await self.__store.set(aggregation.req_id, json.dumps(snapshot))
+                snapshot['graph'] = copy.deepcopy(delta)
+                await self.__emit(snapshot)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logging.exception(f'Error while aggregate MRG responses of {aggregation.req_id}')
@@ -1,9 +1,15 @@
+import os
 import json
+import time
+import socket
+import asyncio
 import logging
 import hashlib
 import uuid
+import random
+import functools
 
-from typing import Optional, List, Union
+from typing import Optional, List, Union, Callable, Awaitable
 
 import sirius_sdk
 from sirius_sdk.agent.wallet.abstract import NYMRole as ActorRole
@@ -14,7 +20,24 @@ from sirius_sdk.errors.indy_exceptions import AnoncredsMasterSecretDuplicateName
 from sirius_sdk.agent.aries_rfc.feature_0036_issue_credential.messages import ProposedAttrib
 
 import settings
-from machine_readable_govs.utils import extract_my_roles
+from snapshot import CabinetSnapshot
+from wallet_pages import WalletPages
+from directory import Directory
+from credential_index import credential_index, get_issuer_did
+from dispatcher import EventDispatcher, PRIORITY_INTERACTIVE, PRIORITY_FLOOD, get_event_thread_key
+from dedup import build_dedup_store
+from outbound import OutboundDispatcher
+import flood_budget
+from flood_budget import check_flood_budget
+from gossyp_graph import GraphStore, join_deltas, is_empty_delta, pick_targets, GOSSYP_MODE_FLOOD, GOSSYP_MODE_EPIDEMIC
+from topology import TopologyStore
+from rate_limit import InboundLimiter
+from shared import StatsReports, ControlChannel, RedisTopology, SharedLimits
+from jobs import JobQueue
+from machine_readable_govs.utils import extract_my_roles, extract_roles_matrix, build_roles_matrix, role_cache, ledger_cache
+from machine_readable_govs.compiler import compiled_frameworks, calc_doc_hash, GovernanceError
+from machine_readable_govs.uzbekistan import doc as mrg_uzbekistan
+from machine_readable_govs.turkey import doc as mrg_turkey
 from didcomm.const import *
 from settings import DKMS_NETWORK, STEWARD_DID, SDK_STEWARD, MASTER_SECRET_ID, TITLE
 
@@ -49,84 +72,171 @@ async def get_my_endpoint():
     return my_endpoint
 
 
-async def get_my_identities(**search):
+async def search_wallet_records(type_: str, query: dict = None, limit: int = None) -> (list, Optional[int]):
+    """Single wallet_search round trip: records and total count"""
     opts = RetrieveRecordOptions()
     opts.check_all()
-    search_with_tags = dict(**search)
-    my_identities, count = await sirius_sdk.NonSecrets.wallet_search(
-        IDENTITIES_TYPE, search_with_tags, opts, 100
+    query = dict(**query) if query else {}
+    records, total_count = await sirius_sdk.NonSecrets.wallet_search(type_, query, opts, limit or settings.WALLET_SEARCH_BATCH)
+    return records or [], total_count
+
+
+async def iter_wallet_records(type_: str, query: dict = None, batch_size: int = None):
+    """Iterate over wallet records of type_ in batches of batch_size
+
+    NonSecrets.wallet_search has no offset argument: every search extends limit
+    by batch_size and only records past already yielded ones are yielded, until
+    search returns less than limit or total count is reached
+    """
+    batch_size = batch_size or settings.WALLET_SEARCH_BATCH
+    offset = 0
+    while True:
+        records, total_count = await search_wallet_records(type_, query, offset + batch_size)
+        for record in records[offset:offset + batch_size]:
+            yield record
+        fetched = len(records)
+        if fetched < offset + batch_size or (total_count is not None and fetched >= int(total_count)):
+            return
+        offset += batch_size
+
+
+def restore_connection(raw: dict) -> sirius_sdk.Pairwise:
+    metadata = json.loads(raw['value'])
+    return sirius_sdk.Pairwise(
+        me=sirius_sdk.Pairwise.Me(
+            did=metadata.get('me', {}).get('did', None),
+            verkey=metadata.get('me', {}).get('verkey', None),
+            did_doc=metadata.get('me', {}).get('did_doc', None)
+        ),
+        their=sirius_sdk.Pairwise.Their(
+            did=metadata.get('their', {}).get('did', None),
+            verkey=metadata.get('their', {}).get('verkey', None),
+            label=metadata.get('their', {}).get('label', None),
+            endpoint=metadata.get('their', {}).get('endpoint', {}).get('address', None),
+            routing_keys=metadata.get('their', {}).get('endpoint', {}).get('routing_keys', None),
+            did_doc=metadata.get('their', {}).get('did_doc', None)
+        ),
+        metadata=metadata
     )
-    return my_identities or []
+
+
+def restore_schema(raw: dict) -> Schema:
+    schema = Schema(**json.loads(raw['value']))
+    schema.cred_defs = []
+    tags = raw.get('tags', {})
+    for n, val in tags.items():
+        if n.startswith('cred_def_'):
+            schema.cred_defs.append(val)
+    return schema
+
+
+def restore_credential(raw: dict) -> dict:
+    cred = json.loads(raw['value'])
+    cred['id'] = raw['id']
+    if 'issuer_did' not in cred:
+        cred['issuer_did'] = None
+    return cred
+
+
+async def iter_my_identities(batch_size: int = None, **search):
+    async for raw in iter_wallet_records(IDENTITIES_TYPE, search, batch_size):
+        yield raw
+
+
+async def iter_my_connections(batch_size: int = None, **search):
+    async for raw in iter_wallet_records(CONNECTIONS_TYPE, search, batch_size):
+        yield restore_connection(raw)
+
+
+async def iter_my_schemas(batch_size: int = None, **search):
+    async for raw in iter_wallet_records(SCHEMAS_TYPE, search, batch_size):
+        yield restore_schema(raw)
+
+
+async def iter_my_credentials(batch_size: int = None):
+    async for raw in iter_wallet_records(CREDS_TYPE, {}, batch_size):
+        yield restore_credential(raw)
+
+
+async def get_my_identities(**search):
+    return [item async for item in iter_my_identities(**search)]
 
 
 async def get_my_connections(**search):
-    opts = RetrieveRecordOptions()
-    opts.check_all()
-    search_with_tags = dict(**search)
-    my_connections_raw, count = await sirius_sdk.NonSecrets.wallet_search(
-        CONNECTIONS_TYPE, search_with_tags, opts, 100
-    )
-    my_connections_raw = my_connections_raw or []
-    my_connections = []
-    for raw in my_connections_raw:
-        metadata = json.loads(raw['value'])
-        p2p = sirius_sdk.Pairwise(
-            me=sirius_sdk.Pairwise.Me(
-                did=metadata.get('me', {}).get('did', None),
-                verkey=metadata.get('me', {}).get('verkey', None),
-                did_doc=metadata.get('me', {}).get('did_doc', None)
-            ),
-            their=sirius_sdk.Pairwise.Their(
-                did=metadata.get('their', {}).get('did', None),
-                verkey=metadata.get('their', {}).get('verkey', None),
-                label=metadata.get('their', {}).get('label', None),
-                endpoint=metadata.get('their', {}).get('endpoint', {}).get('address', None),
-                routing_keys=metadata.get('their', {}).get('endpoint', {}).get('routing_keys', None),
-                did_doc=metadata.get('their', {}).get('did_doc', None)
-            ),
-            metadata=metadata
-        )
-        my_connections.append(p2p)
-    return my_connections or []
+    return [p2p async for p2p in iter_my_connections(**search)]
 
 
 async def get_my_schemas(**search):
-    opts = RetrieveRecordOptions()
-    opts.check_all()
-    search_with_tags = dict(**search)
-    my_schemas_raw, count = await sirius_sdk.NonSecrets.wallet_search(
-        SCHEMAS_TYPE, search_with_tags, opts, 100
-    )
-    my_schemas_raw = my_schemas_raw or []
-    my_schemas = []
-    for raw in my_schemas_raw:
-        schema = Schema(**json.loads(raw['value']))
-        schema.cred_defs = []
-        tags = raw.get('tags', {})
-        for n, val in tags.items():
-            if n.startswith('cred_def_'):
-                schema.cred_defs.append(val)
-        my_schemas.append(schema)
-    return my_schemas or []
+    return [schema async for schema in iter_my_schemas(**search)]
 
 
 async def get_my_credentials():
-    opts = RetrieveRecordOptions()
-    opts.check_all()
-    search_with_tags = {}
-    my_creds_raw, count = await sirius_sdk.NonSecrets.wallet_search(
-        CREDS_TYPE, search_with_tags, opts, 100
-    )
-    credentials = []
-    if my_creds_raw:
-        for raw in my_creds_raw:
-            s = raw['value']
-            cred = json.loads(s)
-            cred['id'] = raw['id']
-            if 'issuer_did' not in cred:
-                cred['issuer_did'] = None
-            credentials.append(cred)
-    return credentials
+    return [cred async for cred in iter_my_credentials()]
+
+
+# cursor pages of cabinet collections, see /records
+wallet_pages = WalletPages(search=search_wallet_records, ttl=settings.WALLET_PAGES_TTL)
+
+wallet_collections = {
+    'identities': (IDENTITIES_TYPE, lambda raw: raw),
+    'connections': (CONNECTIONS_TYPE, restore_connection),
+    'schemas': (SCHEMAS_TYPE, restore_schema),
+    'credentials': (CREDS_TYPE, restore_credential)
+}
+
+
+async def load_page(collection: str, limit: int, cursor: str = None) -> (list, Optional[str]):
+    """Page of restored collection items and cursor of the next one
+
+    :raises ValueError: if cursor is malformed
+    """
+    type_, restore = wallet_collections[collection]
+    page, next_cursor = await wallet_pages.page(type_, {}, limit, cursor)
+    return [restore(raw) for raw in page], next_cursor
+
+
+async def get_connection_labels(dids: list) -> dict:
+    """their DID -> label of connections found by keyed search"""
+    found = await asyncio.gather(*[get_my_connections(their_did=did) for did in set(dids)])
+    return {p2p.their.did: p2p.their.label for p2ps in found for p2p in p2ps}
+
+
+cabinet_snapshot = CabinetSnapshot(
+    ttl=settings.CABINET_SNAPSHOT_TTL,
+    identities=get_my_identities,
+    schemas=get_my_schemas
+)
+
+directory = Directory(
+    identities=get_my_identities,
+    connections=get_my_connections,
+    pairwise=sirius_sdk.PairwiseList.load_for_did,
+    ttl=settings.DIRECTORY_MISS_TTL,
+    load_ttl=settings.DIRECTORY_TTL
+)
+
+# processed trace/gossyp/MRG message IDs, kept across foreground restarts
+foreground_dedup = build_dedup_store('foreground')
+
+# foreground runs in __main__ or consumer processes, /stats of uvicorn workers reads its stats from Redis
+foreground_reports = StatsReports(
+    settings.REDIS[0], key=f'{settings.REDIS_KEYS_PREFIX}:stats:foreground', ttl=settings.STATS_REPORT_TTL
+) if settings.REDIS else None
+# uvicorn workers hand work that needs foreground state (gossyp anti-entropy) to foreground
+foreground_control = ControlChannel(
+    settings.REDIS[0], key=f'{settings.REDIS_KEYS_PREFIX}:control:foreground'
+) if settings.REDIS else None
+
+# fan-outs to peers: trace, gossyp, MRG
+outbound = OutboundDispatcher(
+    concurrency=settings.OUTBOUND_CONCURRENCY,
+    timeout=settings.OUTBOUND_TIMEOUT,
+    retries=settings.OUTBOUND_RETRIES,
+    backoff=settings.OUTBOUND_BACKOFF,
+    queue_size=settings.OUTBOUND_QUEUE_SIZE,
+    failure_threshold=settings.OUTBOUND_FAILURE_THRESHOLD,
+    recovery_time=settings.OUTBOUND_RECOVERY_TIME
+)
 
 
 async def reset():
@@ -152,7 +262,10 @@ async def reset():
                 await sirius_sdk.NonSecrets.delete_wallet_record(CONNECTIONS_TYPE, conn_id)
             except WalletItemNotFound:
                 pass
-    pass
+    cabinet_snapshot.invalidate()
+    directory.clear()
+    await role_cache.clear()
+    asyncio.ensure_future(role_cache.refresh())
 
 
 async def create_identity(label: str) -> (str, str):
@@ -176,6 +289,8 @@ async def create_identity(label: str) -> (str, str):
         type_=IDENTITIES_TYPE, id_=did, value=json.dumps(js),
         tags=js
     )
+    cabinet_snapshot.invalidate('identities')
+    directory.add_identity({'id': did, 'value': json.dumps(js), 'tags': js})
     return did, inv_s
 
 
@@ -193,6 +308,7 @@ async def register_connection(p2p: sirius_sdk.Pairwise):
         )
     except WalletItemAlreadyExists:
         pass
+    directory.add_connection(p2p)
 
 
 async def store_schema_in_wallet(did: str, name: str, ver: str, schema: Schema):
@@ -209,6 +325,7 @@ async def store_schema_in_wallet(did: str, name: str, ver: str, schema: Schema):
             type_=SCHEMAS_TYPE, id_=schema.id, value=json.dumps(schema.body),
             tags={'did': did, 'name': name, 'ver': ver}
         )
+        cabinet_snapshot.invalidate('schemas')
 
 
 def build_schema_tag_name_for_cred_def(cred_def_id: str):
@@ -227,6 +344,7 @@ async def register_cred_def_for_schema(cred_def_id: str, schema_id: str):
         # extended tags
         tags={tag_name: cred_def_id}
     )
+    cabinet_snapshot.invalidate('schemas')
 
 
 async def store_dkms_schema(schema_id: str):
@@ -266,17 +384,35 @@ async def register_cred(cred_id: str, preview: List[ProposedAttrib] = None, comm
             'preview': values
         })
         await sirius_sdk.NonSecrets.add_wallet_record(type_=CREDS_TYPE, id_=cred_id, value=value_as_str)
+    try:
+        cred = await sirius_sdk.AnonCreds.prover_get_credential(cred_id)
+    except Exception:
+        # unknown credential affects every credential condition
+        await role_cache.invalidate()
+    else:
+        cred_def_id = cred.get('cred_def_id')
+        credential_index.add(cred_id, cred.get('schema_id'), cred_def_id)
+        await role_cache.invalidate(
+            schema_id=cred.get('schema_id'),
+            cred_def_id=cred_def_id,
+            issuer_did=get_issuer_did(cred_def_id) if cred_def_id else issuer_did
+        )
+    asyncio.ensure_future(role_cache.refresh())
 
 
 async def load_schema(schema_id: str) -> (bool, Optional[Schema]):
     print(f'loading schema-id: {schema_id}')
-    async with sirius_sdk.context(**SDK_STEWARD):
-        dkms = await sirius_sdk.ledger(DKMS_NETWORK)
-        try:
-            schema = await dkms.load_schema(schema_id, STEWARD_DID)
-            success = True
-        except:
-            success, schema = False, None
+
+    async def load_from_dkms():
+        async with sirius_sdk.context(**SDK_STEWARD):
+            dkms = await sirius_sdk.ledger(DKMS_NETWORK)
+            return await dkms.load_schema(schema_id, STEWARD_DID)
+
+    try:
+        schema = await ledger_cache.schema(schema_id, load_from_dkms)
+        success = True
+    except:
+        success, schema = False, None
     if success:
         print('schema was successfully loaded')
         print(json.dumps(schema.body, indent=2, sort_keys=True))
@@ -285,6 +421,32 @@ async def load_schema(schema_id: str) -> (bool, Optional[Schema]):
     return success, schema
 
 
+async def prefetch_ledger_cache(docs: List[dict] = None):
+    """Warm ledger cache with wallet schemas, cred-defs and objects referred by governance docs"""
+    try:
+        schema_ids, cred_def_ids = [], []
+        for schema in await get_my_schemas():
+            schema_ids.append(schema.id)
+            cred_def_ids.extend(schema.cred_defs)
+        for doc in docs or []:
+            # compiled frameworks are cached as well
+            framework = compiled_frameworks.get(doc)
+            schema_ids.extend(framework.schemas.values())
+            cred_def_ids.extend(framework.cred_defs.values())
+            for condition in framework.conditions.values():
+                if condition.schema_id:
+                    schema_ids.append(condition.schema_id)
+                if condition.cred_def_id:
+                    cred_def_ids.append(condition.cred_def_id)
+        my_dids = await sirius_sdk.DID.list_my_dids_with_meta()
+        if not my_dids:
+            return
+        dkms = await sirius_sdk.ledger(DKMS_NETWORK)
+        await ledger_cache.prefetch(dkms, my_dids[0]['did'], schema_ids, cred_def_ids)
+    except Exception:
+        logging.exception('Error while prefetch ledger cache')
+
+
 async def register_cred_def(schema_id: str, tag: str, did: str):
     schemas = await get_my_schemas()
     schema = None
@@ -341,8 +503,12 @@ async def establish_connection_as_invitee(me: sirius_sdk.Pairwise.Me, my_label:
         await register_connection(p2p)
 
 
-async def issue_cred(their_did: str, values: dict, cred_def_id: str, comment: str = 'Empty comment'):
-    holder = await sirius_sdk.PairwiseList.load_for_did(their_did)
+async def prepare_issue_cred(their_did: str, values: dict, cred_def_id: str, comment: str = 'Empty comment') -> dict:
+    """Lookups before credential offer is sent, safe to retry
+
+    :return: arguments of issue_prepared_cred()
+    """
+    holder = await directory.load_for_did(their_did)
     if not holder:
         raise RuntimeError(f'Not found P2P for Their DID: {their_did}')
     tag_name = build_schema_tag_name_for_cred_def(cred_def_id)
@@ -361,26 +527,31 @@ async def issue_cred(their_did: str, values: dict, cred_def_id: str, comment: st
 
     my_did = holder.me.did
     dkms = await sirius_sdk.ledger(DKMS_NETWORK)
-    schema = await dkms.load_schema(schema.id, my_did)
-    cred_def = await dkms.load_cred_def(cred_def_id, my_did)
-    ttl = 15
+    schema, cred_def = await asyncio.gather(
+        ledger_cache.load_schema(dkms, schema.id, my_did),
+        ledger_cache.load_cred_def(dkms, cred_def_id, my_did)
+    )
     cred_id = f'{cred_def_id}:{my_did}->{their_did}'
     cred_id = hashlib.sha256(cred_id.encode()).hexdigest()
+    return {
+        'holder': holder, 'values': values, 'schema': schema, 'cred_def': cred_def,
+        'comment': comment, 'preview': preview, 'cred_id': cred_id
+    }
+
 
+async def issue_prepared_cred(holder: sirius_sdk.Pairwise, ttl: int = 15, **issue) -> bool:
+    """Run issuer state machine: offer is sent to holder at once, so it must not be retried blindly"""
     machine = sirius_sdk.aries_rfc.Issuer(holder=holder, logger=ConsoleLogger(), time_to_live=ttl)
-    success = await machine.issue(
-        values=values,
-        schema=schema,
-        cred_def=cred_def,
-        comment=comment,
-        preview=preview,
-        cred_id=cred_id
-    )
-    return success
+    return await machine.issue(**issue)
+
+
+async def issue_cred(their_did: str, values: dict, cred_def_id: str, comment: str = 'Empty comment'):
+    issue = await prepare_issue_cred(their_did, values, cred_def_id, comment)
+    return await issue_prepared_cred(**issue)
 
 
 async def verify(their_did: str, proof_request: dict) -> (bool, Optional[dict]):
-    prover = await sirius_sdk.PairwiseList.load_for_did(their_did)
+    prover = await directory.load_for_did(their_did)
     if not prover:
         raise RuntimeError(f'Not found P2P for Their DID: {their_did}')
     dkms = await sirius_sdk.ledger(DKMS_NETWORK)
@@ -398,24 +569,114 @@ async def verify(their_did: str, proof_request: dict) -> (bool, Optional[dict]):
         raise
 
 
-async def gossyp(members: list, msg: str = None):
+async def issue_cred_job(payload: dict, checkpoint: Callable[[], Awaitable]) -> dict:
+    # failures of lookups are retried by queue
+    issue = await prepare_issue_cred(payload['their_did'], payload['values'], payload['cred_def_id'], payload['comment'])
+    # offer is sent by state machine: repeated run would issue duplicate credential to holder
+    await checkpoint()
+    success = await issue_prepared_cred(**issue)
+    if not success:
+        raise RuntimeError('Issuer state machine failed')
+    return {'success': True}
+
+
+async def verify_job(payload: dict, checkpoint: Callable[[], Awaitable]) -> dict:
+    # unsuccessful verification is result, not failure
+    success, msg = await verify(payload['their_did'], proof_request=payload['proof_request'])
+    return {'success': success, 'msg': msg}
+
+
+# issue-cred and verify actions run in background, see main.job_worker
+job_queue = JobQueue(
+    settings.SQLALCHEMY_DATABASE_URL, agent=settings.SDK['p2p'].their_verkey,
+    handlers={'issue-cred': issue_cred_job, 'verify': verify_job},
+    max_attempts=settings.JOBS_MAX_ATTEMPTS, backoff=settings.JOBS_BACKOFF, lease=settings.JOBS_LEASE,
+    concurrency=settings.JOBS_CONCURRENCY, poll_interval=settings.JOBS_POLL_INTERVAL
+)
+
+
+def pick_gossyp_targets(peers: list, mode: str) -> list:
+    """pick_targets() with fan-out of settings"""
+    return pick_targets(peers, mode, settings.GOSSYP_FANOUT)
+
+
+def build_gossyp_snapshot(msg_id: str, state) -> sirius_sdk.messaging.Message:
+    """Gossyp message with whole graph state, answer of anti-entropy round"""
+    msg = sirius_sdk.messaging.Message({
+        '@id': msg_id,
+        '@type': MSG_TYP_GOSSYP,
+        **state.message
+    })
+    msg['ttl'] = 0
+    msg['graph_delta'] = state.to_graph()
+    msg['version'] = dict(state.version)
+    return msg
+
+
+async def gossyp(members: list, msg: str = None, mode: str = None):
+    """
+    :param mode: flood or epidemic, settings.GOSSYP_MODE by default
+    """
+    mode = mode or settings.GOSSYP_MODE
+    if mode == GOSSYP_MODE_EPIDEMIC and foreground_control is not None:
+        # originator state must live where anti-entropy rounds run
+        await foreground_control.send('gossyp', members=members, msg=msg, mode=mode)
+    else:
+        await originate_gossyp(members, msg, mode)
+
+
+async def originate_gossyp(members: list, msg: str = None, mode: str = None):
+    """Send new gossyp message, epidemic one is called by foreground, see gossyp()"""
+    mode = mode or settings.GOSSYP_MODE
     msg = sirius_sdk.messaging.Message({
+        '@id': uuid.uuid4().hex,
         '@type': MSG_TYP_GOSSYP,
         'members': members,
         'content': msg
     })
+    peers = []
     for member in members:
-        p2p = await sirius_sdk.PairwiseList.load_for_did(member)
+        p2p = await directory.load_for_did(member)
         if p2p:
-            await sirius_sdk.send_to(msg, p2p)
+            peers.append(p2p)
         else:
             logging.error(f'Not found P2P for DID: {member}')
-
-
-def calc_json_hash(value: Union[list, dict]) -> str:
-    js = json.dumps(value, sort_keys=True)
-    hashed = hashlib.sha256(js.encode()).hexdigest()
-    return hashed
+    if mode == GOSSYP_MODE_EPIDEMIC:
+        msg['mode'] = mode
+        msg['ttl'] = settings.GOSSYP_TTL
+        # originator takes part in anti-entropy rounds
+        await foreground_dedup.seen('gossyp:' + msg.id)
+        state = gossyp_graphs.get(msg.id)
+        state.message = {'members': members, 'content': msg['content'], 'mode': mode}
+        state.rounds = settings.GOSSYP_ANTI_ENTROPY_ROUNDS
+    for p2p in pick_gossyp_targets(peers, mode):
+        outbound.send(msg, p2p)
+
+
+async def gossyp_anti_entropy():
+    """Push-pull rounds of epidemic gossyp: send digest of message versions to random member,
+    member pulls messages it misses and pushes back contributions we miss
+    """
+    while True:
+        await asyncio.sleep(settings.GOSSYP_ANTI_ENTROPY_INTERVAL)
+        try:
+            digests = {}
+            for msg_id, state in gossyp_graphs.take_rounds():
+                peers = []
+                for did in state.message.get('members') or []:
+                    p2p = await directory.load_for_did(did)
+                    if p2p:
+                        peers.append(p2p)
+                if peers:
+                    p2p = random.choice(peers)
+                    digests.setdefault(p2p.their.did, (p2p, {}))[1][msg_id] = dict(state.version)
+            for p2p, digest in digests.values():
+                outbound.send(sirius_sdk.messaging.Message({
+                    '@type': MSG_TYP_GOSSYP_DIGEST,
+                    'digest': digest
+                }), p2p)
+        except Exception:
+            logging.exception('Error while gossyp anti-entropy round')
 
 
 async def update_graph(graph: dict, participants: dict) -> dict:
@@ -492,64 +753,229 @@ async def build_mrg_graph(my_roles: list, p2p: sirius_sdk.Pairwise) -> dict:
     }
 
 
-async def fire_route(their_did: str, route: list = None, msg_id: str = None) -> Optional[dict]:
-    p2p = await sirius_sdk.PairwiseList.load_for_did(their_did)
+async def find_route(their_did: str, topology_lookup: bool = True) -> Optional[dict]:
+    """Graph of route to DID answered locally: direct P2P or fresh path of known topology, None if unknown
+
+    :param topology_lookup: look path up in topology, originator only
+    """
+    p2p = await directory.load_for_did(their_did)
     if p2p:
         participants = {their_did: p2p}
         graph = await update_graph(graph={}, participants=participants)
         print(f'Found P2P: {their_did}')
         return graph
+    if topology_lookup:
+        first_hops = {p2p.their.did: p2p for p2p in await directory.connections()}
+        path = topology.path(list(first_hops.keys()), their_did, max_hops=settings.TRACE_MAX_HOPS - 1)
+        if path:
+            print(f'Found route in topology: {path}')
+            graph = topology.path_graph(path)
+            return await update_graph(graph=graph, participants={path[0]: first_hops[path[0]]})
+    return None
+
+
+async def fire_route(
+        their_did: str, route: list = None, msg_id: str = None, hops: int = None, deadline: float = None
+) -> Optional[dict]:
+    """Graph of route to DID if it is known, else trace request is flooded and None is returned
+
+    :param route: DIDs of hops request passed, empty for originator
+    :param hops: max hops of flooded request
+    :param deadline: unix time flooded request expires at
+    """
+    graph = await find_route(their_did, topology_lookup=not route)
+    if graph:
+        return graph
     else:
-        route = route or []
-        my_connections = await get_my_connections()
-        for p2p in my_connections:
-            if their_did not in (p2p.their.did, p2p.me.did):
-                cur_route = [item for item in route]
-                cur_route.append(p2p.me.did)
-                msg = sirius_sdk.messaging.Message({
-                    '@id': msg_id or uuid.uuid4().hex,
-                    '@type': MSG_TYP_TRACE_REQ,
-                    'route': cur_route,
-                    'did': their_did
-                })
-                await sirius_sdk.send_to(msg, p2p)
+        await flood_route(their_did, route, msg_id, hops, deadline)
         return None
 
 
-async def fire_compliance(doc, req_id):
-    my_connections = await get_my_connections()
+async def flood_route(their_did: str, route: list = None, msg_id: str = None, hops: int = None, deadline: float = None):
+    """Flood trace request to every connection, route to DID was not found locally (see find_route)"""
+    route = route or []
+    my_connections = await directory.connections()
+    hops = hops or settings.TRACE_MAX_HOPS
+    if len(route) >= hops:
+        print(f'Route to {their_did} is not found in {hops} hops')
+        return
+    msg_id = msg_id or uuid.uuid4().hex
+    if not route:
+        deadline = time.time() + settings.TRACE_TIMEOUT
+        await request_deadlines.set(msg_id, str(deadline))
+    for p2p in my_connections:
+        if their_did not in (p2p.their.did, p2p.me.did):
+            cur_route = [item for item in route]
+            cur_route.append(p2p.me.did)
+            msg = sirius_sdk.messaging.Message({
+                '@id': msg_id,
+                '@type': MSG_TYP_TRACE_REQ,
+                'route': cur_route,
+                'did': their_did,
+                'hops': hops,
+                'deadline': deadline
+            })
+            outbound.send(msg, p2p)
+
+
+# deadlines of flood requests fired by me, responses of old peers don't echo them.
+# Requests are fired by uvicorn workers, responses are decoded by events producer of __main__ process
+request_deadlines = build_dedup_store('deadlines', shared=True)
+# flood messages dropped before processing by reason
+flood_drops = {'expired': 0, 'hops': 0, 'overload': 0}
+
+
+async def is_late_response(message) -> bool:
+    """Response arrived after deadline of my request"""
+    return await flood_budget.is_late_response(message, request_deadlines)
+
+
+# P2P links learned from trace responses, gossyp and MRG graphs
+topology = TopologyStore(
+    backend=RedisTopology(settings.REDIS[0], prefix=f'{settings.REDIS_KEYS_PREFIX}:topology') if settings.REDIS else None,
+    ttl=settings.TOPOLOGY_TTL, sync_interval=settings.TOPOLOGY_SYNC_INTERVAL
+)
+# their DIDs of peers that resolve MRG docs by content hash, other peers get docs inline
+mrg_doc_peers = set()
+# their DIDs of peers that merge gossyp graph deltas, other peers get full graph
+gossyp_delta_peers = set()
+# gossyp graph states by message ID
+gossyp_graphs = GraphStore(size=settings.GOSSYP_GRAPHS_SIZE)
+
+
+def put_mrg_docs(msg: sirius_sdk.messaging.Message, docs: list, batch: bool, p2p: sirius_sdk.Pairwise):
+    """Refer governance docs by content hash, inline them for peers that may not resolve hashes"""
+    hashes = [compiled_frameworks.get(doc).hash for doc in docs]
+    for field in ['doc', 'docs', 'doc_hash', 'doc_hashes']:
+        msg.pop(field, None)
+    if batch:
+        msg['doc_hashes'] = hashes
+    else:
+        msg['doc_hash'] = hashes[0]
+    if p2p.their.did not in mrg_doc_peers:
+        if batch:
+            msg['docs'] = docs
+        else:
+            msg['doc'] = docs[0]
+
+
+def resolve_mrg_docs(msg: sirius_sdk.messaging.Message) -> (bool, Optional[list], list):
+    """Governance docs of MRG request: inline or found in local content-addressed cache
+
+    :return: batch flag, docs (None if some are missing), missing hashes
+    """
+    batch = 'docs' in msg or 'doc_hashes' in msg
+    if batch:
+        inline = msg.get('docs')
+        hashes = msg.get('doc_hashes') or []
+    else:
+        inline = [msg['doc']] if msg.get('doc') else None
+        hashes = [msg['doc_hash']] if msg.get('doc_hash') else []
+    if inline:
+        if len(hashes) == len(inline):
+            # docs are compiled once per hash, cached ones are reused without hashing
+            inline = [compiled_frameworks.intern(doc, doc_hash) for doc, doc_hash in zip(inline, hashes)]
+        return batch, inline, []
+    docs, missing = [], []
+    for doc_hash in hashes:
+        framework = compiled_frameworks.find(doc_hash)
+        if framework:
+            docs.append(framework.doc)
+        else:
+            missing.append(doc_hash)
+    if not hashes or missing:
+        return batch, None, missing
+    return batch, docs, []
+
+
+async def fire_compliance(doc: Union[dict, list], req_id):
+    """
+    :param doc: governance framework or list of frameworks evaluated together by participants
+    """
+    my_connections = await directory.connections()
+    deadline = time.time() + settings.MRG_TIMEOUT
+    await request_deadlines.set(req_id, str(deadline))
     msg = sirius_sdk.messaging.Message({
         '@id': req_id,
         '@type': MSG_TYP_MRG_REQUEST,
-        'doc': doc,
+        'deadline': deadline,
+        'hops': settings.MRG_MAX_HOPS
     })
+    batch = isinstance(doc, list)
     for p2p in my_connections:
         route = [p2p.me.did]
         msg['route'] = route
-        await sirius_sdk.send_to(msg, p2p)
+        put_mrg_docs(msg, doc if batch else [doc], batch, p2p)
+        outbound.send(msg, p2p)
+
+
+async def get_roles_matrix() -> List[dict]:
+    """Role matrix of bundled frameworks and frameworks received with MRG requests, evaluated in one pass"""
+    frameworks = {}
+    for framework in [compiled_frameworks.get(doc) for doc in [mrg_turkey, mrg_uzbekistan]] + compiled_frameworks.frameworks():
+        frameworks[framework.hash] = framework
+    granted = await role_cache.roles_matrix(list(frameworks.values()))
+    return [build_roles_matrix(framework, granted[framework.hash]) for framework in frameworks.values()]
+
+
+FLOOD_TYPES = [
+    MSG_TYP_TRACE_REQ, MSG_TYP_TRACE_RESP, MSG_TYP_GOSSYP, MSG_TYP_GOSSYP_DIGEST, MSG_TYP_GOSSYP_PULL,
+    MSG_TYP_MRG_REQUEST, MSG_TYP_MRG_RESP, MSG_TYP_MRG_DOC_REQUEST, MSG_TYP_MRG_DOC_RESP
+]
+# limits of flood traffic per peer and message type, applied by foreground
+inbound_limiter = InboundLimiter(
+    rate=settings.INBOUND_RATE, burst=settings.INBOUND_BURST, limits=settings.INBOUND_LIMITS,
+    size=settings.INBOUND_BUCKETS_SIZE
+)
+# limits tuned with /limits of uvicorn workers, foreground picks them up every INBOUND_LIMITS_POLL seconds
+shared_limits = SharedLimits(
+    settings.REDIS[0], key=f'{settings.REDIS_KEYS_PREFIX}:inbound_limits'
+) if settings.REDIS else None
+
+
+def get_event_priority(event) -> int:
+    """Interactive protocols are processed ahead of flood traffic"""
+    if event.message.type in FLOOD_TYPES:
+        return PRIORITY_FLOOD
+    else:
+        return PRIORITY_INTERACTIVE
 
 
-async def foreground():
-    cached_gossyp_ids = []
-    cached_trace_ids = []
-    cached_mrg_resp = []
+async def foreground(group_id: str = None, accept: Callable[..., Awaitable[bool]] = None):
+    """Process incoming protocol events
+
+    :param group_id: consumer group shared by replicas, every event is delivered to one of them
+    :param accept: coroutine function that filters events this consumer is responsible for
+    """
     try:
         await sirius_sdk.AnonCreds.prover_create_master_secret(MASTER_SECRET_ID)
     except AnoncredsMasterSecretDuplicateNameError as e:
         pass
     my_endpoint = await get_my_endpoint()
     dkms = await sirius_sdk.ledger(DKMS_NETWORK)
-    listener = await sirius_sdk.subscribe()  # group_id='IPG_DEMO_FOREGROUND'
-    async for event in listener:
+    asyncio.ensure_future(prefetch_ledger_cache([mrg_turkey, mrg_uzbekistan]))
+    asyncio.ensure_future(credential_index.load(force=True))
+    # MRG requests waiting for docs: doc hash -> (fetch stamp, events)
+    pending_mrg_docs = {}
+
+    def evict_pending_mrg_docs():
+        """Drop expired requests and fetches that got no answer in MRG_DOC_FETCH_TIMEOUT"""
+        now = time.monotonic()
+        for doc_hash, (stamp, waiting) in list(pending_mrg_docs.items()):
+            waiting[:] = [item for item in waiting if check_flood_budget(item.message) is None]
+            if not waiting or now - stamp > settings.MRG_DOC_FETCH_TIMEOUT:
+                del pending_mrg_docs[doc_hash]
+
+    async def process_event(event):
         if isinstance(event.message, sirius_sdk.aries_rfc.ConnRequest):
             # check if it is self invitation
-            found_identities = await get_my_identities(verkey=event.sender_verkey)
-            if found_identities:
+            found_identity = await directory.identity(verkey=event.sender_verkey)
+            if found_identity:
                 logging.error('Mistake: you sent invitation to yourself!')
             else:
-                found_identities = await get_my_identities(verkey=event.recipient_verkey)
-                if found_identities:
-                    my_identity = found_identities[0]['tags']
+                found_identity = await directory.identity(verkey=event.recipient_verkey)
+                if found_identity:
+                    my_identity = found_identity['tags']
                     me = sirius_sdk.Pairwise.Me(
                         did=my_identity['did'],
                         verkey=my_identity['verkey']
@@ -592,142 +1018,307 @@ async def foreground():
             print(json.dumps(event.message, indent=2, sort_keys=True))
             route = event.message.get('route', [])
             route_as_set = list(set(route))
-            if event.message.id in cached_trace_ids:
-                print('Ignore trace request')
-            elif len(route) != len(route_as_set):
+            if len(route) != len(route_as_set):
                 print('Ignore trace request cause of Loop')
+            elif await foreground_dedup.seen('trace:' + event.message.id):
+                print('Ignore trace request')
             else:
-                cached_trace_ids.append(event.message.id)
                 did = event.message.get('did', None)
                 route = event.message.get('route', [])
                 if did and route:
-                    p2p = await sirius_sdk.PairwiseList.load_for_did(did)
+                    p2p = await directory.load_for_did(did)
                     if p2p:
                         print('Found P2P, make route response')
                         graph = await fire_route(did, route, msg_id=event.message.id)
                         prev_did = route[-1]
-                        prev_p2p = await sirius_sdk.PairwiseList.load_for_did(prev_did)
+                        prev_p2p = await directory.load_for_did(prev_did)
                         if prev_p2p:
                             resp = sirius_sdk.messaging.Message({
                                 '@id': event.message.id,
                                 '@type': MSG_TYP_TRACE_RESP,
                                 'route': route,
                                 'did': did,
-                                'graph': graph
+                                'graph': graph,
+                                'deadline': event.message.get('deadline')
                             })
-                            await sirius_sdk.send_to(resp, prev_p2p)
+                            outbound.send(resp, prev_p2p)
                         else:
                             print(f'Not found prev_p2p for DID: {prev_did}')
                     else:
-                        await fire_route(did, route, msg_id=event.message.id)
+                        # old peers don't send hops limit, count it from here
+                        hops = event.message.get('hops') or len(route) + settings.TRACE_MAX_HOPS
+                        await fire_route(did, route, msg_id=event.message.id, hops=hops, deadline=event.message.get('deadline'))
 
         elif event.message.type == MSG_TYP_TRACE_RESP:
             print(f'========== Received Route Response============')
             print(json.dumps(event.message, indent=2, sort_keys=True))
+            topology.add_graph(event.message.get('graph'))
             route = event.message.get('route', [])
             prev_route = []
             for did in route:
-                p2p = await sirius_sdk.PairwiseList.load_for_did(did)
+                p2p = await directory.load_for_did(did)
                 if p2p:
                     print(f'found p2p for did: {did}')
                     if prev_route:
                         prev_did = prev_route[-1]
                         print(f'prev route did: {prev_did}')
-                        prev_p2p = await sirius_sdk.PairwiseList.load_for_did(prev_did)
+                        prev_p2p = await directory.load_for_did(prev_did)
                         if prev_p2p:
-                            await sirius_sdk.send_to(event.message, prev_p2p)
+                            outbound.send(event.message, prev_p2p)
                         else:
                             print(f'not found p2p for did: {prev_did}')
                 else:
                     prev_route.append(did)
         elif event.message.type == MSG_TYP_GOSSYP:
-            if event.message.id not in cached_gossyp_ids:
-                print(f'========== Re-Raise Gossyp Message with ID: {event.message.id}')
-                cached_gossyp_ids.append(event.message.id)
-                members = event.message.get('members', [])
-                reraise_members = {}
-                for did in members:
-                    p2p = await sirius_sdk.PairwiseList.load_for_did(did)
-                    if p2p:
-                        reraise_members[did] = p2p
-                print('Re-Raise members: ' + str(list(reraise_members.keys())))
-                old_graph_hash = None
-                new_graph_hash = None
-                if reraise_members:
-                    graph = event.message.get('graph', {})
-                    old_graph_hash = calc_json_hash(graph)
-                    graph = await update_graph(graph, reraise_members)
-                    new_graph_hash = calc_json_hash(graph)
-                    event.message['graph'] = graph
-                for did, p2p in reraise_members.items():
-                    if did in (event.pairwise.their.did, event.pairwise.me.did):
-                        pass
-                    else:
-                        await sirius_sdk.send_to(event.message, p2p)
+            if 'graph_delta' in event.message:
+                gossyp_delta_peers.add(event.pairwise.their.did)
+            seen = await foreground_dedup.seen('gossyp:' + event.message.id)
+            state = gossyp_graphs.get(event.message.id)
+            version = event.message.get('version') or {}
+            if seen and state.dominates(version):
+                print(f'Ignore Gossyp Message with ID: {event.message.id} cause of nothing new')
+                return
+            graph = event.message.get('graph_delta') or event.message.get('graph') or {}
+            delta = state.merge(graph.get('nodes', []), graph.get('links', []), version)
+            topology.add_graph(delta)
+            members = event.message.get('members', [])
+            reraise_members = {}
+            for did in members:
+                p2p = await directory.load_for_did(did)
+                if p2p:
+                    reraise_members[did] = p2p
+            if reraise_members:
+                own = await update_graph({}, reraise_members)
+                own_delta = state.merge(own['nodes'], own['links'])
+                if not is_empty_delta(own_delta):
+                    state.bump(event.pairwise.me.did)
+                delta = join_deltas(delta, own_delta)
+            if seen and is_empty_delta(delta):
+                print(f'Ignore Gossyp Message with ID: {event.message.id} cause of graph is not changed')
+                return
+            mode = event.message.get('mode', GOSSYP_MODE_FLOOD)
+            if not seen:
+                state.message = {key: event.message.get(key) for key in ['members', 'content', 'mode']}
+                if mode == GOSSYP_MODE_EPIDEMIC:
+                    state.rounds = settings.GOSSYP_ANTI_ENTROPY_ROUNDS
+            peers = [
+                p2p for did, p2p in reraise_members.items()
+                if did not in (event.pairwise.their.did, event.pairwise.me.did)
+            ]
+            msg = sirius_sdk.messaging.Message(dict(event.message))
+            msg['graph_delta'] = delta
+            msg['version'] = state.version
+            if mode == GOSSYP_MODE_EPIDEMIC:
+                ttl = int(event.message.get('ttl', 0))
+                peers = pick_gossyp_targets(peers, mode) if ttl > 1 else []
+                msg['ttl'] = ttl - 1
+            print(f'========== Re-Raise Gossyp Message with ID: {event.message.id}, graph hash: {state.hash}')
+            print('Re-Raise members: ' + str([p2p.their.did for p2p in peers]))
+            for p2p in peers:
+                if p2p.their.did in gossyp_delta_peers:
+                    msg.pop('graph', None)
+                else:
+                    # peer may not merge deltas
+                    msg['graph'] = state.to_graph()
+                outbound.send(msg, p2p)
+        elif event.message.type == MSG_TYP_GOSSYP_DIGEST:
+            pull, push = gossyp_graphs.reconcile(event.message.get('digest') or {})
+            for msg_id, state in push:
+                outbound.send(build_gossyp_snapshot(msg_id, state), event.pairwise)
+            if pull:
+                outbound.send(sirius_sdk.messaging.Message({
+                    '@type': MSG_TYP_GOSSYP_PULL,
+                    'ids': pull
+                }), event.pairwise)
+        elif event.message.type == MSG_TYP_GOSSYP_PULL:
+            for msg_id in event.message.get('ids') or []:
+                state = gossyp_graphs.find(msg_id)
+                if state is not None and state.message is not None:
+                    outbound.send(build_gossyp_snapshot(msg_id, state), event.pairwise)
         elif event.message.type == MSG_TYP_MRG_REQUEST:
             print(f'========== Received MRG request with ID: {event.message.id}')
-            doc = event.message.get('doc')
-            if doc:
-                roles = await extract_my_roles(doc)
+            init_route = event.message.get('route', [])
+            route_as_set = list(set(init_route))
+            if len(init_route) != len(route_as_set):
+                print('Ignore MRG request cause of Loop')
+                return
+            if event.message.get('doc_hash') or event.message.get('doc_hashes'):
+                mrg_doc_peers.add(event.pairwise.their.did)
+            batch, resolved, missing = resolve_mrg_docs(event.message)
+            evict_pending_mrg_docs()
+            for doc_hash in missing:
+                # fetch doc from previous hop, request is processed again when doc is received
+                stamp, waiting = pending_mrg_docs.get(doc_hash, (None, []))
+                if stamp is None:
+                    print(f'Fetch MRG doc with hash: {doc_hash}')
+                    outbound.send(sirius_sdk.messaging.Message({
+                        '@type': MSG_TYP_MRG_DOC_REQUEST,
+                        'doc_hash': doc_hash
+                    }), event.pairwise)
+                    stamp = time.monotonic()
+                if event not in waiting:
+                    waiting.append(event)
+                pending_mrg_docs[doc_hash] = (stamp, waiting)
+            if missing:
+                return
+            docs = resolved if batch and resolved else None
+            doc = resolved[0] if not batch and resolved else None
+            if doc or docs:
+                matrix = None
+                try:
+                    if docs:
+                        granted = await extract_roles_matrix(docs)
+                        matrix = [build_roles_matrix(framework, roles) for framework, roles in granted]
+                        roles = [f'{framework.name}: {role}' for framework, roles in granted for role in roles]
+                    else:
+                        roles = await extract_my_roles(doc)
+                except GovernanceError as e:
+                    print(f'Ignore MRG request cause of invalid doc: {e}')
+                    return
                 graph = await build_mrg_graph(roles, event.pairwise)
 
-                init_route = event.message.get('route', [])
-                route_as_set = list(set(init_route))
-                if len(init_route) != len(route_as_set):
-                    print('Ignore MRG request cause of Loop')
-                else:
-                    msg = sirius_sdk.messaging.Message({
-                        '@id': event.message.id,
-                        '@type': MSG_TYP_MRG_RESP,
-                        'graph': graph,
-                        'route': init_route
-                    })
-                    await sirius_sdk.send_to(msg, event.pairwise)
-                    my_connections = await get_my_connections()
-
-                    req = sirius_sdk.messaging.Message({
-                        '@id': event.message.id,
-                        '@type': MSG_TYP_MRG_REQUEST,
-                        'doc': doc
-                    })
-                    print('re-send to participants')
-                    for p2p in my_connections:
-                        if p2p.their.did != event.pairwise.their.did:
-                            route = [item for item in init_route]
-                            route.append(p2p.me.did)
-                            req['route'] = route
-                            await sirius_sdk.send_to(req, p2p)
+                msg = sirius_sdk.messaging.Message({
+                    '@id': event.message.id,
+                    '@type': MSG_TYP_MRG_RESP,
+                    'graph': graph,
+                    'route': init_route,
+                    'deadline': event.message.get('deadline')
+                })
+                if matrix is not None:
+                    msg['matrix'] = matrix
+                outbound.send(msg, event.pairwise)
+                hops = event.message.get('hops')
+                if hops and len(init_route) >= int(hops):
+                    print(f'MRG request with ID: {event.message.id} is not re-sent cause of hops limit')
+                    return
+                my_connections = await directory.connections()
+
+                req = sirius_sdk.messaging.Message({
+                    '@id': event.message.id,
+                    '@type': MSG_TYP_MRG_REQUEST,
+                    'deadline': event.message.get('deadline'),
+                    'hops': hops
+                })
+                print('re-send to participants')
+                for p2p in my_connections:
+                    if p2p.their.did != event.pairwise.their.did:
+                        route = [item for item in init_route]
+                        route.append(p2p.me.did)
+                        req['route'] = route
+                        put_mrg_docs(req, docs or [doc], bool(docs), p2p)
+                        outbound.send(req, p2p)
             else:
                 print('---- DOC is empty ---')
+        elif event.message.type == MSG_TYP_MRG_DOC_REQUEST:
+            mrg_doc_peers.add(event.pairwise.their.did)
+            doc_hash = event.message.get('doc_hash')
+            framework = compiled_frameworks.find(doc_hash) if doc_hash else None
+            print(f'========== Received MRG doc request for hash: {doc_hash}, found: {framework is not None}')
+            outbound.send(sirius_sdk.messaging.Message({
+                '@type': MSG_TYP_MRG_DOC_RESP,
+                'doc_hash': doc_hash,
+                'doc': framework.doc if framework else None,
+                '~thread': {'thid': event.message.id}
+            }), event.pairwise)
+        elif event.message.type == MSG_TYP_MRG_DOC_RESP:
+            doc_hash = event.message.get('doc_hash')
+            doc = event.message.get('doc')
+            # requests waiting for doc are dropped if peer can't give it
+            _, waiting = pending_mrg_docs.pop(doc_hash, (None, []))
+            if not doc or calc_doc_hash(doc) != doc_hash:
+                print(f'MRG doc with hash {doc_hash} is not resolved, drop {len(waiting)} waiting requests')
+                return
+            try:
+                compiled_frameworks.get(doc)
+            except GovernanceError as e:
+                print(f'Ignore MRG doc cause of invalid doc: {e}')
+                return
+            for waiting_event in waiting:
+                # request might expire while doc was fetched
+                if check_flood_budget(waiting_event.message) is None:
+                    await process_event(waiting_event)
         elif event.message.type == MSG_TYP_MRG_RESP:
             print(f'========== Received MRG response with ID: {event.message.id}')
             print(json.dumps(event.message, indent=2, sort_keys=True))
+            topology.add_graph(event.message.get('graph'))
 
             route = event.message.get('route', [])
             route_as_set = list(set(route))
-            if event.message.id in cached_mrg_resp:
-                print('Ignore MRG response cause of duplicate msg.id')
-            elif len(route) != len(route_as_set):
+            if len(route) != len(route_as_set):
                 print('Ignore MRG response cause of Loop')
+            elif await foreground_dedup.seen('mrg_resp:' + event.message.id):
+                print('Ignore MRG response cause of duplicate msg.id')
             else:
-                cached_mrg_resp.append(event.message.id)
                 prev_route = []
-                my_conns = await get_my_connections()
                 for did in route:
-                    search = [p2p for p2p in my_conns if p2p.me.did == did]
-                    if search:
-                        p2p = search[0]
-                    else:
-                        p2p = None
+                    p2p = await directory.connection(my_did=did)
                     if p2p:
                         print(f'found p2p for did: {did}')
                         if prev_route:
                             prev_did = prev_route[-1]
                             print(f'prev route did: {prev_did}')
-                            prev_p2p = await sirius_sdk.PairwiseList.load_for_did(prev_did)
+                            prev_p2p = await directory.load_for_did(prev_did)
                             if prev_p2p:
-                                await sirius_sdk.send_to(event.message, prev_p2p)
+                                outbound.send(event.message, prev_p2p)
                             else:
                                 print(f'not found p2p for did: {prev_did}')
                     else:
-                        prev_route.append(did)
\ No newline at end of file
+                        prev_route.append(did)
+
+    dispatcher = EventDispatcher(settings.FOREGROUND_CONCURRENCY, settings.FOREGROUND_LANE_SIZE)
+    dispatcher.start()
+    anti_entropy = asyncio.ensure_future(gossyp_anti_entropy())
+
+    async def build_report():
+        return {
+            'group_id': group_id,
+            'dedup': await foreground_dedup.stats(),
+            'flood_drops': dict(flood_drops),
+            'outbound': outbound.stats(),
+            'dispatcher': {'pending': dispatcher.pending, 'dropped': dispatcher.dropped},
+            'inbound': dict(inbound_limiter.stats(), limits=inbound_limiter.limits())
+        }
+
+    control = None
+    if foreground_control is not None:
+        control = asyncio.ensure_future(foreground_control.run({'gossyp': originate_gossyp}))
+    limits = None
+    if shared_limits is not None:
+        limits = asyncio.ensure_future(shared_limits.run(inbound_limiter.apply, settings.INBOUND_LIMITS_POLL))
+    reporter = None
+    if foreground_reports is not None:
+        reporter = asyncio.ensure_future(foreground_reports.run(
+            f'{socket.gethostname()}:{os.getpid()}', build_report, settings.STATS_REPORT_INTERVAL
+        ))
+    try:
+        listener = await sirius_sdk.subscribe(group_id=group_id)
+        async for event in listener:
+            # events of other partitions must not spend limits and budgets of this one
+            if accept is not None and not await accept(event):
+                continue
+            if event.message.type in FLOOD_TYPES:
+                peer = event.pairwise.their.did if event.pairwise else event.sender_verkey
+                if not inbound_limiter.allow(peer, event.message.type):
+                    # counted by limiter, printing every dropped message would cost as much as flood itself
+                    continue
+            # drop stale flood traffic before any wallet or ledger work
+            reason = check_flood_budget(event.message)
+            if reason:
+                flood_drops[reason] += 1
+                print(f'Drop {event.message.type} with ID: {event.message.id} cause of {reason}')
+                continue
+            submitted = await dispatcher.submit(
+                get_event_priority(event), get_event_thread_key(event), functools.partial(process_event, event)
+            )
+            if not submitted:
+                # flood lane is full, waiting for it would stall interactive events behind
+                flood_drops['overload'] += 1
+    finally:
+        anti_entropy.cancel()
+        if reporter is not None:
+            reporter.cancel()
+        if control is not None:
+            control.cancel()
+        if limits is not None:
+            limits.cancel()
+        await dispatcher.stop()
@@ -0,0 +1,170 @@
+import copy
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Callable, Awaitable, Dict
+
+import sirius_sdk
+
+
+class PeerStats:
+    """Delivery counters and circuit state of single peer"""
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.latency_avg = None
+        self.latency_max = 0.0
+        self.failures_in_row = 0
+        self.opened_until = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_until is None:
+            return 'closed'
+        elif time.monotonic() < self.opened_until:
+            return 'open'
+        else:
+            return 'half-open'
+
+    def to_json(self) -> dict:
+        return {
+            'state': self.state,
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'skipped': self.skipped,
+            'dropped': self.dropped,
+            'latency_avg': self.latency_avg,
+            'latency_max': self.latency_max
+        }
+
+
+class OutboundDispatcher:
+    """Sends DIDComm messages in background with bounded concurrency
+
+    Every peer has its own queue, so messages to the same peer keep order
+    and slow peer doesn't hold back the others. Every attempt is limited
+    by timeout and retried with exponential backoff. After failure_threshold
+    failed deliveries in a row peer circuit is open: messages to the peer are
+    skipped for recovery_time seconds, then single probe delivery decides
+    whether to close circuit again.
+    """
+
+    def __init__(
+            self, concurrency: int = 20, timeout: float = 15, retries: int = 2, backoff: float = 0.5,
+            queue_size: int = 100, failure_threshold: int = 3, recovery_time: float = 30,
+            sender: Callable[..., Awaitable] = None
+    ):
+        """
+        :param concurrency: max sends in progress at the same time (per event loop)
+        :param timeout: deadline of single send attempt, seconds
+        :param retries: extra attempts after failed one
+        :param backoff: delay before first retry, doubled on every next one, seconds
+        :param queue_size: max messages queued per peer, newest are dropped above
+        :param failure_threshold: failed deliveries in a row that open peer circuit
+        :param recovery_time: how long circuit stays open, seconds
+        :param sender: coroutine function (message, p2p), sirius_sdk.send_to by default
+        """
+        self.__concurrency = concurrency
+        self.__timeout = timeout
+        self.__retries = retries
+        self.__backoff = backoff
+        self.__queue_size = queue_size
+        self.__failure_threshold = failure_threshold
+        self.__recovery_time = recovery_time
+        self.__sender = sender or sirius_sdk.send_to
+        # stats are shared by uvicorn loop and foreground thread
+        self.__lock = threading.Lock()
+        self.__stats: Dict[str, PeerStats] = {}
+        # queues, workers and semaphore are bound to event loop
+        self.__loops = {}
+
+    def send(self, message: sirius_sdk.messaging.Message, p2p: sirius_sdk.Pairwise) -> bool:
+        """Queue message to peer, returns False if message is skipped (open circuit) or dropped (full queue)
+
+        Message is copied, so caller may modify it for the next peer
+        """
+        peer = p2p.their.did
+        with self.__lock:
+            stats = self.__stats.setdefault(peer, PeerStats())
+            if stats.state == 'open':
+                stats.skipped += 1
+                return False
+        queues, workers, _ = self.__loop_state()
+        queue = queues.setdefault(peer, deque())
+        if len(queue) >= self.__queue_size:
+            with self.__lock:
+                stats.dropped += 1
+            logging.warning(f'Outbound queue of {peer} is full, message dropped')
+            return False
+        queue.append((copy.deepcopy(message), p2p))
+        if peer not in workers:
+            workers[peer] = asyncio.ensure_future(self.__worker(peer))
+        return True
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {peer: stats.to_json() for peer, stats in self.__stats.items()}
+
+    def __loop_state(self) -> tuple:
+        loop = asyncio.get_event_loop()
+        state = self.__loops.get(id(loop))
+        if state is None:
+            state = ({}, {}, asyncio.Semaphore(self.__concurrency))
+            self.__loops[id(loop)] = state
+        return state
+
+    async def __worker(self, peer: str):
+        queues, workers, semaphore = self.__loop_state()
+        queue = queues[peer]
+        try:
+            while queue:
+                message, p2p = queue.popleft()
+                with self.__lock:
+                    stats = self.__stats[peer]
+                    if stats.state == 'open':
+                        stats.skipped += 1
+                        continue
+                async with semaphore:
+                    await self.__deliver(peer, message, p2p)
+        finally:
+            del workers[peer]
+
+    async def __deliver(self, peer: str, message: sirius_sdk.messaging.Message, p2p: sirius_sdk.Pairwise):
+        stats = self.__stats[peer]
+        for attempt in range(self.__retries + 1):
+            if attempt > 0:
+                with self.__lock:
+                    stats.retried += 1
+                await asyncio.sleep(self.__backoff * 2 ** (attempt - 1))
+            stamp = time.monotonic()
+            try:
+                await asyncio.wait_for(self.__sender(message, p2p), timeout=self.__timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f'Send to {peer} failed, attempt {attempt + 1}: {repr(e)}')
+                continue
+            latency = time.monotonic() - stamp
+            with self.__lock:
+                stats.sent += 1
+                stats.failures_in_row = 0
+                stats.opened_until = None
+                stats.latency_max = max(stats.latency_max, latency)
+                if stats.latency_avg is None:
+                    stats.latency_avg = latency
+                else:
+                    stats.latency_avg = 0.8 * stats.latency_avg + 0.2 * latency
+            return
+        with self.__lock:
+            stats.failed += 1
+            stats.failures_in_row += 1
+            if stats.state == 'half-open' or stats.failures_in_row >= self.__failure_threshold:
+                stats.opened_until = time.monotonic() + self.__recovery_time
+                logging.warning(f'Circuit of {peer} is open for {self.__recovery_time} sec')
@@ -0,0 +1,57 @@
+import zlib
+import logging
+
+import aioredis
+
+from dispatcher import get_event_thread_key
+
+
+def get_partition(key: str, partitions: int) -> int:
+    """Stable across processes, unlike hash()"""
+    return zlib.crc32(key.encode()) % partitions
+
+
+def get_claim_key(event) -> str:
+    """Message IDs are set by senders and response may reuse ID of request, so key is (type, sender, ID)"""
+    sender = get_event_thread_key(event)[0] or ''
+    return f'{event.message.type}:{sender}:{event.message.id}'
+
+
+class PartitionFilter:
+    """Accept events of own partition, drop events already claimed by any replica"""
+
+    def __init__(self, partitions: int, partition: int, redis_address: str = None, prefix: str = '', ttl: int = 3600):
+        """
+        :param redis_address: Redis to claim processed events, deduplication is off if None
+        :param prefix: prefix of claim keys in Redis
+        :param ttl: how long claimed event is remembered, seconds
+        """
+        self.partitions = partitions
+        self.partition = partition
+        self.__redis_address = redis_address
+        self.__prefix = prefix
+        self.__ttl = ttl
+        self.__redis = None
+
+    async def __call__(self, event) -> bool:
+        key = get_event_thread_key(event)[0] or ''
+        if get_partition(key, self.partitions) != self.partition:
+            return False
+        if not event.message.id:
+            return True
+        return await self.claim(get_claim_key(event))
+
+    async def claim(self, claim_key: str) -> bool:
+        if not self.__redis_address:
+            return True
+        try:
+            if self.__redis is None or self.__redis.closed:
+                self.__redis = await aioredis.create_redis_pool('redis://' + self.__redis_address)
+            return await self.__redis.set(
+                f'{self.__prefix}:consumed:{claim_key}', self.partition,
+                expire=self.__ttl, exist=aioredis.Redis.SET_IF_NOT_EXIST
+            )
+        except Exception:
+            # Redis is down: better process twice than lose the event
+            logging.exception('Error while claiming event')
+            return True
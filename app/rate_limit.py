@@ -0,0 +1,95 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Tuple
+
+
+class TokenBucket:
+
+    def __init__(self, burst: float):
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def take(self, rate: float, burst: float) -> bool:
+        now = time.monotonic()
+        self.tokens = min(burst, self.tokens + (now - self.stamp) * rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class InboundLimiter:
+    """Token buckets of inbound messages per (peer, message type)
+
+    Every message type has its own rate (messages per second) and burst,
+    types without own limits share default ones, types out of limits at all
+    (limited=False) are never dropped. Limits may be changed at runtime,
+    buckets keep their tokens and pick new limits up on next message.
+    """
+
+    def __init__(self, rate: float = 20, burst: float = 50, limits: Dict[str, Tuple[float, float]] = None, size: int = 10000):
+        """
+        :param rate: default messages per second of single peer
+        :param burst: default bucket capacity
+        :param limits: message type -> (rate, burst)
+        :param size: buckets kept, least recently used are evicted above
+        """
+        self.__default = (rate, burst)
+        self.__limits = dict(limits or {})
+        self.__size = size
+        # limiter is shared by uvicorn loop and foreground thread
+        self.__lock = threading.Lock()
+        self.__buckets = OrderedDict()
+        # (peer, message type) -> dropped messages
+        self.__dropped = {}
+        self.allowed = 0
+
+    def allow(self, peer: str, msg_type: str) -> bool:
+        key = (peer, msg_type)
+        with self.__lock:
+            rate, burst = self.__limits.get(msg_type, self.__default)
+            bucket = self.__buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(burst)
+                self.__buckets[key] = bucket
+                while len(self.__buckets) > self.__size:
+                    self.__buckets.popitem(last=False)
+            else:
+                self.__buckets.move_to_end(key)
+            if bucket.take(rate, burst):
+                self.allowed += 1
+                return True
+            self.__dropped[key] = self.__dropped.get(key, 0) + 1
+            return False
+
+    def configure(self, msg_type: Optional[str], rate: float, burst: float):
+        """Set limits of message type, default ones if type is None"""
+        if rate <= 0 or burst < 1:
+            raise ValueError('rate must be positive and burst at least 1')
+        with self.__lock:
+            if msg_type is None:
+                self.__default = (rate, burst)
+            else:
+                self.__limits[msg_type] = (rate, burst)
+
+    def apply(self, limits: Dict[Optional[str], Tuple[float, float]]):
+        """Set limits of several message types at once, None is for default limits"""
+        for msg_type, (rate, burst) in limits.items():
+            self.configure(msg_type, rate, burst)
+
+    def limits(self) -> dict:
+        with self.__lock:
+            rate, burst = self.__default
+            return {
+                'default': {'rate': rate, 'burst': burst},
+                'types': {msg_type: {'rate': rate, 'burst': burst} for msg_type, (rate, burst) in self.__limits.items()}
+            }
+
+    def stats(self) -> dict:
+        with self.__lock:
+            dropped = {}
+            for (peer, msg_type), count in self.__dropped.items():
+                dropped.setdefault(peer, {})[msg_type] = count
+            return {'allowed': self.allowed, 'buckets': len(self.__buckets), 'dropped': dropped}
@@ -65,6 +65,112 @@ TEST_SQLALCHEMY_DATABASE_URL = \
     f"postgresql://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_HOST}:{DATABASE_PORT}/{TEST_DATABASE_NAME}"
 IS_PRODUCTION = os.getenv('PROD', None) in ['on', 'yes']
 
+# Cabinet snapshot max age (seconds): foreground consumer and uvicorn workers live
+# in different processes and can't invalidate each other caches
+CABINET_SNAPSHOT_TTL = int(os.getenv('CABINET_SNAPSHOT_TTL', 30))
+# Records per wallet_search round trip while iterating wallet collections
+WALLET_SEARCH_BATCH = int(os.getenv('WALLET_SEARCH_BATCH', 100))
+# Connections/credentials rendered with cabinet page, others are loaded by browser page by page
+CABINET_PAGE_SIZE = int(os.getenv('CABINET_PAGE_SIZE', 50))
+# How long search behind /records cursor is kept in memory (seconds), expired cursor re-runs search
+WALLET_PAGES_TTL = int(os.getenv('WALLET_PAGES_TTL', 300))
+# How long directory trusts that DID/verkey is unknown (records may be created by other process)
+DIRECTORY_MISS_TTL = int(os.getenv('DIRECTORY_MISS_TTL', 30))
+# Max age of in-memory directory (seconds), it is reloaded to pick up records of other processes
+DIRECTORY_TTL = int(os.getenv('DIRECTORY_TTL', 300))
+# Ledger schemas/cred-defs kept in process memory in front of memcached
+LEDGER_CACHE_SIZE = int(os.getenv('LEDGER_CACHE_SIZE', 1000))
+# foreground(): events processed concurrently and max pending events per priority lane
+FOREGROUND_CONCURRENCY = int(os.getenv('FOREGROUND_CONCURRENCY', 20))
+FOREGROUND_LANE_SIZE = int(os.getenv('FOREGROUND_LANE_SIZE', 1000))
+# Standalone consumers remember processed events to skip redelivered ones, seconds
+CONSUMER_DEDUP_TTL = int(os.getenv('CONSUMER_DEDUP_TTL', 3600))
+# Processed flood messages IDs store: memory (per process) or redis (shared by workers, survives restarts)
+DEDUP_BACKEND = os.getenv('DEDUP_BACKEND', 'memory')
+# How long message ID is remembered, seconds, and max IDs kept by memory backend
+DEDUP_TTL = int(os.getenv('DEDUP_TTL', 3600))
+DEDUP_MAX_SIZE = int(os.getenv('DEDUP_MAX_SIZE', 10000))
+# Foreground processes publish stats to Redis every interval for /stats of uvicorn workers,
+# report not refreshed for ttl seconds is dropped (process is gone)
+STATS_REPORT_INTERVAL = int(os.getenv('STATS_REPORT_INTERVAL', 5))
+STATS_REPORT_TTL = int(os.getenv('STATS_REPORT_TTL', 60))
+# Outbound messages to peers: concurrent sends, deadline of send attempt (sec), retries and first retry delay (sec)
+OUTBOUND_CONCURRENCY = int(os.getenv('OUTBOUND_CONCURRENCY', 20))
+OUTBOUND_TIMEOUT = float(os.getenv('OUTBOUND_TIMEOUT', 15))
+OUTBOUND_RETRIES = int(os.getenv('OUTBOUND_RETRIES', 2))
+OUTBOUND_BACKOFF = float(os.getenv('OUTBOUND_BACKOFF', 0.5))
+# Max messages queued per peer
+OUTBOUND_QUEUE_SIZE = int(os.getenv('OUTBOUND_QUEUE_SIZE', 100))
+# Peer is skipped for recovery time (sec) after failed deliveries in a row
+OUTBOUND_FAILURE_THRESHOLD = int(os.getenv('OUTBOUND_FAILURE_THRESHOLD', 3))
+OUTBOUND_RECOVERY_TIME = float(os.getenv('OUTBOUND_RECOVERY_TIME', 30))
+# MRG requests waiting for doc from previous hop are dropped if it is not received in time, seconds
+MRG_DOC_FETCH_TIMEOUT = int(os.getenv('MRG_DOC_FETCH_TIMEOUT', 30))
+# Gossyp graphs kept in memory, one per message ID
+GOSSYP_GRAPHS_SIZE = int(os.getenv('GOSSYP_GRAPHS_SIZE', 1000))
+# Gossyp mode: flood (re-raise to every member) or epidemic (re-raise to fan-out random members while TTL hops left,
+# then push-pull anti-entropy rounds with random member every interval, seconds)
+GOSSYP_MODE = os.getenv('GOSSYP_MODE', 'flood')
+GOSSYP_FANOUT = int(os.getenv('GOSSYP_FANOUT', 3))
+GOSSYP_TTL = int(os.getenv('GOSSYP_TTL', 6))
+GOSSYP_ANTI_ENTROPY_ROUNDS = int(os.getenv('GOSSYP_ANTI_ENTROPY_ROUNDS', 2))
+GOSSYP_ANTI_ENTROPY_INTERVAL = float(os.getenv('GOSSYP_ANTI_ENTROPY_INTERVAL', 5))
+# Topology of P2P links learned from trace, gossyp and MRG graphs is shared by processes through Redis:
+# link freshness and min delay between background syncs, seconds
+TOPOLOGY_TTL = float(os.getenv('TOPOLOGY_TTL', 600))
+TOPOLOGY_SYNC_INTERVAL = float(os.getenv('TOPOLOGY_SYNC_INTERVAL', 10))
+# Max hops of route: path search over known topology and trace request flood
+TRACE_MAX_HOPS = int(os.getenv('TRACE_MAX_HOPS', 6))
+# Flood requests expire after timeout, seconds: relays drop them and originator ignores late responses
+TRACE_TIMEOUT = float(os.getenv('TRACE_TIMEOUT', 30))
+MRG_TIMEOUT = float(os.getenv('MRG_TIMEOUT', 60))
+# Max hops of MRG request flood
+MRG_MAX_HOPS = int(os.getenv('MRG_MAX_HOPS', 6))
+# MRG responses are merged by request and pushed to browser every window, seconds;
+# request is complete when no responses arrived for settle time, seconds
+MRG_AGGREGATE_WINDOW = float(os.getenv('MRG_AGGREGATE_WINDOW', 1))
+MRG_SETTLE_TIME = float(os.getenv('MRG_SETTLE_TIME', 5))
+# MRG requests aggregated in memory, merged graphs of older ones are kept in dedup store
+MRG_AGGREGATES_SIZE = int(os.getenv('MRG_AGGREGATES_SIZE', 100))
+# Inbound flood traffic (trace, gossyp, MRG) of every peer is limited per message type with token bucket:
+# messages per second and burst, per type overrides as JSON {"<message type>": [rate, burst]}, buckets kept
+INBOUND_RATE = float(os.getenv('INBOUND_RATE', 20))
+INBOUND_BURST = float(os.getenv('INBOUND_BURST', 50))
+INBOUND_LIMITS = {msg_type: tuple(limits) for msg_type, limits in json.loads(os.getenv('INBOUND_LIMITS', '{}')).items()}
+INBOUND_BUCKETS_SIZE = int(os.getenv('INBOUND_BUCKETS_SIZE', 10000))
+# How often foreground picks up limits tuned with /limits, seconds
+INBOUND_LIMITS_POLL = int(os.getenv('INBOUND_LIMITS_POLL', 5))
+# POST / actions admission: concurrency and queue size per action as JSON {"<action>": [concurrency, queue size]}.
+# Gates live in every uvicorn worker: real concurrency of action is WORKERS x its limit.
+# Other actions share default gate, max wait in queue before 429 (sec, short: overloaded client is answered fast),
+# actions never limited: cheap ones (load-schema reads ledger, issue-cred and verify only insert job,
+# see JOBS_*; route answered locally bypasses admission too)
+ADMISSION_LIMITS = {
+    action: tuple(limits) for action, limits in json.loads(os.getenv('ADMISSION_LIMITS', json.dumps({
+        'add-identity': [2, 4],
+        'register-schema': [2, 4],
+        'register-cred-def': [2, 4],
+        'reset': [1, 0],
+        'gossyp': [2, 4],
+        'route': [4, 8],
+        'mrg': [2, 4]
+    }))).items()
+}
+ADMISSION_CONCURRENCY = int(os.getenv('ADMISSION_CONCURRENCY', 10))
+ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', 20))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 0.5))
+ADMISSION_EXEMPT = os.getenv('ADMISSION_EXEMPT', 'load-schema,issue-cred,verify').split(',')
+# Issuance and verification jobs in Postgres: attempts, first retry delay (sec, doubled on every next one),
+# lease of running job before other worker may take it (sec), jobs run at the same time, empty queue poll interval (sec)
+JOBS_MAX_ATTEMPTS = int(os.getenv('JOBS_MAX_ATTEMPTS', 3))
+JOBS_BACKOFF = float(os.getenv('JOBS_BACKOFF', 5))
+JOBS_LEASE = float(os.getenv('JOBS_LEASE', 120))
+JOBS_CONCURRENCY = int(os.getenv('JOBS_CONCURRENCY', 5))
+JOBS_POLL_INTERVAL = float(os.getenv('JOBS_POLL_INTERVAL', 1))
+# WebSocket fan-out: frames queued per browser and dropped frames in a row before disconnect
+WS_QUEUE_SIZE = int(os.getenv('WS_QUEUE_SIZE', 100))
+WS_MAX_DROPPED_FRAMES = int(os.getenv('WS_MAX_DROPPED_FRAMES', 100))
+
 
 SDK = os.getenv('SDK')
 if not SDK:
@@ -83,6 +189,12 @@ TITLE = extra.pop('title', 'Demo Company Ltd.')
 ICON = extra.pop('icon', '/static/icons/logo.png')
 MASTER_SECRET_ID = extra.pop('master_secret_id')
 
+# Several agents may share Redis servers, keys are prefixed with agent verkey
+REDIS_KEYS_PREFIX = 'ipg_demo:' + SDK['p2p'].their_verkey
+EVENTS_STREAM = REDIS_KEYS_PREFIX + ':events'
+# Frames kept in events stream for reconnecting browsers
+EVENTS_REPLAY_SIZE = int(os.getenv('EVENTS_REPLAY_SIZE', 1000))
+
 
 sirius_sdk.init(**SDK)
 
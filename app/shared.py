@@ -0,0 +1,200 @@
+import json
+import time
+import asyncio
+import logging
+from typing import Optional
+
+import aioredis
+
+
+class RedisClient:
+    """Redis pool per event loop: same instance is used by uvicorn loop and foreground thread"""
+
+    def __init__(self, address: str):
+        if '://' not in address:
+            address = 'redis://' + address
+        self.__address = address
+        self.__pools = {}
+
+    async def redis(self) -> aioredis.Redis:
+        loop = asyncio.get_event_loop()
+        pool = self.__pools.get(id(loop))
+        if pool is None or pool.closed:
+            pool = await aioredis.create_redis_pool(self.__address, encoding='utf-8')
+            self.__pools[id(loop)] = pool
+        return pool
+
+
+class StatsReports(RedisClient):
+    """Stats of foreground processes published to Redis hash, so any uvicorn worker can show them
+
+    Every process publishes own report under its name, reports that were not
+    refreshed for ttl seconds (process is gone) are not shown.
+    """
+
+    def __init__(self, address: str, key: str, ttl: float = 60):
+        super().__init__(address)
+        self.__key = key
+        self.__ttl = ttl
+
+    async def publish(self, name: str, report: dict):
+        redis = await self.redis()
+        await redis.hset(self.__key, name, json.dumps(dict(report, updated=time.time())))
+
+    async def load(self) -> dict:
+        redis = await self.redis()
+        reports = {}
+        for name, value in (await redis.hgetall(self.__key) or {}).items():
+            report = json.loads(value)
+            if time.time() - report.get('updated', 0) < self.__ttl:
+                reports[name] = report
+        return reports
+
+    async def run(self, name: str, build, interval: float = 5):
+        """Publish report built by build() every interval seconds until cancelled"""
+        while True:
+            try:
+                await self.publish(name, await build())
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception('Error while publishing stats')
+            await asyncio.sleep(interval)
+
+
+class ControlChannel(RedisClient):
+    """Commands of uvicorn workers to foreground over Redis list, every command is run by one foreground process"""
+
+    def __init__(self, address: str, key: str, poll_timeout: int = 5):
+        super().__init__(address)
+        self.__key = key
+        self.__poll_timeout = poll_timeout
+
+    async def send(self, command: str, **params):
+        redis = await self.redis()
+        await redis.rpush(self.__key, json.dumps(dict(params, command=command)))
+
+    async def run(self, handlers: dict):
+        """Run received commands until cancelled
+
+        :param handlers: command -> coroutine function called with command params
+        """
+        while True:
+            try:
+                redis = await self.redis()
+                item = await redis.blpop(self.__key, timeout=self.__poll_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception('Error while receiving control commands')
+                await asyncio.sleep(self.__poll_timeout)
+                continue
+            if not item:
+                continue
+            params = json.loads(item[1])
+            command = params.pop('command', None)
+            handler = handlers.get(command)
+            if handler is None:
+                logging.error(f'Unknown control command: {command}')
+                continue
+            try:
+                await handler(**params)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception(f'Error while running control command: {command}')
+
+
+class RedisTopology(RedisClient):
+    """Topology links shared by processes: Redis hashes of link stamps and node names, see topology.TopologyStore"""
+
+    # link stamp is updated only if it is newer, whatever process wrote it before
+    PUSH_SCRIPT = """
+    for i = 1, #ARGV, 2 do
+        local current = tonumber(redis.call('HGET', KEYS[1], ARGV[i]) or '0')
+        if tonumber(ARGV[i + 1]) > current then
+            redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+        end
+    end
+    return 0
+    """
+
+    def __init__(self, address: str, prefix: str):
+        super().__init__(address)
+        self.__links_key = f'{prefix}:links'
+        self.__names_key = f'{prefix}:names'
+
+    async def exchange(self, links: dict, names: dict, expired_before: float) -> (dict, dict):
+        """Push new links and names, return all of them, links expired before given time are deleted
+
+        :param links: (DID, DID) -> stamp
+        """
+        redis = await self.redis()
+        if links:
+            args = []
+            for (a, b), stamp in links.items():
+                args.extend([f'{a} {b}', repr(stamp)])
+            await redis.eval(self.PUSH_SCRIPT, keys=[self.__links_key], args=args)
+        if names:
+            await redis.hmset_dict(self.__names_key, names)
+        stored, expired = {}, []
+        for field, stamp in (await redis.hgetall(self.__links_key) or {}).items():
+            stamp = float(stamp)
+            if stamp < expired_before:
+                expired.append(field)
+            else:
+                a, _, b = field.partition(' ')
+                stored[(a, b)] = stamp
+        if expired:
+            await redis.hdel(self.__links_key, *expired)
+        return stored, await redis.hgetall(self.__names_key) or {}
+
+
+class SharedLimits(RedisClient):
+    """Inbound limits tuned with /limits of any uvicorn worker, applied by foreground processes, see rate_limit"""
+
+    DEFAULT = ''
+
+    def __init__(self, address: str, key: str):
+        super().__init__(address)
+        self.__key = key
+
+    async def set(self, msg_type: Optional[str], rate: float, burst: float):
+        """Limits of message type, default ones if type is None"""
+        redis = await self.redis()
+        await redis.hset(self.__key, msg_type or self.DEFAULT, json.dumps([rate, burst]))
+
+    async def load(self) -> dict:
+        """message type (None for default) -> (rate, burst)"""
+        redis = await self.redis()
+        return {
+            msg_type or None: tuple(json.loads(value))
+            for msg_type, value in (await redis.hgetall(self.__key) or {}).items()
+        }
+
+    async def run(self, apply, interval: float = 5):
+        """Pass limits to apply() every interval seconds until cancelled"""
+        while True:
+            try:
+                apply(await self.load())
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception('Error while loading inbound limits')
+            await asyncio.sleep(interval)
+
+
+class SharedCounter(RedisClient):
+    """Version number shared by processes, bumped by the one that changed state (see role_cache.RoleCache)"""
+
+    def __init__(self, address: str, key: str):
+        super().__init__(address)
+        self.__key = key
+
+    async def load(self) -> int:
+        redis = await self.redis()
+        return int(await redis.get(self.__key) or 0)
+
+    async def bump(self) -> int:
+        redis = await self.redis()
+        return int(await redis.incr(self.__key))
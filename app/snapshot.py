@@ -0,0 +1,68 @@
+import time
+import asyncio
+import threading
+from typing import Callable, Awaitable, Any, Optional
+
+
+class CabinetSnapshot:
+    """Versioned in-process snapshot of the cabinet wallet data
+
+    Every section (identities, connections, ...) is fetched by its own loader,
+    sections that are missing in memory are fetched concurrently. Mutating
+    operations call invalidate() for the sections they touch, so repeated
+    page loads are served from memory.
+    """
+
+    def __init__(self, ttl: Optional[float] = None, **loaders: Callable[[], Awaitable[Any]]):
+        """
+        :param ttl: max age of cached section in seconds, None - cache forever.
+                    Guards against changes made by other processes that can't call invalidate()
+        :param loaders: section name -> coroutine function that fetches section from wallet
+        """
+        self.__loaders = loaders
+        self.__ttl = ttl
+        # snapshot is shared by uvicorn loop and foreground thread
+        self.__lock = threading.Lock()
+        self.__versions = {name: 0 for name in loaders.keys()}
+        self.__data = {}
+
+    @property
+    def sections(self) -> list:
+        return list(self.__loaders.keys())
+
+    @property
+    def versions(self) -> dict:
+        with self.__lock:
+            return dict(**self.__versions)
+
+    def invalidate(self, *sections: str):
+        """Drop cached sections, all sections if nothing specified"""
+        sections = sections or tuple(self.__loaders.keys())
+        with self.__lock:
+            for name in sections:
+                self.__versions[name] += 1
+                self.__data.pop(name, None)
+
+    async def load(self, *sections: str) -> dict:
+        """Return section name -> value, fetch missing sections concurrently"""
+        sections = sections or tuple(self.__loaders.keys())
+        result = {}
+        missing = []
+        now = time.monotonic()
+        with self.__lock:
+            for name in sections:
+                cached = self.__data.get(name)
+                if cached and (self.__ttl is None or now - cached[1] < self.__ttl):
+                    result[name] = cached[2]
+                else:
+                    missing.append((name, self.__versions[name]))
+        if missing:
+            values = await asyncio.gather(*[self.__loaders[name]() for name, _ in missing])
+            stamp = time.monotonic()
+            with self.__lock:
+                for (name, version), value in zip(missing, values):
+                    result[name] = value
+                    # don't store value if section was invalidated while fetching
+                    if self.__versions[name] == version:
+                        self.__data[name] = (version, stamp, value)
+        return result
@@ -0,0 +1,90 @@
+import time
+import asyncio
+
+import pytest
+
+from admission import AdmissionControl, Overloaded
+
+
+async def hold(admission: AdmissionControl, action: str, release: asyncio.Event):
+    async with admission.admit(action):
+        await release.wait()
+
+
+def test_full_queue_is_rejected_at_once():
+
+    async def run():
+        admission = AdmissionControl(limits={'mrg': (1, 1)}, queue_timeout=10)
+        release = asyncio.Event()
+        running = asyncio.ensure_future(hold(admission, 'mrg', release))
+        waiting = asyncio.ensure_future(hold(admission, 'mrg', release))
+        await asyncio.sleep(0.01)
+        stamp = time.monotonic()
+        with pytest.raises(Overloaded) as e:
+            await hold(admission, 'mrg', release)
+        elapsed = time.monotonic() - stamp
+        release.set()
+        await asyncio.gather(running, waiting)
+        return e.value, elapsed, admission.stats()['mrg']
+
+    error, elapsed, stats = asyncio.run(run())
+    assert error.action == 'mrg'
+    assert error.retry_after >= 1
+    assert elapsed < 0.1
+    assert stats['admitted'] == 2
+    assert stats['rejected'] == 1
+
+
+def test_queue_wait_is_short():
+
+    async def run():
+        admission = AdmissionControl(limits={'mrg': (1, 5)}, queue_timeout=0.05)
+        release = asyncio.Event()
+        running = asyncio.ensure_future(hold(admission, 'mrg', release))
+        await asyncio.sleep(0.01)
+        stamp = time.monotonic()
+        with pytest.raises(Overloaded):
+            await hold(admission, 'mrg', release)
+        elapsed = time.monotonic() - stamp
+        release.set()
+        await running
+        return elapsed
+
+    assert asyncio.run(run()) < 1
+
+
+def test_queued_action_runs_when_slot_is_free():
+
+    async def run():
+        admission = AdmissionControl(limits={'mrg': (1, 1)}, queue_timeout=1)
+        release = asyncio.Event()
+        running = asyncio.ensure_future(hold(admission, 'mrg', release))
+        waiting = asyncio.ensure_future(hold(admission, 'mrg', release))
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(running, waiting)
+        return admission.stats()['mrg']
+
+    stats = asyncio.run(run())
+    assert stats['admitted'] == 2
+    assert stats['running'] == 0 and stats['waiting'] == 0
+
+
+def test_exempt_and_default_gate():
+
+    async def run():
+        admission = AdmissionControl(concurrency=1, queue_size=0, exempt=['load-schema'])
+        release = asyncio.Event()
+        running = asyncio.ensure_future(hold(admission, 'send-message', release))
+        await asyncio.sleep(0.01)
+        # actions without own limits share default gate
+        with pytest.raises(Overloaded):
+            await hold(admission, 'add-connection', release)
+        async with admission.admit('load-schema'):
+            pass
+        release.set()
+        await running
+        return admission.stats()
+
+    stats = asyncio.run(run())
+    assert list(stats.keys()) == [AdmissionControl.DEFAULT_GATE]
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('sirius_sdk')
+pytest.importorskip('aioredis')
+
+from broadcast import EventsHub
+
+
+class IdleBus:
+
+    async def listen(self):
+        await asyncio.Event().wait()
+        yield
+
+
+class BrokenSocket:
+
+    async def send_json(self, frame):
+        raise ConnectionError('gone')
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+async def no_frames(event):
+    return []
+
+
+def test_kick_of_last_client_stops_hub():
+
+    async def run():
+        hub = EventsHub(no_frames, queue_size=1, max_dropped=1, bus=IdleBus())
+        client = hub.attach()
+        task = hub._EventsHub__task
+        hub.publish('topic', {})
+        hub.publish('topic', {})
+        await asyncio.gather(task, return_exceptions=True)
+        return client, task, hub
+
+    client, task, hub = asyncio.run(run())
+    assert client.kicked
+    assert hub.clients == 0
+    assert task.cancelled()
+
+
+def test_sender_error_is_retrieved(caplog):
+
+    async def run():
+        hub = EventsHub(no_frames, bus=IdleBus())
+        client = hub.attach()
+        sender = hub.spawn_sender(client, BrokenSocket())
+        hub.publish('topic', {})
+        await asyncio.wait([sender])
+        await asyncio.sleep(0)
+        hub.detach(client)
+        return sender
+
+    sender = asyncio.run(run())
+    assert isinstance(sender.exception(), ConnectionError)
+    assert 'WS sender error' in caplog.text
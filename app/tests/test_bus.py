@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('aioredis')
+
+from bus import EventsBus, parse_seq
+
+
+class Stream:
+    """Redis stream trimmed to size, IDs are "<n>-0" """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.items = []
+        self.seq = 0
+
+    async def xadd(self, stream, fields, max_len=None, exact_len=False):
+        self.seq += 1
+        self.items.append((f'{self.seq}-0', fields))
+        self.items = self.items[-self.size:]
+        return f'{self.seq}-0'
+
+    async def xrange(self, stream, start='-', count=None):
+        items = [item for item in self.items if start == '-' or parse_seq(item[0]) >= parse_seq(start)]
+        return items[:count]
+
+
+def build_bus(stream: Stream) -> EventsBus:
+    bus = EventsBus('localhost:6379', stream='events', replay_size=stream.size)
+
+    async def connect():
+        return stream
+
+    bus.connect = connect
+    return bus
+
+
+@pytest.mark.parametrize('seq, expected', [
+    ('1526919030474-55', (1526919030474, 55)),
+    (b'10-1', (10, 1)),
+    ('10', (10, 0)),
+    (None, (0, 0)),
+    ('bad-seq', (0, 0))
+])
+def test_parse_seq(seq, expected):
+    assert parse_seq(seq) == expected
+
+
+def test_seq_is_compared_numerically():
+    assert parse_seq('10-0') > parse_seq('9-5')
+
+
+def test_replay_frames_after_seq():
+    bus = build_bus(Stream(size=10))
+
+    async def run():
+        first = await bus.publish('topic', {'n': 1})
+        await bus.publish('topic', {'n': 2})
+        return await bus.replay(first)
+
+    complete, frames = asyncio.run(run())
+    assert complete
+    assert frames == [('2-0', 'topic', {'n': 2})]
+
+
+def test_trimmed_replay_is_incomplete():
+    bus = build_bus(Stream(size=2))
+
+    async def run():
+        first = await bus.publish('topic', {'n': 1})
+        for n in range(2, 5):
+            await bus.publish('topic', {'n': n})
+        return await bus.replay(first)
+
+    complete, frames = asyncio.run(run())
+    assert not complete
+    assert [payload['n'] for _, _, payload in frames] == [3, 4]
@@ -0,0 +1,83 @@
+import copy
+
+import pytest
+
+from machine_readable_govs.compiler import (
+    compile_framework, calc_doc_hash, FrameworksCache, GovernanceError,
+    CONDITION_SCHEMA, CONDITION_ID, CONDITION_INVALID
+)
+
+
+DOC = {
+    'name': 'Test framework',
+    'version': '1.0',
+    'schemas': [{'id': 'schema:1', 'name': 'passport'}],
+    'participants': [{'id': 'did:sov:Issuer', 'name': 'issuer'}],
+    'roles': ['citizen', 'official'],
+    'permissions': [
+        {'grant': ['citizen'], 'when': {'any': [{'schema': 'passport', 'issuer': 'issuer'}]}},
+        {'grant': ['official'], 'when': {'and': [{'schema': 'passport'}, {'id': 'issuer'}]}}
+    ]
+}
+
+
+def test_names_are_resolved():
+    framework = compile_framework(DOC)
+    condition = framework.groups[0].conditions[0]
+    assert condition.kind == CONDITION_SCHEMA
+    assert condition.schema_id == 'schema:1'
+    assert condition.issuer_did == 'Issuer'
+    assert framework.groups[1].conditions[1].kind == CONDITION_ID
+    assert framework.groups[1].conditions[1].did == 'Issuer'
+
+
+def test_invalid_condition_fails_alone():
+    framework = compile_framework(DOC)
+    # schema without issuer doesn't invalidate the whole document
+    assert [group.grant for group in framework.groups] == [['citizen'], ['official']]
+    assert framework.groups[1].conditions[0].kind == CONDITION_INVALID
+
+
+def test_identical_conditions_are_shared():
+    doc = copy.deepcopy(DOC)
+    doc['permissions'].append({'grant': ['official'], 'when': {'any': [{'schema': 'schema:1', 'issuer': 'did:sov:Issuer'}]}})
+    framework = compile_framework(doc)
+    assert framework.groups[2].conditions[0] is framework.groups[0].conditions[0]
+
+
+@pytest.mark.parametrize('doc', [
+    [],
+    {'roles': 'citizen'},
+    {'permissions': [{'grant': 'citizen', 'when': {}}]},
+    {'permissions': [{'grant': ['citizen'], 'when': {'or': []}}]}
+])
+def test_invalid_structure(doc):
+    with pytest.raises(GovernanceError):
+        compile_framework(doc)
+
+
+def test_cache_compiles_once_per_content():
+    cache = FrameworksCache()
+    framework = cache.get(DOC)
+    assert cache.get(DOC) is framework
+    assert cache.get(copy.deepcopy(DOC)) is framework
+    assert cache.find(calc_doc_hash(DOC)) is framework
+
+
+def test_intern_uses_claimed_hash():
+    cache = FrameworksCache()
+    framework = cache.get(DOC)
+    received = copy.deepcopy(DOC)
+    assert cache.intern(received, framework.hash) is DOC
+    # hash of other document is not trusted
+    other = dict(DOC, name='Other')
+    assert cache.intern(other, framework.hash) is other
+    assert cache.intern(received, None) is received
+
+
+def test_cache_eviction():
+    cache = FrameworksCache(size=1)
+    first = cache.get(DOC)
+    cache.get(dict(DOC, name='Other'))
+    assert cache.find(first.hash) is None
+    assert cache.get(DOC) is not first
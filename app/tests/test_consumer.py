@@ -0,0 +1,39 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('aioredis')
+
+from partitions import PartitionFilter, get_claim_key, get_partition
+
+
+def make_event(msg_type: str, msg_id: str, their_did: str):
+    message = {'@type': msg_type, '@id': msg_id}
+    return SimpleNamespace(
+        message=SimpleNamespace(type=msg_type, id=msg_id, get=message.get),
+        pairwise=SimpleNamespace(their=SimpleNamespace(did=their_did)),
+        sender_verkey=None
+    )
+
+
+def test_response_does_not_collide_with_request():
+    request = make_event('https://didcomm.org/trace/1.0/request', 'id-1', 'did:a')
+    response = make_event('https://didcomm.org/trace/1.0/response', 'id-1', 'did:a')
+    assert get_claim_key(request) != get_claim_key(response)
+
+
+def test_same_id_of_other_sender_does_not_collide():
+    assert get_claim_key(make_event('type', 'id-1', 'did:a')) != get_claim_key(make_event('type', 'id-1', 'did:b'))
+
+
+def test_partition_is_stable():
+    assert get_partition('did:a', 4) == get_partition('did:a', 4)
+    assert 0 <= get_partition('did:a', 4) < 4
+
+
+def test_other_partition_is_not_accepted():
+    event = make_event('type', 'id-1', 'did:a')
+    mine = get_partition('did:a', 4)
+    assert asyncio.run(PartitionFilter(4, mine)(event))
+    assert not asyncio.run(PartitionFilter(4, (mine + 1) % 4)(event))
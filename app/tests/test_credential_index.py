@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('sirius_sdk')
+
+from credential_index import CredentialIndex, get_issuer_did
+
+
+CREDENTIALS = [
+    {'referent': 'cred-1', 'schema_id': 'Issuer:2:passport:1.0', 'cred_def_id': 'Issuer:3:CL:10:default'},
+    {'referent': 'cred-2', 'schema_id': 'Issuer:2:visa:1.0', 'cred_def_id': 'Issuer:3:CL:11:default'},
+    {'referent': 'cred-3', 'schema_id': 'Issuer:2:passport:1.0', 'cred_def_id': 'Other:3:CL:10:default'}
+]
+
+
+def test_issuer_did_of_cred_def():
+    assert get_issuer_did('Issuer:3:CL:10:default') == 'Issuer'
+
+
+def test_credentials_are_found_by_all_keys():
+    loads = []
+
+    async def loader():
+        loads.append(1)
+        return CREDENTIALS
+
+    index = CredentialIndex(loader=loader)
+
+    async def run():
+        return (
+            sorted(await index.credentials(schema_id='Issuer:2:passport:1.0')),
+            await index.credentials(schema_id='Issuer:2:passport:1.0', issuer_did='Other'),
+            await index.count(issuer_did='Issuer'),
+            await index.count(cred_def_id='Unknown:3:CL:1:default')
+        )
+
+    assert asyncio.run(run()) == (['cred-1', 'cred-3'], ['cred-3'], 2, 0)
+    # wallet is read once
+    assert len(loads) == 1
+    assert (index.hits, index.misses) == (3, 1)
+
+
+def test_stored_and_removed_credentials_are_indexed():
+
+    async def loader():
+        return []
+
+    index = CredentialIndex(loader=loader)
+
+    async def run():
+        await index.load()
+        index.add('cred-1', 'Issuer:2:passport:1.0', 'Issuer:3:CL:10:default')
+        found = await index.count(issuer_did='Issuer')
+        index.remove('cred-1')
+        return found, await index.count(issuer_did='Issuer')
+
+    assert asyncio.run(run()) == (1, 0)
+    assert index.stats()['issuers'] == {}
+
+
+def test_unknown_key_is_rejected():
+
+    async def loader():
+        return []
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(CredentialIndex(loader=loader).count(attr='name'))
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('aioredis')
+
+from dedup import DedupStore, MemoryDedupStore, RedisDedupStore
+
+
+def test_seen():
+
+    async def run():
+        store = MemoryDedupStore()
+        return await store.seen('a'), await store.seen('a'), await store.seen('b'), await store.stats()
+
+    first, second, other, stats = asyncio.run(run())
+    assert (first, second, other) == (False, True, False)
+    assert stats == {'hits': 1, 'misses': 2, 'evictions': 0}
+
+
+def test_get_set():
+
+    async def run():
+        store = MemoryDedupStore()
+        await store.set('a', 'value')
+        return await store.get('a'), await store.get('b')
+
+    assert asyncio.run(run()) == ('value', None)
+
+
+def test_least_recently_used_are_evicted():
+
+    async def run():
+        store = MemoryDedupStore(max_size=2)
+        await store.seen('a')
+        await store.seen('b')
+        # touch a, b is the least recently used
+        await store.get('a')
+        await store.seen('c')
+        return await store.get('a'), await store.get('b'), store.evictions
+
+    assert asyncio.run(run()) == ('', None, 1)
+
+
+def test_expired_keys_are_evicted():
+
+    async def run():
+        store = MemoryDedupStore(ttl=-1)
+        await store.seen('a')
+        return await store.seen('a'), store.evictions
+
+    assert asyncio.run(run()) == (False, 1)
+
+
+def test_abstract_methods_raise():
+
+    class Store(DedupStore):
+
+        async def seen(self, key):
+            return await super().seen(key)
+
+        async def get(self, key):
+            return await super().get(key)
+
+        async def set(self, key, value):
+            return await super().set(key, value)
+
+    with pytest.raises(NotImplementedError):
+        asyncio.run(Store().seen('a'))
+
+
+def test_redis_store_reports_server_evictions():
+
+    class Redis:
+
+        async def info(self, section):
+            return {'stats': {'expired_keys': 3, 'evicted_keys': 2}}
+
+    async def redis():
+        return Redis()
+
+    store = RedisDedupStore('localhost:6379', prefix='test')
+    store._RedisDedupStore__redis = redis
+    stats = asyncio.run(store.stats())
+    assert stats['evictions'] == 5
+    assert (stats['expired_keys'], stats['evicted_keys']) == (3, 2)
@@ -0,0 +1,73 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('sirius_sdk')
+
+from directory import Directory
+
+
+def make_p2p(their_did: str, my_did: str = 'me'):
+    return SimpleNamespace(
+        their=SimpleNamespace(did=their_did, verkey=their_did + '_vk'),
+        me=SimpleNamespace(did=my_did, verkey=my_did + '_vk')
+    )
+
+
+class FakeWallet:
+
+    def __init__(self):
+        self.connections = []
+        self.loads = 0
+
+    async def load_identities(self, **keys):
+        return []
+
+    async def load_connections(self, **keys):
+        if not keys:
+            self.loads += 1
+        return [p2p for p2p in self.connections if all(getattr(p2p.their, k.split('_')[1]) == v for k, v in keys.items())]
+
+    async def load_pairwise(self, their_did: str):
+        return None
+
+
+def build(wallet: FakeWallet, load_ttl):
+    return Directory(wallet.load_identities, wallet.load_connections, wallet.load_pairwise, ttl=60, load_ttl=load_ttl)
+
+
+def test_connection_returns_first_match():
+    wallet = FakeWallet()
+    wallet.connections = [make_p2p('a', 'me1'), make_p2p('a', 'me2')]
+    directory = build(wallet, None)
+    p2p = asyncio.run(directory.connection(their_did='a'))
+    assert p2p.me.did == 'me1'
+
+
+def test_stale_directory_is_reloaded():
+    wallet = FakeWallet()
+    wallet.connections = [make_p2p('a')]
+    directory = build(wallet, -1)
+
+    async def run():
+        await directory.load()
+        # record created by other process
+        wallet.connections.append(make_p2p('b'))
+        return await directory.connections()
+
+    found = asyncio.run(run())
+    assert [p2p.their.did for p2p in found] == ['a', 'b']
+    assert wallet.loads == 2
+
+
+def test_fresh_directory_is_not_reloaded():
+    wallet = FakeWallet()
+    directory = build(wallet, 300)
+
+    async def run():
+        await directory.load()
+        await directory.load()
+
+    asyncio.run(run())
+    assert wallet.loads == 1
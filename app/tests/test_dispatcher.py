@@ -0,0 +1,54 @@
+import asyncio
+
+from dispatcher import EventDispatcher, PRIORITY_INTERACTIVE, PRIORITY_FLOOD
+
+
+def test_full_flood_lane_drops_without_blocking():
+
+    async def run():
+        release = asyncio.Event()
+        done = []
+
+        async def slow():
+            await release.wait()
+
+        async def interactive():
+            done.append('interactive')
+
+        dispatcher = EventDispatcher(concurrency=2, lane_size=2)
+        dispatcher.start()
+        results = [await dispatcher.submit(PRIORITY_FLOOD, n, slow) for n in range(4)]
+        # listener is not blocked by full flood lane
+        assert await asyncio.wait_for(dispatcher.submit(PRIORITY_INTERACTIVE, 'x', interactive), 1)
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.sleep(0.01)
+        await dispatcher.stop()
+        return results, done, dispatcher.dropped
+
+    results, done, dropped = asyncio.run(run())
+    assert results == [True, True, False, False]
+    assert dropped == {PRIORITY_FLOOD: 2}
+    assert done == ['interactive']
+
+
+def test_same_key_runs_in_order():
+
+    async def run():
+        order = []
+
+        def job(n):
+            async def run_job():
+                await asyncio.sleep(0.01 if n == 0 else 0)
+                order.append(n)
+            return run_job
+
+        dispatcher = EventDispatcher(concurrency=5)
+        dispatcher.start()
+        for n in range(3):
+            await dispatcher.submit(PRIORITY_INTERACTIVE, ('did', None), job(n))
+        await asyncio.sleep(0.05)
+        await dispatcher.stop()
+        return order
+
+    assert asyncio.run(run()) == [0, 1, 2]
@@ -0,0 +1,171 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+sirius_sdk = pytest.importorskip('sirius_sdk')
+
+from credential_index import CredentialIndex
+from machine_readable_govs.compiler import compile_framework
+from machine_readable_govs import evaluation
+from machine_readable_govs.evaluation import evaluate_frameworks
+
+
+DOC = {
+    'name': 'Test framework',
+    'version': '1.0',
+    'schemas': [{'id': 'schema:1', 'name': 'passport'}],
+    'participants': [{'id': 'did:sov:Me', 'name': 'me'}, {'id': 'did:sov:Other', 'name': 'other'}],
+    'roles': ['citizen', 'official'],
+    'permissions': [
+        {'grant': ['citizen'], 'when': {'any': [{'id': 'me'}, {'schema': 'passport', 'issuer': 'other'}]}},
+        {'grant': ['official'], 'when': {'and': [{'id': 'other'}, {'schema': 'passport', 'issuer': 'other'}]}}
+    ]
+}
+
+
+class Ledger:
+    """Schemas and cred-defs of ledger cache, every attribute is "name" """
+
+    def __init__(self, missing: list = None):
+        self.missing = missing or []
+
+    async def load_schema(self, dkms, id_: str, my_did: str):
+        if id_ in self.missing:
+            raise RuntimeError(f'Not found schema: {id_}')
+        return SimpleNamespace(attributes=['name'])
+
+    async def load_cred_def(self, dkms, id_: str, my_did: str):
+        if id_ in self.missing:
+            raise RuntimeError(f'Not found cred-def: {id_}')
+        return SimpleNamespace(schema=SimpleNamespace(attributes=['name']))
+
+
+@pytest.fixture
+def wallet(monkeypatch):
+    """My DIDs, credentials and proof request searches of agent wallet"""
+    state = SimpleNamespace(dids=['Me'], credentials=[], searches=[], found=set(), search_delay=0)
+
+    async def list_my_dids_with_meta():
+        return [{'did': did} for did in state.dids]
+
+    async def ledger(name: str):
+        return SimpleNamespace(name=name)
+
+    async def prover_search_credentials_for_proof_req(proof_request: dict, limit_referents: int = 1):
+        state.searches.append(proof_request['requested_attributes'])
+        await asyncio.sleep(state.search_delay)
+        return {
+            'requested_attributes': {
+                name: [{'cred_info': {}}] if name in state.found else []
+                for name in proof_request['requested_attributes'].keys()
+            }
+        }
+
+    async def load_credentials():
+        return state.credentials
+
+    monkeypatch.setattr(sirius_sdk.DID, 'list_my_dids_with_meta', list_my_dids_with_meta)
+    monkeypatch.setattr(sirius_sdk.AnonCreds, 'prover_search_credentials_for_proof_req', prover_search_credentials_for_proof_req)
+    monkeypatch.setattr(sirius_sdk, 'ledger', ledger)
+    monkeypatch.setattr(evaluation, 'credential_index', CredentialIndex(loader=load_credentials))
+    return state
+
+
+def test_groups_are_decided_without_waiting_for_slow_checks(wallet):
+    wallet.search_delay = 10
+    framework = compile_framework(DOC)
+
+    async def run():
+        return await asyncio.wait_for(evaluate_frameworks([framework], Ledger(), 'test'), timeout=1)
+
+    granted, report = asyncio.run(run())
+    # "any" is granted by my DID, "and" is refused by other DID, credential search is not needed
+    assert granted == {framework.hash: ['citizen']}
+    statuses = {key: item['status'] for key, item in report.items()}
+    assert sorted(statuses.values()) == ['cancelled', 'done', 'done']
+
+
+def test_every_condition_is_checked_once(wallet):
+    wallet.dids = ['Nobody']
+    wallet.found = {'attr1_referent'}
+    framework = compile_framework(DOC)
+    granted, report = asyncio.run(evaluate_frameworks([framework], Ledger(), 'test'))
+    assert granted == {framework.hash: ['citizen']}
+    # credential condition is shared by both groups
+    assert len(report) == 3
+    assert len(wallet.searches) == 1
+
+
+def test_known_results_are_not_checked_again(wallet):
+    wallet.dids = ['Nobody']
+    framework = compile_framework(DOC)
+    known = {key: True for key, condition in framework.conditions.items() if condition.is_credential}
+    granted, report = asyncio.run(evaluate_frameworks([framework], Ledger(), 'test', known))
+    assert granted == {framework.hash: ['citizen']}
+    assert wallet.searches == []
+    assert 'cached' in [item['status'] for item in report.values()]
+
+
+CRED_DEFS_DOC = {
+    'name': 'Cred-defs framework',
+    'version': '1.0',
+    'schemas': [{'id': 'schema:1', 'name': 'passport'}],
+    'cred_defs': [{'id': 'Other:3:CL:1:visa', 'name': 'visa'}, {'id': 'Other:3:CL:2:permit', 'name': 'permit'}],
+    'participants': [{'id': 'did:sov:Other', 'name': 'other'}],
+    'roles': ['citizen', 'traveller', 'worker'],
+    'permissions': [
+        {'grant': ['citizen'], 'when': {'and': [{'schema': 'passport', 'issuer': 'other'}]}},
+        {'grant': ['traveller'], 'when': {'and': [{'cred_def': 'visa'}]}},
+        {'grant': ['worker'], 'when': {'and': [{'cred_def': 'permit'}]}}
+    ]
+}
+
+
+def test_credential_conditions_share_single_search(wallet):
+    framework = compile_framework(CRED_DEFS_DOC)
+    wallet.found = {'attr1_referent', 'attr2_referent'}
+    granted, _ = asyncio.run(evaluate_frameworks([framework], Ledger(), 'test'))
+    # results of referents are mapped back to their conditions
+    assert sorted(granted[framework.hash]) == ['citizen', 'traveller']
+    assert len(wallet.searches) == 1
+    assert len(wallet.searches[0]) == 3
+
+
+def test_indexed_credentials_are_not_searched(wallet):
+    framework = compile_framework(CRED_DEFS_DOC)
+    wallet.credentials = [{'referent': 'cred-1', 'schema_id': 'schema:1', 'cred_def_id': 'Other:3:CL:1:visa'}]
+    granted, _ = asyncio.run(evaluate_frameworks([framework], Ledger(), 'test'))
+    assert sorted(granted[framework.hash]) == ['citizen', 'traveller']
+    # permit only is missing in index
+    assert [list(referents.values()) for referents in wallet.searches] == [
+        [{'name': 'name', 'restrictions': {'cred_def_id': 'Other:3:CL:2:permit'}}]
+    ]
+
+
+def test_condition_without_referent_fails_alone(wallet):
+    framework = compile_framework(CRED_DEFS_DOC)
+    wallet.found = {'attr1_referent', 'attr2_referent', 'attr3_referent'}
+    granted, _ = asyncio.run(evaluate_frameworks([framework], Ledger(missing=['Other:3:CL:2:permit']), 'test'))
+    assert sorted(granted[framework.hash]) == ['citizen', 'traveller']
+    assert len(wallet.searches[0]) == 2
+
+
+def test_frameworks_are_evaluated_in_one_pass(wallet, monkeypatch):
+    lookups = []
+    list_my_dids = sirius_sdk.DID.list_my_dids_with_meta
+
+    async def list_my_dids_with_meta():
+        lookups.append(1)
+        return await list_my_dids()
+
+    monkeypatch.setattr(sirius_sdk.DID, 'list_my_dids_with_meta', list_my_dids_with_meta)
+    wallet.dids = ['Nobody']
+    wallet.found = {'attr1_referent'}
+    first, second = compile_framework(DOC), compile_framework(CRED_DEFS_DOC)
+    granted, report = asyncio.run(evaluate_frameworks([first, second], Ledger(), 'test'))
+    assert granted == {first.hash: ['citizen'], second.hash: ['citizen']}
+    # passport condition is shared by frameworks and checked once
+    assert len(report) == 5
+    assert len(lookups) == 1
+    assert len(wallet.searches) == 1
@@ -0,0 +1,60 @@
+import time
+import asyncio
+
+import pytest
+
+pytest.importorskip('aioredis')
+
+from dedup import MemoryDedupStore
+from didcomm.const import MSG_TYP_TRACE_REQ, MSG_TYP_MRG_RESP, MSG_TYP_GOSSYP
+from flood_budget import check_flood_budget, is_late_response
+
+
+class Message(dict):
+    """DIDComm message fields used by flood budget"""
+
+    @property
+    def id(self) -> str:
+        return self['@id']
+
+    @property
+    def type(self) -> str:
+        return self['@type']
+
+
+def test_expired_request_is_dropped():
+    message = Message({'@id': 'req', '@type': MSG_TYP_TRACE_REQ, 'deadline': time.time() - 1})
+    assert check_flood_budget(message) == 'expired'
+    message['deadline'] = time.time() + 60
+    assert check_flood_budget(message) is None
+
+
+def test_request_over_hops_limit_is_dropped():
+    message = Message({'@id': 'req', '@type': MSG_TYP_TRACE_REQ, 'hops': 2, 'route': ['did:a', 'did:b', 'did:c']})
+    assert check_flood_budget(message) == 'hops'
+    message['route'] = ['did:a', 'did:b']
+    assert check_flood_budget(message) is None
+
+
+def test_messages_of_old_peers_are_in_budget():
+    assert check_flood_budget(Message({'@id': 'req', '@type': MSG_TYP_TRACE_REQ, 'route': ['did:a'] * 10})) is None
+    # gossyp has own limits
+    assert check_flood_budget(Message({'@id': 'msg', '@type': MSG_TYP_GOSSYP, 'deadline': time.time() - 1})) is None
+
+
+def test_late_response_cutoff():
+    deadlines = MemoryDedupStore()
+
+    async def run():
+        await deadlines.set('late', str(time.time() - 1))
+        await deadlines.set('in-time', str(time.time() + 60))
+        return [
+            await is_late_response(Message({'@id': 'late', '@type': MSG_TYP_MRG_RESP}), deadlines),
+            await is_late_response(Message({'@id': 'in-time', '@type': MSG_TYP_MRG_RESP}), deadlines),
+            # deadline echoed by response wins over stored one
+            await is_late_response(Message({'@id': 'in-time', '@type': MSG_TYP_MRG_RESP, 'deadline': time.time() - 1}), deadlines),
+            # request is not fired by me
+            await is_late_response(Message({'@id': 'unknown', '@type': MSG_TYP_MRG_RESP}), deadlines)
+        ]
+
+    assert asyncio.run(run()) == [True, False, True, False]
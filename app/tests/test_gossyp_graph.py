@@ -0,0 +1,96 @@
+from gossyp_graph import GraphState, GraphStore, join_deltas, is_empty_delta, pick_targets, \
+    GOSSYP_MODE_FLOOD, GOSSYP_MODE_EPIDEMIC
+
+
+def node(id_: str, *auras: str) -> dict:
+    return {'id': id_, 'label': id_, 'auras': list(auras)}
+
+
+def link(source: str, target: str) -> dict:
+    return {'id': f'{source}-{target}', 'source': source, 'target': target}
+
+
+def test_merge_unites_auras():
+    state = GraphState()
+    state.merge([node('a', 'red')], [])
+    delta = state.merge([node('a', 'green'), node('b')], [link('a', 'b')])
+    assert state.nodes['a']['auras'] == ['red', 'green']
+    assert [item['id'] for item in delta['nodes']] == ['a', 'b']
+    assert [item['id'] for item in delta['links']] == ['a-b']
+
+
+def test_merge_of_known_entries_is_empty():
+    state = GraphState()
+    state.merge([node('a', 'red')], [link('a', 'b')])
+    assert is_empty_delta(state.merge([node('a', 'red')], [link('a', 'b')]))
+
+
+def test_hash_does_not_depend_on_merge_order():
+    first, second = GraphState(), GraphState()
+    first.merge([node('a', 'red'), node('b')], [link('a', 'b')])
+    second.merge([node('b')], [link('a', 'b')])
+    second.merge([node('a', 'red')], [])
+    assert first.hash == second.hash
+    second.merge([node('a', 'green')], [])
+    assert first.hash != second.hash
+
+
+def test_version_vectors():
+    state = GraphState()
+    state.bump('alice')
+    state.merge([], [], {'bob': 2})
+    assert state.dominates({'alice': 1, 'bob': 1})
+    assert not state.dominates({'carol': 1})
+    assert state.dominated_by({'alice': 1, 'bob': 2, 'carol': 1})
+    assert not state.dominated_by({'alice': 1})
+
+
+def test_join_deltas_latest_wins():
+    joined = join_deltas({'nodes': [node('a', 'red')], 'links': []}, {'nodes': [node('a', 'green')], 'links': [link('a', 'b')]})
+    assert joined['nodes'] == [node('a', 'green')]
+    assert joined['links'] == [link('a', 'b')]
+
+
+def test_store_evicts_least_recently_used():
+    store = GraphStore(size=2)
+    store.get('a')
+    store.get('b')
+    store.get('a')
+    store.get('c')
+    assert store.find('b') is None
+    assert store.find('a') is not None
+
+
+def test_epidemic_sends_to_fanout_peers():
+    peers = ['a', 'b', 'c', 'd', 'e']
+    assert pick_targets(peers, GOSSYP_MODE_FLOOD, 2) == peers
+    targets = pick_targets(peers, GOSSYP_MODE_EPIDEMIC, 2)
+    assert len(targets) == 2
+    assert set(targets) <= set(peers)
+    assert pick_targets(['a'], GOSSYP_MODE_EPIDEMIC, 2) == ['a']
+
+
+def test_anti_entropy_rounds_are_spent():
+    store = GraphStore()
+    epidemic = store.get('epidemic')
+    epidemic.message = {'members': ['did:a'], 'content': None, 'mode': GOSSYP_MODE_EPIDEMIC}
+    epidemic.rounds = 2
+    # flood message takes no rounds
+    store.get('flood').message = {'members': ['did:a'], 'content': None}
+    assert [msg_id for msg_id, _ in store.take_rounds()] == ['epidemic']
+    assert [msg_id for msg_id, _ in store.take_rounds()] == ['epidemic']
+    assert store.take_rounds() == []
+
+
+def test_reconcile_pulls_missing_and_pushes_newer():
+    store = GraphStore()
+    for msg_id, version in [('same', {'a': 1}), ('behind', {'a': 1}), ('ahead', {'a': 2}), ('diverged', {'a': 1})]:
+        state = store.get(msg_id)
+        state.message = {'members': [], 'content': None}
+        state.version = version
+    digest = {
+        'unknown': {'a': 1}, 'same': {'a': 1}, 'behind': {'a': 2}, 'ahead': {'a': 1}, 'diverged': {'b': 1}
+    }
+    pull, push = store.reconcile(digest)
+    assert pull == ['unknown', 'behind', 'diverged']
+    assert [msg_id for msg_id, _ in push] == ['ahead', 'diverged']
@@ -0,0 +1,143 @@
+import json
+import asyncio
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('sqlalchemy')
+pytest.importorskip('databases')
+
+from jobs import JobQueue, retry_delay, JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED
+
+
+class FakeDatabase:
+    """Records statements instead of running them on Postgres"""
+
+    def __init__(self):
+        self.executed = []
+        self.fetched = []
+
+    async def execute(self, query, values: dict = None):
+        self.executed.append(query.compile().params)
+
+    async def fetch_one(self, query, values: dict = None):
+        self.fetched.append((query, values))
+        return None
+
+
+def build_queue(handler, db: FakeDatabase, max_attempts: int = 3) -> JobQueue:
+    queue = JobQueue('postgresql://localhost/test', 'agent', {'kind': handler}, max_attempts=max_attempts, backoff=5)
+
+    async def database():
+        return db
+
+    queue._JobQueue__database = database
+    return queue
+
+
+def build_row(attempts: int, max_attempts: int = 3) -> dict:
+    now = datetime.utcnow()
+    return {
+        'id': 'job', 'kind': 'kind', 'payload': json.dumps({}), 'status': JOB_RUNNING, 'attempts': attempts,
+        'max_attempts': max_attempts, 'result': None, 'error': None, 'created_at': now, 'updated_at': now
+    }
+
+
+def test_retry_delay_doubles_until_attempts_exhausted():
+    assert retry_delay(1, 3, 5) == 5
+    assert retry_delay(2, 3, 5) == 10
+    assert retry_delay(3, 3, 5) is None
+    assert retry_delay(4, 3, 5) is None
+
+
+def test_claim_fails_expired_jobs_on_last_attempt_before_claiming():
+    db = FakeDatabase()
+    queue = build_queue(None, db)
+    assert asyncio.run(queue._JobQueue__claim()) is None
+    assert len(db.executed) == 1
+    assert db.executed[0]['status'] == JOB_FAILED
+    assert db.executed[0]['locked_until'] is None
+    query, values = db.fetched[0]
+    assert 'locked_until < :now AND attempts < max_attempts' in query
+    assert values['agent'] == 'agent'
+
+
+def process(handler, attempts: int) -> dict:
+    db = FakeDatabase()
+    queue = build_queue(handler, db)
+    asyncio.run(queue._JobQueue__process(build_row(attempts)))
+    return db.executed[-1]
+
+
+def test_unexpected_error_is_retried_until_max_attempts():
+
+    async def handler(payload: dict, checkpoint):
+        raise ConnectionError('try again')
+
+    values = process(handler, 1)
+    assert values['status'] == JOB_QUEUED
+    assert values['run_after'] > datetime.utcnow()
+    assert process(handler, 3)['status'] == JOB_FAILED
+
+
+def test_runtime_error_fails_job_at_once():
+
+    async def handler(payload: dict, checkpoint):
+        raise RuntimeError('Not found P2P')
+
+    values = process(handler, 1)
+    assert values['status'] == JOB_FAILED
+    assert values['error'] == 'Not found P2P'
+
+
+def test_done_job_keeps_result():
+
+    async def handler(payload: dict, checkpoint):
+        return {'success': True}
+
+    values = process(handler, 1)
+    assert values['status'] == JOB_DONE
+    assert json.loads(values['result']) == {'success': True}
+
+
+def test_job_is_not_retried_after_checkpoint():
+    db = FakeDatabase()
+
+    async def handler(payload: dict, checkpoint):
+        await checkpoint()
+        raise ConnectionError('offer was sent')
+
+    queue = build_queue(handler, db)
+    asyncio.run(queue._JobQueue__process(build_row(1)))
+    # attempts are exhausted, so expired lease fails job instead of running it again
+    assert db.executed[0]['attempts'] == 3
+    assert db.executed[-1]['status'] == JOB_FAILED
+
+
+def test_claim_error_keeps_running_jobs():
+    db = FakeDatabase()
+    finished = []
+
+    async def handler(payload: dict, checkpoint):
+        await asyncio.sleep(0.05)
+        finished.append(payload)
+        return {}
+
+    queue = build_queue(handler, db)
+    rows = [build_row(1)]
+
+    async def claim():
+        if rows:
+            return rows.pop()
+        raise ConnectionError('database is down')
+
+    queue._JobQueue__claim = claim
+    queue._JobQueue__poll_interval = 0.01
+
+    async def run():
+        worker = asyncio.ensure_future(queue.run())
+        await asyncio.sleep(0.1)
+        worker.cancel()
+
+    asyncio.run(run())
+    assert finished == [{}]
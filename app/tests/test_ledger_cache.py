@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('aiomemcached')
+pytest.importorskip('sirius_sdk')
+
+from sirius_sdk.agent.ledger import Schema
+
+from ledger_cache import LedgerCache
+
+
+SCHEMA = {'ver': '1.0', 'id': 'did:2:passport:1.0', 'name': 'passport', 'version': '1.0', 'attrNames': ['name']}
+
+
+class Memcached:
+
+    def __init__(self, down: bool = False):
+        self.down = down
+        self.values = {}
+
+    async def get(self, key: bytes):
+        if self.down:
+            raise ConnectionError('memcached is down')
+        return self.values.get(key), None
+
+    async def set(self, key: bytes, value: bytes):
+        if self.down:
+            raise ConnectionError('memcached is down')
+        self.values[key] = value
+
+
+def build_cache(memcached: Memcached, size: int = 10) -> LedgerCache:
+    cache = LedgerCache('localhost', 11211, prefix='test', size=size)
+    cache._LedgerCache__memcached = lambda: memcached
+    return cache
+
+
+def test_schema_is_loaded_from_ledger_once():
+    cache = build_cache(Memcached())
+    loads = []
+
+    async def loader():
+        loads.append(1)
+        return Schema(**SCHEMA)
+
+    async def run():
+        await cache.schema(SCHEMA['id'], loader)
+        return await cache.schema(SCHEMA['id'], loader)
+
+    assert asyncio.run(run()).name == 'passport'
+    assert len(loads) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_other_worker_reads_memcached_tier():
+    memcached = Memcached()
+    loads = []
+
+    async def loader():
+        loads.append(1)
+        return Schema(**SCHEMA)
+
+    async def run():
+        await build_cache(memcached).schema(SCHEMA['id'], loader)
+        return await build_cache(memcached).schema(SCHEMA['id'], loader)
+
+    assert asyncio.run(run()).id == SCHEMA['id']
+    assert len(loads) == 1
+
+
+def test_memcached_errors_fall_back_to_ledger():
+    cache = build_cache(Memcached(down=True))
+
+    async def loader():
+        return Schema(**SCHEMA)
+
+    schema = asyncio.run(cache.schema(SCHEMA['id'], loader))
+    assert schema.id == SCHEMA['id']
+
+
+def test_least_recently_used_are_evicted():
+    memcached = Memcached(down=True)
+    cache = build_cache(memcached, size=1)
+    loads = []
+
+    def loader(id_: str):
+
+        async def load():
+            loads.append(id_)
+            return Schema(**dict(SCHEMA, id=id_))
+
+        return load
+
+    async def run():
+        for id_ in ['a', 'b', 'a']:
+            await cache.schema(id_, loader(id_))
+
+    asyncio.run(run())
+    assert loads == ['a', 'b', 'a']
@@ -0,0 +1,73 @@
+import time
+import asyncio
+
+from mrg_aggregator import MrgAggregator, STATUS_COMPLETE, STATUS_TIMEOUT
+
+
+class DictStore:
+
+    def __init__(self):
+        self.items = {}
+
+    async def get(self, key: str):
+        return self.items.get(key)
+
+    async def set(self, key: str, value: str):
+        self.items[key] = value
+
+
+def response(responder: str, *neighbours: str) -> dict:
+    return {
+        'nodes': [{'id': responder, 'auras': [responder]}] + [{'id': did, 'auras': []} for did in neighbours],
+        'links': [{'id': f'{responder}-{did}', 'from': responder, 'to': did} for did in neighbours]
+    }
+
+
+def run_aggregation(responses: list, deadline: float = None, settle_time: float = 0.05):
+    emitted = []
+    store = DictStore()
+
+    async def emit(snapshot):
+        emitted.append(snapshot)
+
+    async def run():
+        aggregator = MrgAggregator(emit, store, window=0.01, settle_time=settle_time)
+        for graph, matrix in responses:
+            await aggregator.add('req', graph, matrix, deadline=deadline)
+        await asyncio.sleep(0.2)
+        # served from store by other process
+        other = MrgAggregator(emit, store)
+        return await other.find('req')
+
+    return emitted, asyncio.run(run())
+
+
+def test_responses_are_merged():
+    emitted, snapshot = run_aggregation([
+        (response('a', 'b'), [{'role': 1}]),
+        (response('b', 'a', 'c'), None),
+        (response('a', 'b'), None)
+    ])
+    assert snapshot['status'] == STATUS_COMPLETE
+    assert snapshot['responses'] == 3
+    assert sorted(node['id'] for node in snapshot['graph']['nodes']) == ['a', 'b', 'c']
+    assert sorted(link['id'] for link in snapshot['graph']['links']) == ['a-b', 'b-a', 'b-c']
+    assert snapshot['matrices'] == {'a': [{'role': 1}]}
+    # deltas are coalesced into single emit, final status is emitted once
+    assert [item['status'] for item in emitted][-1] == STATUS_COMPLETE
+    assert sum(len(item['graph']['nodes']) for item in emitted) == 3
+
+
+def test_request_times_out_at_deadline():
+    emitted, snapshot = run_aggregation([(response('a'), None)], deadline=time.time() + 0.02, settle_time=10)
+    assert snapshot['status'] == STATUS_TIMEOUT
+    assert emitted[-1]['status'] == STATUS_TIMEOUT
+
+
+def test_unknown_request():
+
+    async def run():
+        aggregator = MrgAggregator(None, DictStore())
+        return await aggregator.find('unknown')
+
+    assert asyncio.run(run()) is None
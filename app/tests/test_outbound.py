@@ -0,0 +1,137 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('sirius_sdk')
+
+from outbound import OutboundDispatcher
+
+
+def make_p2p(did: str):
+    return SimpleNamespace(their=SimpleNamespace(did=did))
+
+
+async def drain():
+    # workers of peers are done when nothing is left to run
+    for _ in range(100):
+        await asyncio.sleep(0.001)
+
+
+def test_messages_to_peer_keep_order_and_are_counted():
+    delivered = []
+
+    async def sender(message, p2p):
+        delivered.append((p2p.their.did, message['n']))
+
+    outbound = OutboundDispatcher(sender=sender)
+
+    async def run():
+        for n in range(3):
+            outbound.send({'n': n}, make_p2p('did:a'))
+        outbound.send({'n': 0}, make_p2p('did:b'))
+        await drain()
+
+    asyncio.run(run())
+    assert [n for did, n in delivered if did == 'did:a'] == [0, 1, 2]
+    stats = outbound.stats()
+    assert stats['did:a']['sent'] == 3
+    assert stats['did:b']['sent'] == 1
+    assert stats['did:a']['state'] == 'closed'
+
+
+def test_message_is_copied():
+    delivered = []
+
+    async def sender(message, p2p):
+        delivered.append(message['to'])
+
+    outbound = OutboundDispatcher(sender=sender)
+
+    async def run():
+        message = {'to': 'did:a'}
+        outbound.send(message, make_p2p('did:a'))
+        # caller modifies message for the next peer
+        message['to'] = 'did:b'
+        outbound.send(message, make_p2p('did:b'))
+        await drain()
+
+    asyncio.run(run())
+    assert sorted(delivered) == ['did:a', 'did:b']
+
+
+def test_slow_peer_does_not_hold_back_others():
+    delivered = []
+
+    async def sender(message, p2p):
+        if p2p.their.did == 'did:slow':
+            await asyncio.sleep(10)
+        delivered.append(p2p.their.did)
+
+    outbound = OutboundDispatcher(sender=sender, timeout=0.05, retries=0)
+
+    async def run():
+        outbound.send({}, make_p2p('did:slow'))
+        outbound.send({}, make_p2p('did:fast'))
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert delivered == ['did:fast']
+    assert outbound.stats()['did:slow']['failed'] == 1
+
+
+def test_circuit_opens_after_failures_in_row():
+
+    async def sender(message, p2p):
+        raise ConnectionError('peer is down')
+
+    outbound = OutboundDispatcher(sender=sender, retries=1, backoff=0, failure_threshold=2, recovery_time=60)
+    p2p = make_p2p('did:a')
+
+    async def run():
+        outbound.send({}, p2p)
+        outbound.send({}, p2p)
+        await drain()
+        return outbound.send({}, p2p)
+
+    assert asyncio.run(run()) is False
+    stats = outbound.stats()['did:a']
+    assert stats['state'] == 'open'
+    assert (stats['failed'], stats['retried'], stats['skipped']) == (2, 2, 1)
+
+
+def test_half_open_circuit_closes_after_delivery():
+    failing = [True]
+
+    async def sender(message, p2p):
+        if failing[0]:
+            raise ConnectionError('peer is down')
+
+    outbound = OutboundDispatcher(sender=sender, retries=0, failure_threshold=1, recovery_time=0)
+    p2p = make_p2p('did:a')
+
+    async def run():
+        outbound.send({}, p2p)
+        await drain()
+        failing[0] = False
+        # recovery time is over, probe is sent
+        outbound.send({}, p2p)
+        await drain()
+
+    asyncio.run(run())
+    assert outbound.stats()['did:a']['state'] == 'closed'
+
+
+def test_full_queue_drops_newest():
+
+    async def sender(message, p2p):
+        await asyncio.sleep(0.01)
+
+    outbound = OutboundDispatcher(sender=sender, queue_size=2)
+    p2p = make_p2p('did:a')
+
+    async def run():
+        return [outbound.send({}, p2p) for _ in range(3)]
+
+    assert asyncio.run(run()) == [True, True, False]
+    assert outbound.stats()['did:a']['dropped'] == 1
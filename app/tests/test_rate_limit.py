@@ -0,0 +1,50 @@
+import pytest
+
+from rate_limit import InboundLimiter
+
+
+def test_burst_then_drop():
+    limiter = InboundLimiter(rate=0.001, burst=3)
+    assert [limiter.allow('peer', 'trace') for _ in range(5)] == [True, True, True, False, False]
+    stats = limiter.stats()
+    assert stats['allowed'] == 3
+    assert stats['dropped'] == {'peer': {'trace': 2}}
+
+
+def test_buckets_are_per_peer_and_type():
+    limiter = InboundLimiter(rate=0.001, burst=1)
+    assert limiter.allow('a', 'trace')
+    assert limiter.allow('b', 'trace')
+    assert limiter.allow('a', 'gossyp')
+    assert not limiter.allow('a', 'trace')
+
+
+def test_type_limits_override_default():
+    limiter = InboundLimiter(rate=0.001, burst=1, limits={'gossyp': (0.001, 2)})
+    assert [limiter.allow('a', 'gossyp') for _ in range(3)] == [True, True, False]
+
+
+def test_apply_shared_limits():
+    limiter = InboundLimiter(rate=0.001, burst=1)
+    limiter.apply({None: (10, 5), 'trace': (1, 2)})
+    assert limiter.limits() == {
+        'default': {'rate': 10, 'burst': 5},
+        'types': {'trace': {'rate': 1, 'burst': 2}}
+    }
+    assert [limiter.allow('a', 'gossyp') for _ in range(6)] == [True] * 5 + [False]
+
+
+@pytest.mark.parametrize('rate, burst', [(0, 1), (-1, 1), (1, 0.5)])
+def test_invalid_limits(rate, burst):
+    with pytest.raises(ValueError):
+        InboundLimiter().configure('trace', rate, burst)
+
+
+def test_least_recently_used_buckets_are_evicted():
+    limiter = InboundLimiter(rate=0.001, burst=1, size=2)
+    limiter.allow('a', 'trace')
+    limiter.allow('b', 'trace')
+    limiter.allow('c', 'trace')
+    assert limiter.stats()['buckets'] == 2
+    # bucket of a was evicted, a starts with full bucket
+    assert limiter.allow('a', 'trace')
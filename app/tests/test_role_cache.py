@@ -0,0 +1,132 @@
+import asyncio
+
+from machine_readable_govs.compiler import compile_framework
+from machine_readable_govs.role_cache import RoleCache
+
+
+DOC = {
+    'name': 'Test framework',
+    'version': '1.0',
+    'schemas': [{'id': 'schema:1', 'name': 'passport'}],
+    'participants': [{'id': 'did:sov:Issuer', 'name': 'issuer'}],
+    'roles': ['citizen'],
+    'permissions': [
+        {'grant': ['citizen'], 'when': {'any': [{'schema': 'passport', 'issuer': 'issuer'}]}}
+    ]
+}
+
+
+class Versions:
+    """Redis counter of all processes"""
+
+    def __init__(self):
+        self.value = 0
+
+    async def load(self) -> int:
+        return self.value
+
+    async def bump(self) -> int:
+        self.value += 1
+        return self.value
+
+
+def build_cache(versions: Versions = None) -> (RoleCache, list):
+    calls = []
+
+    async def evaluator(frameworks, known):
+        calls.append(dict(known))
+        report = {
+            key: {'status': 'done', 'result': True, 'time': 0}
+            for framework in frameworks for key in framework.conditions.keys()
+        }
+        return {framework.hash: ['citizen'] for framework in frameworks}, report
+
+    return RoleCache(evaluator, versions=versions), calls
+
+
+def test_roles_are_cached_until_credential_is_stored():
+    framework = compile_framework(DOC)
+    cache, calls = build_cache()
+
+    async def run():
+        await cache.roles(framework)
+        await cache.roles(framework)
+        await cache.invalidate(schema_id='schema:other')
+        return await cache.roles(framework)
+
+    assert asyncio.run(run()) == ['citizen']
+    assert len(calls) == 2
+    # unrelated credential keeps results of conditions
+    assert len(calls[1]) == 1
+
+
+def test_credential_stored_by_other_process_invalidates_roles():
+    framework = compile_framework(DOC)
+    versions = Versions()
+    cache, calls = build_cache(versions)
+    other, _ = build_cache(versions)
+
+    async def run():
+        await cache.roles(framework)
+        await cache.roles(framework)
+        await other.invalidate(schema_id='schema:other')
+        await cache.roles(framework)
+
+    asyncio.run(run())
+    assert len(calls) == 2
+    # nothing is known about credential of other process
+    assert calls[1] == {}
+
+
+def test_own_change_keeps_incremental_invalidation():
+    framework = compile_framework(DOC)
+    versions = Versions()
+    cache, calls = build_cache(versions)
+
+    async def run():
+        await cache.roles(framework)
+        await cache.invalidate(schema_id='schema:other')
+        await cache.roles(framework)
+
+    asyncio.run(run())
+    assert len(calls) == 2
+    assert len(calls[1]) == 1
+
+
+def test_reset_invalidates_other_processes():
+    framework = compile_framework(DOC)
+    versions = Versions()
+    cache, calls = build_cache(versions)
+    other, _ = build_cache(versions)
+
+    async def run():
+        await cache.roles(framework)
+        await other.clear()
+        await cache.roles(framework)
+
+    asyncio.run(run())
+    assert len(calls) == 2
+
+
+def test_outdated_frameworks_are_evaluated_together():
+    first = compile_framework(DOC)
+    second = compile_framework(dict(DOC, name='Other framework'))
+    evaluated = []
+
+    async def evaluator(frameworks, known):
+        evaluated.append([framework.name for framework in frameworks])
+        report = {
+            key: {'status': 'done', 'result': True, 'time': 0}
+            for framework in frameworks for key in framework.conditions.keys()
+        }
+        return {framework.hash: ['citizen'] for framework in frameworks}, report
+
+    cache = RoleCache(evaluator)
+
+    async def run():
+        await cache.roles(first)
+        return await cache.roles_matrix([first, second])
+
+    assert asyncio.run(run()) == {first.hash: ['citizen'], second.hash: ['citizen']}
+    # first framework is served from cache
+    assert evaluated == [['Test framework'], ['Other framework']]
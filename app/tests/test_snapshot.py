@@ -0,0 +1,94 @@
+import asyncio
+
+from snapshot import CabinetSnapshot
+
+
+def test_sections_are_loaded_once():
+    calls = []
+
+    async def identities():
+        calls.append('identities')
+        return ['did:a']
+
+    async def schemas():
+        calls.append('schemas')
+        return []
+
+    snapshot = CabinetSnapshot(identities=identities, schemas=schemas)
+
+    async def run():
+        await snapshot.load()
+        return await snapshot.load('identities')
+
+    assert asyncio.run(run()) == {'identities': ['did:a']}
+    assert sorted(calls) == ['identities', 'schemas']
+
+
+def test_invalidate_reloads_touched_sections_only():
+    calls = []
+
+    async def identities():
+        calls.append('identities')
+        return ['did:a']
+
+    async def schemas():
+        calls.append('schemas')
+        return []
+
+    snapshot = CabinetSnapshot(identities=identities, schemas=schemas)
+
+    async def run():
+        await snapshot.load()
+        snapshot.invalidate('schemas')
+        await snapshot.load()
+
+    asyncio.run(run())
+    assert sorted(calls) == ['identities', 'schemas', 'schemas']
+    assert snapshot.versions == {'identities': 0, 'schemas': 1}
+
+
+def test_missing_sections_are_loaded_concurrently():
+    running = []
+
+    async def section():
+        running.append(1)
+        await asyncio.sleep(0.01)
+        # both loaders started before the first one finished
+        return len(running)
+
+    snapshot = CabinetSnapshot(identities=section, schemas=section)
+    assert asyncio.run(snapshot.load()) == {'identities': 2, 'schemas': 2}
+
+
+def test_section_invalidated_while_loading_is_not_stored():
+    values = ['old', 'new']
+
+    async def identities():
+        value = values.pop(0)
+        if value == 'old':
+            snapshot.invalidate('identities')
+        return value
+
+    snapshot = CabinetSnapshot(identities=identities)
+
+    async def run():
+        return await snapshot.load(), await snapshot.load()
+
+    assert asyncio.run(run()) == ({'identities': 'old'}, {'identities': 'new'})
+
+
+def test_expired_section_is_reloaded():
+    calls = []
+
+    async def identities():
+        calls.append(1)
+        return []
+
+    snapshot = CabinetSnapshot(ttl=-1, identities=identities)
+
+    async def run():
+        await snapshot.load()
+        await snapshot.load()
+
+    asyncio.run(run())
+    assert len(calls) == 2
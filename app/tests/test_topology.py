@@ -0,0 +1,98 @@
+import time
+import asyncio
+
+from topology import TopologyStore
+
+
+class FakeBackend:
+    """Shared store of other processes"""
+
+    def __init__(self):
+        self.links = {}
+        self.names = {}
+
+    async def exchange(self, links: dict, names: dict, expired_before: float):
+        for key, stamp in links.items():
+            self.links[key] = max(stamp, self.links.get(key, 0))
+        self.names.update(names)
+        self.links = {key: stamp for key, stamp in self.links.items() if stamp >= expired_before}
+        return dict(self.links), dict(self.names)
+
+
+class BrokenBackend:
+
+    async def exchange(self, links: dict, names: dict, expired_before: float):
+        raise ConnectionError('Redis is down')
+
+
+def test_shortest_path():
+    store = TopologyStore()
+    for a, b in [('a', 'b'), ('b', 'c'), ('c', 'd'), ('a', 'x'), ('x', 'd')]:
+        store.add_link(a, b)
+    assert store.path(['a'], 'd', max_hops=5) == ['a', 'x', 'd']
+    assert store.path(['d'], 'a', max_hops=5) == ['d', 'x', 'a']
+    assert store.path(['a'], 'd', max_hops=1) is None
+    assert store.path(['a'], 'unknown', max_hops=5) is None
+    assert store.stats()['hits'] == 2
+    assert store.stats()['misses'] == 2
+
+
+def test_stale_links_are_not_routed():
+    store = TopologyStore(ttl=60)
+    store.add_link('a', 'b', stamp=time.time() - 120)
+    store.add_link('b', 'c')
+    assert store.path(['a'], 'c', max_hops=5) is None
+    asyncio.run(store.sync())
+    assert store.stats()['links'] == 1
+
+
+def test_path_graph_uses_learned_names():
+    store = TopologyStore()
+    store.add_graph({
+        'nodes': [{'id': 'a', 'name': 'Alice'}, {'id': 'b', 'name': 'Bob'}],
+        'links': [{'from': 'a', 'to': 'b'}]
+    })
+    graph = store.path_graph(store.path(['a'], 'b', max_hops=1))
+    assert [node['name'] for node in graph['nodes']] == ['Alice', 'Bob']
+    assert graph['links'][0]['from'] == 'a' and graph['links'][0]['to'] == 'b'
+
+
+def test_processes_learn_links_of_each_other():
+    backend = FakeBackend()
+    worker, consumer = TopologyStore(backend=backend), TopologyStore(backend=backend)
+    worker.add_graph({'nodes': [{'id': 'a', 'name': 'Alice'}], 'links': [{'from': 'a', 'to': 'b'}]})
+    consumer.add_link('b', 'c')
+
+    async def run():
+        await worker.sync()
+        await consumer.sync()
+        await worker.sync()
+
+    asyncio.run(run())
+    assert worker.path(['a'], 'c', max_hops=5) == ['a', 'b', 'c']
+    assert consumer.path(['c'], 'a', max_hops=5) == ['c', 'b', 'a']
+    assert consumer.path_graph(['a'])['nodes'][0]['name'] == 'Alice'
+
+
+def test_links_are_pushed_again_after_backend_error():
+    store = TopologyStore(backend=BrokenBackend())
+    store.add_link('a', 'b')
+    asyncio.run(store.sync())
+    backend = FakeBackend()
+    store._TopologyStore__backend = backend
+    asyncio.run(store.sync())
+    assert list(backend.links.keys()) == [('a', 'b')]
+
+
+def test_sync_runs_in_background():
+
+    async def run():
+        backend = FakeBackend()
+        store = TopologyStore(backend=backend, sync_interval=60)
+        store.add_link('a', 'b')
+        # lookup doesn't wait for sync
+        assert backend.links == {}
+        await asyncio.sleep(0)
+        return backend
+
+    assert list(asyncio.run(run()).links.keys()) == [('a', 'b')]
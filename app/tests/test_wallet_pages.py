@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from wallet_pages import WalletPages, parse_cursor
+
+
+class FakeWallet:
+
+    def __init__(self, count: int):
+        self.records = [{'id': str(n)} for n in range(count)]
+        self.calls = []
+
+    async def search(self, type_: str, query: dict, limit: int):
+        self.calls.append(limit)
+        return self.records[:limit], len(self.records)
+
+
+def load_all(pages: WalletPages, limit: int) -> list:
+
+    async def run():
+        result = []
+        page, cursor = await pages.page('type', {}, limit)
+        result.extend(page)
+        while cursor:
+            page, cursor = await pages.page('type', {}, limit, cursor)
+            result.extend(page)
+        return result
+
+    return asyncio.run(run())
+
+
+def test_single_page():
+    wallet = FakeWallet(3)
+    pages = WalletPages(wallet.search)
+    assert asyncio.run(pages.page('type', {}, 10)) == (wallet.records, None)
+    assert wallet.calls == [10]
+
+
+def test_rest_is_fetched_once():
+    wallet = FakeWallet(95)
+    pages = WalletPages(wallet.search)
+    assert load_all(pages, 10) == wallet.records
+    # first page, then all records once, not O(n^2) grown limits
+    assert wallet.calls == [10, 95]
+
+
+def test_pages_do_not_shift_on_insert():
+    wallet = FakeWallet(30)
+    pages = WalletPages(wallet.search)
+
+    async def run():
+        first, cursor = await pages.page('type', {}, 10)
+        second, cursor = await pages.page('type', {}, 10, cursor)
+        wallet.records.insert(0, {'id': 'new'})
+        third, cursor = await pages.page('type', {}, 10, cursor)
+        return first + second + third, cursor
+
+    records, cursor = asyncio.run(run())
+    assert [r['id'] for r in records] == [str(n) for n in range(30)]
+    assert cursor is None
+
+
+def test_unknown_cursor_runs_search_again():
+    wallet = FakeWallet(30)
+    pages = WalletPages(wallet.search)
+    page, cursor = asyncio.run(pages.page('type', {}, 10))
+    # cursor issued by other process
+    other = WalletPages(wallet.search)
+    page, cursor = asyncio.run(other.page('type', {}, 10, cursor))
+    assert page == wallet.records[10:20]
+    assert cursor is not None
+
+
+def test_expired_cursor_runs_search_again():
+    wallet = FakeWallet(30)
+    pages = WalletPages(wallet.search, ttl=-1)
+    assert load_all(pages, 10) == wallet.records
+    assert wallet.calls == [10, 1, 30, 1, 30]
+
+
+@pytest.mark.parametrize('cursor', ['', 'abc', 'abc:x', ':10', 'abc:-1'])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        parse_cursor(cursor)
+
+
+def test_cursor_of_other_collection_is_rejected():
+    wallet = FakeWallet(30)
+    pages = WalletPages(wallet.search)
+
+    async def run():
+        page, cursor = await pages.page('connections', {}, 10)
+        await pages.page('credentials', {}, 10, cursor)
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())
+    # other process doesn't know the search, cursor still carries it
+    page, cursor = asyncio.run(pages.page('connections', {}, 10))
+    with pytest.raises(ValueError):
+        asyncio.run(WalletPages(wallet.search).page('connections', {'their_did': 'x'}, 10, cursor))
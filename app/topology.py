@@ -0,0 +1,181 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Optional, List, Dict, Tuple
+
+
+class TopologyStore:
+    """Known P2P links between DIDs with time they were seen last
+
+    Links are learned from trace responses, gossyp and MRG graphs. If backend is
+    set (Redis, see shared.RedisTopology) store is synced with it in background
+    every sync_interval seconds: links learned since last sync are pushed, links
+    of other processes (uvicorn workers, standalone consumers, other containers)
+    are merged (latest stamp wins). Links older than ttl are not used for routing
+    and are dropped on sync.
+    """
+
+    def __init__(self, backend=None, ttl: float = 600, sync_interval: float = 10):
+        """
+        :param backend: shared links store with coroutine exchange(links, names, expired_before) -> (links, names),
+                        store is kept in memory only if None
+        :param ttl: link freshness, seconds
+        :param sync_interval: min delay between syncs, seconds
+        """
+        self.__backend = backend
+        self.__ttl = ttl
+        self.__sync_interval = sync_interval
+        # store is shared by uvicorn loop and foreground thread
+        self.__lock = threading.Lock()
+        # DID -> {neighbour DID -> stamp}, links are bidirectional
+        self.__adjacency: Dict[str, Dict[str, float]] = {}
+        self.__names = {}
+        # learned since last sync: (DID, DID) ordered -> stamp, DID -> name
+        self.__new_links: Dict[Tuple[str, str], float] = {}
+        self.__new_names = {}
+        self.__synced_at = None
+        self.hits = 0
+        self.misses = 0
+
+    def add_link(self, a: str, b: str, stamp: float = None):
+        if not a or not b or a == b:
+            return
+        stamp = stamp or time.time()
+        with self.__lock:
+            self.__put(a, b, stamp)
+        self.__schedule_sync()
+
+    def add_graph(self, graph: Optional[dict]):
+        """Learn nodes and links of graph with DIDs as node IDs"""
+        if not graph:
+            return
+        stamp = time.time()
+        with self.__lock:
+            for node in graph.get('nodes') or []:
+                did, name = node.get('id'), node.get('name')
+                if did and name and self.__names.get(did) != name:
+                    self.__names[did] = name
+                    self.__new_names[did] = name
+            for link in graph.get('links') or []:
+                a, b = link.get('from'), link.get('to')
+                if a and b and a != b:
+                    self.__put(a, b, stamp)
+        self.__schedule_sync()
+
+    def path(self, sources: List[str], target: str, max_hops: int) -> Optional[List[str]]:
+        """Shortest path over fresh links from any of sources to target (BFS)
+
+        :return: DIDs from source to target, None if path is not known
+        """
+        self.__schedule_sync()
+        deadline = time.time() - self.__ttl
+        with self.__lock:
+            prev = {did: None for did in sources if did in self.__adjacency}
+            queue = deque((did, 0) for did in prev.keys())
+            found = target in prev
+            while queue and not found:
+                did, hops = queue.popleft()
+                if hops >= max_hops:
+                    continue
+                for neighbour, stamp in self.__adjacency.get(did, {}).items():
+                    if stamp < deadline or neighbour in prev:
+                        continue
+                    prev[neighbour] = did
+                    if neighbour == target:
+                        found = True
+                        break
+                    queue.append((neighbour, hops + 1))
+            if not found:
+                self.misses += 1
+                return None
+            self.hits += 1
+        path = [target]
+        while prev[path[-1]] is not None:
+            path.append(prev[path[-1]])
+        return list(reversed(path))
+
+    def path_graph(self, path: List[str]) -> dict:
+        """Graph of path nodes and links in format of update_graph"""
+        with self.__lock:
+            nodes = [
+                {'id': did, 'loaded': True, 'name': self.__names.get(did, did), 'auras': []} for did in path
+            ]
+        links = [
+            {'id': a + '>' + b, 'from': a, 'to': b, 'label': 'P2P'} for a, b in zip(path, path[1:])
+        ]
+        return {'nodes': nodes, 'links': links}
+
+    def stats(self) -> dict:
+        deadline = time.time() - self.__ttl
+        with self.__lock:
+            links = [stamp for neighbours in self.__adjacency.values() for stamp in neighbours.values()]
+            return {
+                'nodes': len(self.__adjacency),
+                'links': len(links) // 2,
+                'fresh_links': len([stamp for stamp in links if stamp >= deadline]) // 2,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    async def sync(self):
+        """Push links learned since last sync to backend, merge links of other processes, drop expired ones"""
+        deadline = time.time() - self.__ttl
+        with self.__lock:
+            self.__synced_at = time.monotonic()
+            new_links, self.__new_links = self.__new_links, {}
+            new_names, self.__new_names = self.__new_names, {}
+        stored_links, stored_names = {}, {}
+        if self.__backend is not None:
+            try:
+                stored_links, stored_names = await self.__backend.exchange(new_links, new_names, deadline)
+            except Exception:
+                logging.exception('Error while sync topology')
+                with self.__lock:
+                    # push them with next sync
+                    for key, stamp in new_links.items():
+                        self.__new_links[key] = max(stamp, self.__new_links.get(key, 0))
+                    for did, name in new_names.items():
+                        self.__new_names.setdefault(did, name)
+        with self.__lock:
+            for (a, b), stamp in stored_links.items():
+                for x, y in [(a, b), (b, a)]:
+                    neighbours = self.__adjacency.setdefault(x, {})
+                    if neighbours.get(y, 0) < stamp:
+                        neighbours[y] = stamp
+            for did, name in stored_names.items():
+                self.__names.setdefault(did, name)
+            for a in list(self.__adjacency.keys()):
+                neighbours = self.__adjacency[a]
+                for b in [b for b, stamp in neighbours.items() if stamp < deadline]:
+                    del neighbours[b]
+                if not neighbours:
+                    del self.__adjacency[a]
+                    self.__names.pop(a, None)
+
+    def __schedule_sync(self):
+        """Run sync() in background of current event loop if sync_interval passed, lookups never wait for it"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        now = time.monotonic()
+        with self.__lock:
+            if self.__synced_at is not None and now - self.__synced_at < self.__sync_interval:
+                return
+            self.__synced_at = now
+        loop.create_task(self.sync()).add_done_callback(log_sync_error)
+
+    def __put(self, a: str, b: str, stamp: float):
+        for x, y in [(a, b), (b, a)]:
+            neighbours = self.__adjacency.setdefault(x, {})
+            if neighbours.get(y, 0) < stamp:
+                neighbours[y] = stamp
+        key = (a, b) if a < b else (b, a)
+        self.__new_links[key] = max(stamp, self.__new_links.get(key, 0))
+
+
+def log_sync_error(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logging.error(f'Error while sync topology: {task.exception()!r}')
@@ -0,0 +1,110 @@
+import json
+import time
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Awaitable, Optional, List, Tuple
+
+
+class WalletSearch:
+    """Records of single wallet search, fetched beyond the first page on demand"""
+
+    def __init__(self, type_: str, query: dict, total: Optional[int]):
+        self.type_ = type_
+        self.query = query
+        self.total = total
+        self.records = None
+        self.stamp = time.monotonic()
+
+
+def get_search_key(type_: str, query: dict) -> str:
+    """Short digest of search, cursor is valid for the same search only"""
+    return hashlib.sha256(json.dumps([type_, query], sort_keys=True).encode()).hexdigest()[:16]
+
+
+def build_cursor(search_id: str, offset: int) -> str:
+    return f'{search_id}:{offset}'
+
+
+def parse_cursor(cursor: str) -> Tuple[str, int]:
+    """
+    :raises ValueError: if cursor is malformed
+    """
+    search_id, offset = cursor.rsplit(':', 1)
+    offset = int(offset)
+    if not search_id or offset < 0:
+        raise ValueError(f'Invalid cursor: {cursor}')
+    return search_id, offset
+
+
+class WalletPages:
+    """Cursor pagination over wallet search
+
+    NonSecrets.wallet_search has no offset or fetch handle: first page is requested
+    with page limit, the rest of records is fetched by single search when next page
+    is requested and kept under cursor token for ttl seconds. Next pages are served
+    from memory and don't shift when records are added meanwhile. Cursor of other
+    process (uvicorn worker) or expired cursor re-runs search from its offset.
+    Search ID carries digest of type and query, so cursor of other collection is rejected.
+    """
+
+    def __init__(self, search: Callable[[str, dict, int], Awaitable[Tuple[list, Optional[int]]]], ttl: float = 300, size: int = 100):
+        """
+        :param search: coroutine function (type, query, limit) -> (records, total count)
+        :param ttl: how long search records are kept for next pages, seconds
+        :param size: searches kept, least recently used are evicted above
+        """
+        self.__search = search
+        self.__ttl = ttl
+        self.__size = size
+        # searches are shared by uvicorn loop and foreground thread
+        self.__lock = threading.Lock()
+        self.__searches = OrderedDict()
+
+    async def page(self, type_: str, query: dict, limit: int, cursor: str = None) -> Tuple[List[dict], Optional[str]]:
+        """Page of records and cursor of the next one, None if page is last
+
+        :raises ValueError: if cursor is malformed or was issued for other search
+        """
+        search_key = get_search_key(type_, query)
+        if cursor is None:
+            records, total = await self.__search(type_, query, limit)
+            records = (records or [])[:limit]
+            if total is None or int(total) <= len(records):
+                return records, None
+            search_id = f'{uuid.uuid4().hex}-{search_key}'
+            self.__put(search_id, WalletSearch(type_, query, int(total)))
+            return records, build_cursor(search_id, len(records))
+        search_id, offset = parse_cursor(cursor)
+        if search_id.rpartition('-')[2] != search_key:
+            raise ValueError(f'Cursor of other search: {cursor}')
+        records = await self.__records(search_id, type_, query)
+        page = records[offset:offset + limit]
+        next_offset = offset + len(page)
+        return page, build_cursor(search_id, next_offset) if page and next_offset < len(records) else None
+
+    async def __records(self, search_id: str, type_: str, query: dict) -> List[dict]:
+        with self.__lock:
+            search = self.__searches.get(search_id)
+            if search is not None and time.monotonic() - search.stamp > self.__ttl:
+                del self.__searches[search_id]
+                search = None
+            if search is not None and search.records is not None:
+                self.__searches.move_to_end(search_id)
+                return search.records
+        total = search.total if search is not None else None
+        if total is None:
+            _, total = await self.__search(type_, query, 1)
+        records, _ = await self.__search(type_, query, max(int(total or 0), 1))
+        search = WalletSearch(type_, query, total)
+        search.records = records or []
+        self.__put(search_id, search)
+        return search.records
+
+    def __put(self, search_id: str, search: WalletSearch):
+        with self.__lock:
+            self.__searches[search_id] = search
+            self.__searches.move_to_end(search_id)
+            while len(self.__searches) > self.__size:
+                self.__searches.popitem(last=False)